@@ -31,7 +31,13 @@ try:
 
     # 初始化日志系统
     setup_logging(
-        log_level=getattr(settings, "LOG_LEVEL", "INFO"), force_no_color=force_no_color
+        log_level=getattr(settings, "LOG_LEVEL", "INFO"),
+        force_no_color=force_no_color,
+        enqueue=getattr(settings, "LOG_ENQUEUE", True),
+        content_limit=getattr(settings, "LOG_CONTENT_LIMIT", 200),
+        sample_every=getattr(settings, "LOG_SAMPLE_EVERY", 100),
+        queue_size=getattr(settings, "LOG_QUEUE_SIZE", 10000),
+        overflow=getattr(settings, "LOG_QUEUE_OVERFLOW", "drop"),
     )
 
     # 验证配置
@@ -50,12 +56,55 @@ async def lifespan(app: FastAPI):
     # 启动时执行
     logger.info("🚀 应用启动中...")
     await init_data()
+
+    # 预热测试用例生成运行时；进程模式下由工作进程各自预热
+    from backend.services.testcase_service import testcase_runtime
+    from backend.services.testcase_workers import testcase_workers
+
+    if testcase_workers is not None:
+        await testcase_workers.start()
+    else:
+        await testcase_runtime.runtime_pool.start()
+
+    # 清理过期的对话快照
+    from backend.services.conversation_store import conversation_store
+
+    await conversation_store.purge_expired()
+
+    # 定期把内存中的 token 用量和用户配额计数写入数据库
+    from backend.services.quota_service import quota_manager
+    from backend.services.usage_service import usage_recorder
+
+    usage_recorder.start()
+    quota_manager.start()
+
+    # 启动事件循环延迟监控
+    from backend.core.loop_monitor import loop_monitor
+
+    loop_monitor.start()
+
+    # 记录事件循环，收到退出信号时在其中排空流式响应
+    from backend.core.shutdown import stream_drainer
+
+    stream_drainer.start()
     logger.success("✅ 应用启动完成")
 
     yield
 
-    # 关闭时执行
+    # 关闭时执行：先等待流式响应排空并保存被中断对话的进度，再清理运行时和数据库连接
     logger.info("🛑 应用正在关闭...")
+    await stream_drainer.shutdown()
+    await loop_monitor.stop()
+    if testcase_workers is not None:
+        await testcase_workers.stop()
+    await testcase_runtime.cleanup_all()
+    await testcase_runtime.runtime_pool.close()
+    await usage_recorder.stop()
+    await quota_manager.stop()
+
+    from backend.core.database import close_db
+
+    await close_db()
     logger.success("✅ 应用关闭完成")
 
 
@@ -0,0 +1,123 @@
+"""
+管理员诊断接口
+在运行中的服务上按需采集 CPU 剖析、内存快照和按对话的数据结构占用，
+仅超级用户可访问
+"""
+
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from loguru import logger
+
+from backend.core.deps import get_current_superuser
+from backend.core.profiler import ProfileBusyError, profiler, render_folded
+
+router = APIRouter(
+    prefix="/api/admin/profile",
+    tags=["admin"],
+    dependencies=[Depends(get_current_superuser)],
+)
+
+
+def _folded_response(stacks, kind: str) -> PlainTextResponse:
+    """以附件形式返回折叠栈文本，可直接用 flamegraph.pl 或 speedscope 打开"""
+    filename = f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    return PlainTextResponse(
+        render_folded(stacks),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _conversation_structures() -> dict:
+    from backend.services.autogen_service import autogen_service
+    from backend.services.testcase_service import testcase_runtime
+
+    return {
+        "testcase": testcase_runtime.get_memory_usage(),
+        "chat": autogen_service.get_memory_usage(),
+    }
+
+
+@router.get("/cpu")
+async def profile_cpu(
+    duration: float = Query(default=10.0, gt=0, le=60, description="采样时长（秒）"),
+    interval: float = Query(
+        default=0.005, ge=0.001, le=1, description="采样间隔（秒）"
+    ),
+    all_threads: bool = Query(default=False, description="是否采集所有线程"),
+    output_format: str = Query(
+        default="folded", alias="format", pattern="^(folded|json)$"
+    ),
+):
+    """
+    采样式 CPU 剖析接口
+
+    采样期间服务正常处理请求，默认返回折叠栈格式的文件
+
+    Args:
+        duration: 采样时长
+        interval: 采样间隔
+        all_threads: 是否采集所有线程，默认只采集事件循环线程
+        format: folded 返回折叠栈文件，json 返回采样统计
+    """
+    logger.info(f"🔬 [API-性能剖析] 收到 CPU 剖析请求 | 时长: {duration}s")
+    try:
+        result = await profiler.profile(duration, interval, all_threads)
+    except ProfileBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if output_format == "folded":
+        return _folded_response(result["stacks"], "cpu")
+    return {
+        "samples": result["samples"],
+        "stacks": dict(result["stacks"].most_common(200)),
+    }
+
+
+@router.get("/memory")
+async def profile_memory(
+    duration: float = Query(
+        default=0.0, ge=0, le=60, description="开启追踪后等待的时间（秒）"
+    ),
+    top: int = Query(default=50, ge=1, le=500, description="返回的分配位置数量"),
+    output_format: str = Query(
+        default="json", alias="format", pattern="^(folded|json)$"
+    ),
+):
+    """
+    tracemalloc 内存快照接口
+
+    json 格式同时返回按对话统计的数据结构占用；folded 格式返回按字节计数的折叠栈文件
+
+    Args:
+        duration: 开启追踪后等待的时间
+        top: 返回占用最多的分配位置数量
+        format: folded 返回折叠栈文件，json 返回汇总结果
+    """
+    logger.info(f"🔬 [API-性能剖析] 收到内存快照请求 | 等待: {duration}s")
+    try:
+        result = await profiler.memory_snapshot(duration=duration, top=top)
+    except ProfileBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if output_format == "folded":
+        return _folded_response(result["stacks"], "memory")
+    return {
+        "traced_bytes": result["traced_bytes"],
+        "tracing_started_here": result["tracing_started_here"],
+        "top": result["top"],
+        "structures": _conversation_structures(),
+    }
+
+
+@router.get("/structures")
+async def get_conversation_structures():
+    """
+    按对话统计数据结构占用接口
+
+    Returns:
+        dict: 测试用例生成和聊天服务中每个对话各数据结构的估算字节数
+    """
+    logger.info("🔬 [API-性能剖析] 收到对话数据结构统计请求")
+    return _conversation_structures()
@@ -2,24 +2,38 @@ import json
 import uuid
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from loguru import logger
 from sse_starlette.sse import EventSourceResponse
 
+from backend.core.deps import get_current_active_user
+from backend.core.logger import hot_log
+from backend.core.loop_monitor import shed_when_overloaded
+from backend.core.metrics import track_stream
+from backend.core.shutdown import reject_when_draining, stream_drainer
+from backend.core.tracing import tracer
 from backend.models.chat import ChatRequest, ChatResponse, StreamChunk
+from backend.models.user import User
 from backend.services.autogen_service import autogen_service
+from backend.services.quota_service import quota_manager
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
 
-@router.post("/stream")
-async def chat_stream(request: ChatRequest):
+@router.post(
+    "/stream",
+    dependencies=[Depends(reject_when_draining), Depends(shed_when_overloaded)],
+)
+async def chat_stream(
+    request: ChatRequest, current_user: User = Depends(get_current_active_user)
+):
     """流式聊天接口"""
     conversation_id = request.conversation_id or str(uuid.uuid4())
     logger.info(
         f"收到流式聊天请求 | 对话ID: {conversation_id} | 消息: {request.message[:50]}..."
     )
+    await quota_manager.admit(current_user.id, "/api/chat/stream")
 
     try:
 
@@ -32,10 +46,16 @@ async def chat_stream(request: ChatRequest):
                     message=request.message,
                     conversation_id=conversation_id,
                     system_message=request.system_message or "你是一个有用的AI助手",
+                    use_cache=request.use_cache,
+                    user_id=current_user.id,
                 ):
                     chunk_count += 1
-                    logger.debug(
-                        f"生成第 {chunk_count} 个数据块 | 内容长度: {len(chunk)}"
+                    hot_log(
+                        "DEBUG",
+                        "api.chat.stream.chunk",
+                        "生成第 {} 个数据块 | 内容长度: {}",
+                        chunk_count,
+                        len(chunk),
                     )
 
                     # 发送内容块
@@ -67,7 +87,14 @@ async def chat_stream(request: ChatRequest):
                 yield f"data: {error_chunk.model_dump_json()}\n\n"
 
         return StreamingResponse(
-            generate(),
+            track_stream(
+                "chat_stream",
+                stream_drainer.guard(
+                    "chat_stream",
+                    conversation_id,
+                    tracer.trace_stream("sse.chat_stream", conversation_id, generate()),
+                ),
+            ),
             media_type="text/plain",
             headers={
                 "Cache-Control": "no-cache",
@@ -81,19 +108,28 @@ async def chat_stream(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+@router.post(
+    "/",
+    response_model=ChatResponse,
+    dependencies=[Depends(reject_when_draining), Depends(shed_when_overloaded)],
+)
+async def chat(
+    request: ChatRequest, current_user: User = Depends(get_current_active_user)
+):
     """普通聊天接口"""
     conversation_id = request.conversation_id or str(uuid.uuid4())
     logger.info(
         f"收到普通聊天请求 | 对话ID: {conversation_id} | 消息: {request.message[:50]}..."
     )
+    await quota_manager.admit(current_user.id, "/api/chat/")
 
     try:
         response_message, conv_id = await autogen_service.chat(
             message=request.message,
             conversation_id=conversation_id,
             system_message=request.system_message,
+            use_cache=request.use_cache,
+            user_id=current_user.id,
         )
 
         logger.success(
@@ -115,7 +151,7 @@ async def clear_conversation(conversation_id: str):
     logger.info(f"收到清除对话请求 | 对话ID: {conversation_id}")
 
     try:
-        autogen_service.clear_conversation(conversation_id)
+        await autogen_service.clear_conversation(conversation_id)
         logger.success(f"对话清除成功 | 对话ID: {conversation_id}")
         return {"message": "对话已清除", "conversation_id": conversation_id}
     except Exception as e:
@@ -9,23 +9,45 @@ import asyncio
 import base64
 import json
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 from pathlib import Path
 from typing import List, Optional
 
 import aiofiles
-from fastapi import APIRouter, File, Form, HTTPException, Query, UploadFile
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    UploadFile,
+)
 from loguru import logger
 from pydantic import BaseModel
 from sse_starlette.sse import EventSourceResponse
 
+from backend.core.deps import get_current_active_user, get_current_superuser
+from backend.core.llm_ratelimit import get_rate_limit_stats
+from backend.core.llm_resilience import get_resilience_stats
+from backend.core.logger import hot_log, truncate
+from backend.core.loop_monitor import loop_monitor, shed_when_overloaded
+from backend.core.metrics import track_stream
+from backend.core.shutdown import reject_when_draining, stream_drainer
+from backend.core.tracing import tracer
 from backend.models.chat import FileUpload, TestCaseRequest
+from backend.models.user import User
+from backend.services.agent_pool import get_assistant_pool_stats
+from backend.services.conversation_store import conversation_store
+from backend.services.quota_service import quota_manager
+from backend.services.stage_cache import stage_cache
 from backend.services.testcase_service import (
     FeedbackMessage,
     RequirementMessage,
     testcase_runtime,
     testcase_service,
 )
+from backend.services.usage_service import USAGE_GROUP_FIELDS, usage_recorder
 
 router = APIRouter(prefix="/api/testcase", tags=["testcase"])
 
@@ -57,9 +79,13 @@ class StreamingGenerateRequest(BaseModel):
     file_paths: Optional[List[str]] = None  # 新增：支持文件路径列表
     round_number: int = 1
     enable_streaming: bool = True
+    bypass_cache: bool = False  # 跳过阶段结果缓存，强制重新生成
 
 
-@router.post("/upload")
+@router.post(
+    "/upload",
+    dependencies=[Depends(reject_when_draining), Depends(shed_when_overloaded)],
+)
 async def upload_files(
     user_id: int = Query(default=1, description="用户ID"),
     files: List[UploadFile] = File(...),
@@ -150,8 +176,14 @@ async def upload_files(
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
 
-@router.post("/generate/streaming")
-async def generate_testcase_streaming(request: StreamingGenerateRequest):
+@router.post(
+    "/generate/streaming",
+    dependencies=[Depends(reject_when_draining), Depends(shed_when_overloaded)],
+)
+async def generate_testcase_streaming(
+    request: StreamingGenerateRequest,
+    current_user: User = Depends(get_current_active_user),
+):
     """
     流式生成测试用例接口 - POST版本
 
@@ -165,6 +197,7 @@ async def generate_testcase_streaming(request: StreamingGenerateRequest):
 
     Args:
         request: 流式生成请求对象
+        current_user: 当前登录用户，用量和配额计入该用户
 
     Returns:
         EventSourceResponse: SSE流式响应，实时返回智能体处理结果
@@ -179,6 +212,7 @@ async def generate_testcase_streaming(request: StreamingGenerateRequest):
     logger.info(f"   🔢 轮次: {request.round_number}")
     logger.info(f"   🌊 流式模式: {request.enable_streaming}")
     logger.info(f"   🌐 请求方法: POST /api/testcase/generate/streaming")
+    await quota_manager.admit(current_user.id, "/api/testcase/generate/streaming")
 
     # 创建需求消息对象
     logger.info(f"📦 [API-流式生成] 创建需求消息对象 | 对话ID: {conversation_id}")
@@ -188,6 +222,8 @@ async def generate_testcase_streaming(request: StreamingGenerateRequest):
         file_paths=request.file_paths or [],  # 新增：支持文件路径
         conversation_id=conversation_id,
         round_number=request.round_number,
+        bypass_cache=request.bypass_cache,
+        user_id=current_user.id,
     )
     logger.debug(f"   📋 需求消息: {requirement}")
     logger.success(
@@ -224,23 +260,26 @@ async def generate_testcase_streaming(request: StreamingGenerateRequest):
                 stream_type = stream_data.get("type", "unknown")
                 source = stream_data.get("source", "unknown")
 
-                logger.info(f"📤 [流式SSE生成器] 发送流式数据 #{stream_count}")
-                logger.info(f"   🏷️  类型: {stream_type}")
-                logger.info(f"   🤖 来源: {source}")
-                logger.debug(
-                    f"   📄 内容长度: {len(str(stream_data.get('content', '')))}"
-                )
-
                 # 根据类型添加特殊标识
                 if stream_type == "streaming_chunk":
-                    # 流式输出块
-                    content = stream_data.get("content", "")
-                    logger.info(f"   📡 流式块: {source} | 内容: {content}")
+                    # 流式输出块数量很大，采样记录
+                    hot_log(
+                        "INFO",
+                        "api.testcase.generate.chunk",
+                        "📡 [流式SSE生成器] 流式块 #{} | 来源: {} | 内容: {}",
+                        stream_count,
+                        source,
+                        truncate(stream_data.get("content", "")),
+                    )
                 elif stream_type == "text_message":
                     # 智能体完整消息
                     content = stream_data.get("content", "")
                     logger.info(
-                        f"   📝 完整消息: {source} | 内容长度: {len(content)} | 完整内容: {content}"
+                        "📤 [流式SSE生成器] 发送流式数据 #{} | 完整消息: {} | 内容长度: {} | 内容: {}",
+                        stream_count,
+                        source,
+                        len(content),
+                        truncate(content),
                     )
                 elif stream_type == "task_result":
                     # 任务结果
@@ -254,7 +293,6 @@ async def generate_testcase_streaming(request: StreamingGenerateRequest):
                 # 发送SSE数据 - EventSourceResponse会自动添加data:前缀
                 sse_data = json.dumps(stream_data, ensure_ascii=False)
                 yield f"{sse_data}"
-                logger.debug(f"   📡 SSE数据已发送: {len(sse_data)} 字符")
 
                 # 如果是任务结果，表示完成
                 if stream_type == "task_result":
@@ -289,7 +327,16 @@ async def generate_testcase_streaming(request: StreamingGenerateRequest):
             logger.debug(f"   📡 错误消息已发送: {error_data}")
 
     return EventSourceResponse(
-        generate(),
+        track_stream(
+            "testcase_generate",
+            stream_drainer.guard(
+                "testcase_generate",
+                conversation_id,
+                tracer.trace_stream(
+                    "sse.testcase_generate", conversation_id, generate()
+                ),
+            ),
+        ),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -306,8 +353,14 @@ async def generate_testcase_streaming(request: StreamingGenerateRequest):
 # 已删除 /generate 接口 - 前端未使用，已被 /generate/sse 接口替代
 
 
-@router.post("/feedback/streaming")
-async def submit_feedback_streaming(request: FeedbackRequest):
+@router.post(
+    "/feedback/streaming",
+    dependencies=[Depends(reject_when_draining), Depends(shed_when_overloaded)],
+)
+async def submit_feedback_streaming(
+    request: FeedbackRequest,
+    current_user: User = Depends(get_current_active_user),
+):
     """
     流式处理用户反馈接口 - POST版本
 
@@ -322,6 +375,7 @@ async def submit_feedback_streaming(request: FeedbackRequest):
 
     Args:
         request: 用户反馈请求对象，包含反馈内容和相关信息
+        current_user: 当前登录用户，用量和配额计入该用户
 
     Returns:
         EventSourceResponse: SSE流式响应，实时返回智能体处理结果
@@ -361,6 +415,8 @@ async def submit_feedback_streaming(request: FeedbackRequest):
             },
         )
 
+    await quota_manager.admit(current_user.id, "/api/testcase/feedback/streaming")
+
     # 创建反馈消息对象
     logger.info(
         f"📦 [API-流式反馈] 创建反馈消息对象 | 对话ID: {request.conversation_id}"
@@ -371,6 +427,7 @@ async def submit_feedback_streaming(request: FeedbackRequest):
         conversation_id=request.conversation_id,
         round_number=next_round,
         previous_testcases=request.previous_testcases,
+        user_id=current_user.id,
     )
     logger.debug(f"   📋 反馈消息: {feedback}")
 
@@ -403,23 +460,26 @@ async def submit_feedback_streaming(request: FeedbackRequest):
                 stream_type = stream_data.get("type", "unknown")
                 source = stream_data.get("source", "unknown")
 
-                logger.info(f"📤 [流式反馈生成器] 发送流式数据 #{stream_count}")
-                logger.info(f"   🏷️  类型: {stream_type}")
-                logger.info(f"   🤖 来源: {source}")
-                logger.debug(
-                    f"   📄 内容长度: {len(str(stream_data.get('content', '')))}"
-                )
-
                 # 根据类型添加特殊标识
                 if stream_type == "streaming_chunk":
-                    # 流式输出块
-                    content = stream_data.get("content", "")
-                    logger.info(f"   📡 流式块: {source} | 内容: {content}")
+                    # 流式输出块数量很大，采样记录
+                    hot_log(
+                        "INFO",
+                        "api.testcase.feedback.chunk",
+                        "📡 [流式反馈生成器] 流式块 #{} | 来源: {} | 内容: {}",
+                        stream_count,
+                        source,
+                        truncate(stream_data.get("content", "")),
+                    )
                 elif stream_type == "text_message":
                     # 智能体完整消息
                     content = stream_data.get("content", "")
                     logger.info(
-                        f"   📝 完整消息: {source} | 内容长度: {len(content)} | 完整内容: {content}"
+                        "📤 [流式反馈生成器] 发送流式数据 #{} | 完整消息: {} | 内容长度: {} | 内容: {}",
+                        stream_count,
+                        source,
+                        len(content),
+                        truncate(content),
                     )
                 elif stream_type == "task_result":
                     # 任务结果
@@ -433,7 +493,6 @@ async def submit_feedback_streaming(request: FeedbackRequest):
                 # 发送SSE数据 - EventSourceResponse会自动添加data:前缀
                 sse_data = json.dumps(stream_data, ensure_ascii=False)
                 yield f"{sse_data}"
-                logger.debug(f"   📡 SSE数据已发送: {len(sse_data)} 字符")
 
                 # 如果是任务结果，表示完成
                 if stream_type == "task_result":
@@ -468,7 +527,16 @@ async def submit_feedback_streaming(request: FeedbackRequest):
             logger.debug(f"   📡 错误消息已发送: {error_data}")
 
     return EventSourceResponse(
-        generate(),
+        track_stream(
+            "testcase_feedback",
+            stream_drainer.guard(
+                "testcase_feedback",
+                request.conversation_id,
+                tracer.trace_stream(
+                    "sse.testcase_feedback", request.conversation_id, generate()
+                ),
+            ),
+        ),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -488,11 +556,172 @@ async def submit_feedback_streaming(request: FeedbackRequest):
 # 已删除 /stats 接口 - 前端未使用
 
 
+@router.get("/cache/stats")
+async def get_stage_cache_stats():
+    """
+    获取阶段结果缓存统计接口
+
+    Returns:
+        dict: 命中、未命中、写入、淘汰次数等统计信息
+    """
+    logger.debug("📊 [API-缓存统计] 收到阶段结果缓存统计请求")
+    return stage_cache.get_stats()
+
+
+@router.get("/usage")
+async def get_token_usage(
+    group_by: str = Query("stage", description="分组字段"),
+    conversation_id: Optional[str] = Query(None, description="只统计指定对话"),
+    user_id: Optional[int] = Query(None, description="只统计指定用户"),
+    stage: Optional[str] = Query(None, description="只统计指定阶段"),
+    start_date: Optional[date] = Query(None, description="开始日期（含）"),
+    end_date: Optional[date] = Query(None, description="结束日期（含）"),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    获取 token 用量统计接口
+
+    按阶段、用户、对话、模型或日期汇总调用次数、token 数和耗时。
+    普通用户只能查询自己的用量，超级用户可以查询所有用户
+
+    Returns:
+        dict: 分组字段、汇总结果和记录器状态
+    """
+    logger.debug(f"📊 [API-用量统计] 收到用量统计请求 | 分组: {group_by}")
+    if group_by not in USAGE_GROUP_FIELDS:
+        raise HTTPException(
+            400, detail=f"group_by 只支持: {', '.join(USAGE_GROUP_FIELDS)}"
+        )
+    if not current_user.is_superuser:
+        user_id = current_user.id
+    if conversation_id:
+        conversation_id = testcase_runtime.resolve_conversation_id(conversation_id)
+    items = await usage_recorder.query(
+        group_by=group_by,
+        conversation_id=conversation_id,
+        user_id=user_id,
+        stage=stage,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    return {
+        "group_by": group_by,
+        "items": items,
+        "recorder": usage_recorder.get_stats(),
+    }
+
+
+@router.get("/quota/{user_id}")
+async def get_user_quota(
+    user_id: int, current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取用户配额接口
+
+    普通用户只能查询自己的配额，超级用户可以查询所有用户
+
+    Args:
+        user_id: 用户ID
+        current_user: 当前登录用户
+
+    Returns:
+        dict: 每日、每月的请求数和 token 配额、已用量、剩余量和重置时间
+    """
+    logger.debug(f"📊 [API-用户配额] 收到用户配额查询请求 | 用户ID: {user_id}")
+    if user_id != current_user.id and not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="权限不足")
+    return {
+        **await quota_manager.get_quota(user_id),
+        "manager": quota_manager.get_stats(),
+    }
+
+
+@router.get("/runtime/stats", dependencies=[Depends(get_current_superuser)])
+async def get_runtime_pool_stats():
+    """
+    获取运行时预热池统计接口（仅超级用户）
+
+    Returns:
+        dict: 预热池容量、可用数量、命中率、各角色智能体池的复用统计、事件循环延迟、停机排空状态、对话存储统计、工作进程状态、出站限流状态以及模型调用熔断和重试统计
+    """
+    logger.debug("📊 [API-运行时统计] 收到运行时预热池统计请求")
+    return {
+        "active_runtimes": len(testcase_runtime.runtimes),
+        "warm_pool": testcase_runtime.runtime_pool.get_stats(),
+        "assistant_pools": get_assistant_pool_stats(),
+        "event_loop": loop_monitor.get_stats(),
+        "shutdown": stream_drainer.get_stats(),
+        "conversation_store": {
+            **conversation_store.get_stats(),
+            "restored": testcase_runtime.restored,
+        },
+        "workers": (
+            await testcase_service.workers.get_stats()
+            if testcase_service.remote
+            else {"mode": "inprocess"}
+        ),
+        "rate_limit": get_rate_limit_stats(),
+        "resilience": get_resilience_stats(),
+    }
+
+
+@router.get("/trace/summary")
+async def get_trace_summary():
+    """
+    获取链路追踪汇总接口
+
+    Returns:
+        dict: 最近所有对话按阶段汇总的耗时（次数、总耗时、p50、p95 等）
+    """
+    logger.debug("📊 [API-链路追踪] 收到链路追踪汇总请求")
+    return tracer.get_summary()
+
+
+@router.get("/trace/{conversation_id}")
+async def get_conversation_trace(conversation_id: str):
+    """
+    获取单个对话的链路追踪接口
+
+    Args:
+        conversation_id: 对话唯一标识符
+
+    Returns:
+        dict: 该对话各阶段的耗时汇总和按时间排序的 span 列表
+    """
+    logger.debug(f"📊 [API-链路追踪] 收到对话链路追踪请求 | 对话ID: {conversation_id}")
+    conversation_id = testcase_runtime.resolve_conversation_id(conversation_id)
+    summary = tracer.get_summary(conversation_id)
+    summary["spans"] = tracer.get_spans(conversation_id)
+    return summary
+
+
+@router.delete("/cache", dependencies=[Depends(get_current_superuser)])
+async def clear_stage_cache():
+    """
+    清空阶段结果缓存接口（仅超级用户）
+
+    Returns:
+        dict: 清除结果
+    """
+    logger.info("🗑️ [API-清空缓存] 收到清空阶段结果缓存请求")
+
+    try:
+        deleted = await stage_cache.clear()
+        return {"success": True, "message": "阶段结果缓存已清空", "deleted": deleted}
+    except Exception as e:
+        logger.error(f"❌ [API-清空缓存] 清空阶段结果缓存失败 | 错误: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # 旧的GET接口已移除，现在使用POST流式接口
 
 
 @router.get("/history/{conversation_id}")
-async def get_conversation_history(conversation_id: str):
+async def get_conversation_history(
+    conversation_id: str,
+    entry_type: Optional[str] = Query(None, description="只返回指定类型的历史记录"),
+    round_number: Optional[int] = Query(None, description="只返回指定轮次的历史记录"),
+):
     """
     获取对话历史接口
 
@@ -500,6 +729,8 @@ async def get_conversation_history(conversation_id: str):
 
     Args:
         conversation_id: 对话唯一标识符
+        entry_type: 历史记录类型过滤（如 user_input、testcase_generation）
+        round_number: 轮次过滤
 
     Returns:
         dict: 包含历史记录和消息列表的响应数据
@@ -513,15 +744,17 @@ async def get_conversation_history(conversation_id: str):
         logger.info(
             f"📖 [API-历史接口] 步骤1: 获取历史记录 | 对话ID: {conversation_id}"
         )
-        history = await testcase_service.get_history(conversation_id)
+        history = await testcase_service.get_history(
+            conversation_id, entry_type=entry_type, round_number=round_number
+        )
         logger.info(f"   📊 历史记录数量: {len(history)}")
-        logger.debug(f"   📋 历史记录: {history}")
+        logger.debug("   📋 历史记录: {}", truncate(history))
 
         # 步骤2: 获取消息列表
         logger.info(
             f"📨 [API-历史接口] 步骤2: 获取消息列表 | 对话ID: {conversation_id}"
         )
-        messages = testcase_service.get_messages(conversation_id)
+        messages = await testcase_service.get_messages(conversation_id)
         logger.info(f"   📊 消息数量: {len(messages)}")
 
         # 统计消息类型
@@ -543,7 +776,7 @@ async def get_conversation_history(conversation_id: str):
             "total_history": len(history),
             "message_types": message_types,
         }
-        logger.debug(f"   📦 响应数据: {response_data}")
+        logger.debug("   📦 响应数据: {}", truncate(response_data))
 
         logger.success(
             f"✅ [API-历史接口] 对话历史获取成功 | 对话ID: {conversation_id}"
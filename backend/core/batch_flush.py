@@ -0,0 +1,94 @@
+"""
+内存计数批量写库
+用量统计和用户配额都先在内存中累计，由后台任务定期写入数据库。
+这里提供两者共用的定期写库任务和按行累加的写入方法
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Type
+
+from loguru import logger
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.models import Model
+
+
+async def upsert_increments(
+    model: Type[Model],
+    lookup: Mapping[str, Any],
+    increments: Mapping[str, Any],
+    assign: Optional[Mapping[str, Any]] = None,
+) -> None:
+    """
+    按 lookup 找到一行并累加计数，不存在时创建
+
+    多个进程同时写同一行时依赖唯一约束：创建失败说明其他进程刚创建了这一行，改为累加
+
+    Args:
+        model: 数据模型
+        lookup: 定位行的字段（需要有唯一约束）
+        increments: 要累加的字段和增量
+        assign: 直接写入的字段，更新已有行时跳过值为 None 的字段
+    """
+    assign = dict(assign or {})
+    updates = {field: F(field) + value for field, value in increments.items()}
+    updates.update(
+        {field: value for field, value in assign.items() if value is not None}
+    )
+    if await model.filter(**lookup).update(**updates):
+        return
+    try:
+        await model.create(**lookup, **increments, **assign)
+    except IntegrityError:
+        # 其他进程同时创建了这一行
+        await model.filter(**lookup).update(**updates)
+
+
+class PeriodicFlusher:
+    """在事件循环中定期调用写库函数，停止时再写一次剩余数据"""
+
+    def __init__(
+        self, name: str, flush: Callable[[], Awaitable[Any]], interval: float = 10.0
+    ):
+        """
+        初始化定期写库任务
+
+        Args:
+            name: 日志中显示的名称
+            flush: 写库函数
+            interval: 写库间隔（秒）
+        """
+        self.name = name
+        self.flush = flush
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """在当前事件循环中启动定期写库任务"""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"💾 [{self.name}] 定期写库已启动 | 间隔: {self.interval}s")
+
+    async def stop(self) -> None:
+        """停止定期写库并写入剩余数据"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ [{self.name}] 定期写库失败: {e}")
@@ -0,0 +1,152 @@
+"""
+进程内缓存工具
+提供带容量、内存和过期时间限制的 LRU 缓存
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class LRUTTLCache:
+    """
+    LRU + TTL 缓存
+
+    同时限制条目数和总大小（由调用方提供每个条目的大小），
+    超出限制时淘汰最久未使用的条目
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 3600,
+        name: str = "cache",
+    ):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大条目数
+            max_bytes: 所有条目的最大总大小（字节）
+            ttl: 条目有效期（秒）
+            name: 缓存名称，用于统计展示
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, record=False) is not None
+
+    def get(self, key: Hashable, record: bool = True) -> Optional[Any]:
+        """
+        获取缓存值
+
+        Args:
+            key: 缓存键
+            record: 是否计入命中统计
+
+        Returns:
+            Optional[Any]: 未命中或已过期时返回 None
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            if record:
+                self.misses += 1
+            return None
+
+        value, size, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            if record:
+                self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        if record:
+            self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, size: int = 1) -> bool:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            size: 条目大小（字节）
+
+        Returns:
+            bool: 条目大于缓存总容量时不缓存并返回 False
+        """
+        if size > self.max_bytes:
+            return False
+
+        if key in self._data:
+            self._remove(key)
+
+        self._data[key] = (value, size, time.monotonic() + self.ttl)
+        self._total_bytes += size
+
+        while self._data and (
+            len(self._data) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            oldest_key = next(iter(self._data))
+            self._remove(oldest_key)
+            self.evictions += 1
+        return True
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """删除并返回缓存值"""
+        if key not in self._data:
+            return None
+        value = self._data[key][0]
+        self._remove(key)
+        return value
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._data.clear()
+        self._total_bytes = 0
+
+    def purge_expired(self) -> int:
+        """清理所有过期条目，返回清理数量"""
+        now = time.monotonic()
+        expired = [key for key, entry in self._data.items() if entry[2] <= now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._data.pop(key)
+        self._total_bytes -= size
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._data),
+            "bytes": self._total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
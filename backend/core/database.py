@@ -7,6 +7,7 @@ from tortoise.contrib.fastapi import register_tortoise
 
 from backend.conf.config import settings
 from backend.conf.constants import backend_path
+from backend.core.metrics import instrument_tortoise
 
 # 数据库配置 - 使用constants.py中定义的路径
 data_dir = backend_path / "data"
@@ -41,6 +42,7 @@ async def init_db():
 
         # 初始化 Tortoise ORM
         await Tortoise.init(config=TORTOISE_ORM)
+        instrument_tortoise()
         logger.info("Tortoise ORM 初始化成功")
 
         # 生成数据库表
@@ -7,11 +7,16 @@ from typing import List
 from fastapi import FastAPI
 from fastapi.middleware import Middleware
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from loguru import logger
 
+from backend.api.admin import router as admin_router
 from backend.api.auth import router as auth_router
 from backend.api.chat import router as chat_router
 from backend.api.testcase import router as testcase_router
+from backend.core.metrics import MetricsMiddleware
+from backend.core.metrics import registry as metrics_registry
+from backend.core.shutdown import stream_drainer
 
 
 async def init_data():
@@ -41,7 +46,8 @@ def make_middlewares() -> List[Middleware]:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
-        )
+        ),
+        Middleware(MetricsMiddleware),
     ]
 
     logger.debug(f"已配置 {len(middlewares)} 个中间件")
@@ -73,6 +79,7 @@ def register_exceptions(app: FastAPI):
                 "detail": exc.detail,
                 "status_code": exc.status_code,
             },
+            headers=getattr(exc, "headers", None),
         )
 
     @app.exception_handler(SettingNotFound)
@@ -110,6 +117,65 @@ def register_exceptions(app: FastAPI):
     logger.debug("异常处理器注册完成")
 
 
+def register_metrics_collectors():
+    """注册从现有服务对象读取状态的指标"""
+    from backend.core.logger import log_config
+    from backend.services.agent_pool import get_assistant_pool_stats
+    from backend.services.autogen_service import autogen_service
+    from backend.services.testcase_service import testcase_runtime, testcase_service
+
+    def autogen_agents():
+        stats = autogen_service.get_agent_stats()
+        for state in ("total", "active", "expired"):
+            yield {"state": state}, stats[f"{state}_agents"]
+
+    def assistant_pools():
+        for stats in get_assistant_pool_stats():
+            yield {"role": stats["name"], "state": "idle"}, stats["idle"]
+            yield {"role": stats["name"], "state": "in_use"}, stats["in_use"]
+
+    metrics_registry.register_collector(
+        "autogen_agents", "聊天服务缓存的 Agent 数量", autogen_agents
+    )
+    metrics_registry.register_collector(
+        "testcase_runtimes_active",
+        "测试用例生成的活跃运行时数量",
+        lambda: [({}, len(testcase_runtime.runtimes))],
+    )
+    metrics_registry.register_collector(
+        "testcase_warm_pool_ready",
+        "预热池中可直接取用的运行时数量",
+        lambda: [({}, testcase_runtime.runtime_pool.ready_count)],
+    )
+    metrics_registry.register_collector(
+        "testcase_generations_inflight",
+        "正在执行的测试用例生成任务数量（去重后）",
+        lambda: [({}, testcase_service.generation_flight.get_stats()["inflight"])],
+    )
+    metrics_registry.register_collector(
+        "testcase_assistant_agents",
+        "各角色 AssistantAgent 池的智能体数量",
+        assistant_pools,
+    )
+    metrics_registry.register_collector(
+        "log_queue_depth",
+        "日志文件输出队列中等待写入的记录数",
+        lambda: [
+            ({"file": stats["path"]}, stats["queued"])
+            for stats in log_config.get_sink_stats()
+        ],
+    )
+    metrics_registry.register_collector(
+        "log_records_dropped_total",
+        "日志队列已满被丢弃的记录数",
+        lambda: [
+            ({"file": stats["path"]}, stats["dropped"])
+            for stats in log_config.get_sink_stats()
+        ],
+        type_name="counter",
+    )
+
+
 def register_routers(app: FastAPI, prefix: str = ""):
     """Register application routers"""
     logger.info("注册应用路由...")
@@ -126,6 +192,10 @@ def register_routers(app: FastAPI, prefix: str = ""):
     app.include_router(testcase_router)
     logger.debug("测试用例路由注册完成")
 
+    # 注册管理员诊断路由
+    app.include_router(admin_router)
+    logger.debug("管理员诊断路由注册完成")
+
     # 注册基础路由
     @app.get("/")
     async def root():
@@ -135,6 +205,18 @@ def register_routers(app: FastAPI, prefix: str = ""):
     @app.get("/health")
     async def health_check():
         logger.debug("健康检查被访问")
+        if stream_drainer.draining:
+            # 停机排空期间让负载均衡摘除该实例
+            return JSONResponse(status_code=503, content={"status": "draining"})
         return {"status": "healthy"}
 
+    # 注册指标接口
+    register_metrics_collectors()
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(
+            metrics_registry.render(), media_type="text/plain; version=0.0.4"
+        )
+
     logger.success(f"✅ 路由注册完成，前缀: {prefix}")
@@ -3,33 +3,58 @@ LLM模型客户端配置
 提供统一的OpenAI模型客户端实例，供整个应用使用
 """
 
-from autogen_core.models import ModelFamily
+from typing import Any, Dict, Optional
+
+from autogen_core.models import ChatCompletionClient, ModelFamily
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 from loguru import logger
 
 from backend.conf.config import settings
+from backend.core.llm_wrappers import StreamUsageChatCompletionClient
 
 
-def create_openai_model_client() -> OpenAIChatCompletionClient:
+def create_openai_model_client(
+    model: Optional[str] = None,
+    base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+    **create_args: Any,
+) -> ChatCompletionClient:
     """
     创建OpenAI模型客户端实例
 
+    Args:
+        model: 模型名称，默认使用 aimodel.model
+        base_url: 服务地址，默认使用 aimodel.base_url
+        api_key: API密钥，默认使用 aimodel.api_key
+        **create_args: 默认的调用参数，例如 max_tokens、temperature
+
     Returns:
-        OpenAIChatCompletionClient: 配置好的模型客户端
+        ChatCompletionClient: 配置好的模型客户端（按配置包装）
     """
+    model = model or settings.aimodel.model
+    base_url = base_url or settings.aimodel.base_url
+    api_key = api_key or settings.aimodel.api_key
     try:
         logger.info("🤖 [LLM客户端] 开始创建OpenAI模型客户端")
-        logger.info(f"   📋 模型: {settings.aimodel.model}")
-        logger.info(f"   🌐 基础URL: {settings.aimodel.base_url}")
+        logger.info(f"   📋 模型: {model}")
+        logger.info(f"   🌐 基础URL: {base_url}")
         logger.info(
-            f"   🔑 API密钥: {'*' * (len(settings.aimodel.api_key) - 8) + settings.aimodel.api_key[-8:] if settings.aimodel.api_key else 'None'}"
+            f"   🔑 API密钥: {'*' * (len(api_key) - 8) + api_key[-8:] if api_key else 'None'}"
         )
+        if create_args:
+            logger.info(f"   ⚙️ 调用参数: {create_args}")
+
+        # 启用调用容错时由容错层统一重试，关闭 SDK 自带的重试避免次数叠加
+        resilience_config = getattr(settings.aimodel, "resilience", None) or {}
+        sdk_options = {}
+        if resilience_config.get("enabled", True):
+            sdk_options["max_retries"] = 0
 
         # 创建模型客户端
         client = OpenAIChatCompletionClient(
-            model=settings.aimodel.model,
-            base_url=settings.aimodel.base_url,
-            api_key=settings.aimodel.api_key,
+            model=model,
+            base_url=base_url,
+            api_key=api_key,
             model_info={
                 "vision": False,
                 "function_calling": True,
@@ -38,10 +63,16 @@ def create_openai_model_client() -> OpenAIChatCompletionClient:
                 "structured_output": True,
                 "multiple_system_messages": True,
             },
+            **create_args,
+            **sdk_options,
         )
 
+        # 流式调用默认要求服务商在最后一个块返回用量，用于 token 用量统计
+        if getattr(settings.aimodel, "include_usage", True):
+            client = StreamUsageChatCompletionClient(client)
+
         logger.success("✅ [LLM客户端] OpenAI模型客户端创建成功")
-        return client
+        return wrap_model_client(client, model=model, base_url=base_url)
 
     except Exception as e:
         logger.error(f"❌ [LLM客户端] 创建OpenAI模型客户端失败: {e}")
@@ -50,6 +81,106 @@ def create_openai_model_client() -> OpenAIChatCompletionClient:
         raise
 
 
+def wrap_model_client(
+    client: ChatCompletionClient,
+    model: Optional[str] = None,
+    base_url: Optional[str] = None,
+) -> ChatCompletionClient:
+    """
+    按配置给模型客户端叠加包装
+
+    aimodel.rate_limit 配置了 rpm 或 tpm 时按端点额度排队发出调用，
+    例如 {rpm: 60, tpm: 100000, max_tokens: 1024, max_retries: 2}；
+    aimodel.resilience 控制重试、对冲和熔断（默认开启，enabled: false 关闭），
+    顶层参数为所有阶段的默认值，stages 下按阶段名覆盖，
+    例如 {max_retries: 2, failure_threshold: 5, stages: {testcase_generation: {hedge_percentile: 95}}}；
+    aimodel.cassette 配置了 mode 时使用录制回放客户端，
+    例如 {mode: replay, path: tests/cassettes, speed: 0}
+
+    Args:
+        client: 原始模型客户端
+        model: 客户端使用的模型，用于区分限流和熔断的端点
+        base_url: 客户端的服务地址
+
+    Returns:
+        ChatCompletionClient: 包装后的客户端（未配置时原样返回）
+    """
+    endpoint = (
+        f"{base_url or settings.aimodel.base_url}#{model or settings.aimodel.model}"
+    )
+    rate_limit_config = getattr(settings.aimodel, "rate_limit", None) or {}
+    rate_limited = bool(rate_limit_config.get("rpm") or rate_limit_config.get("tpm"))
+    if rate_limited:
+        from backend.core.llm_ratelimit import (
+            RateLimitedChatCompletionClient,
+            get_scheduler,
+        )
+
+        scheduler = get_scheduler(
+            endpoint,
+            rpm=rate_limit_config.get("rpm", 0),
+            tpm=rate_limit_config.get("tpm", 0),
+        )
+        client = RateLimitedChatCompletionClient(
+            client,
+            scheduler,
+            max_tokens=rate_limit_config.get("max_tokens", 1024),
+            max_retries=rate_limit_config.get("max_retries", 2),
+        )
+        logger.info(
+            f"🚦 [LLM客户端] 启用出站限流 | RPM: {scheduler.requests.capacity} | TPM: {scheduler.tokens.capacity}"
+        )
+
+    # 容错放在限流外面，重试和对冲请求同样要排队占用额度
+    resilience_config = getattr(settings.aimodel, "resilience", None) or {}
+    if resilience_config.get("enabled", True):
+        from backend.core.llm_resilience import (
+            DEFAULT_STAGE,
+            ResiliencePolicy,
+            ResilientChatCompletionClient,
+            get_breaker,
+        )
+
+        stage_configs = {
+            str(stage).lower(): stage_config or {}
+            for stage, stage_config in (resilience_config.get("stages") or {}).items()
+        }
+        policies = {
+            stage: ResiliencePolicy.from_config(
+                {**resilience_config, **stage_configs.get(stage, {})}
+            )
+            for stage in [DEFAULT_STAGE, *stage_configs]
+        }
+        breaker = get_breaker(
+            endpoint,
+            failure_threshold=resilience_config.get("failure_threshold", 5),
+            reset_timeout=resilience_config.get("reset_timeout", 30),
+        )
+        # 限流层已经按 retry-after 处理 429，容错层不再叠加重试
+        client = ResilientChatCompletionClient(
+            client, breaker, policies, retry_rate_limited=not rate_limited
+        )
+        logger.info(
+            f"🛡️ [LLM客户端] 启用调用容错 | 重试: {policies[DEFAULT_STAGE].max_retries} | 熔断阈值: {breaker.failure_threshold} | 单独配置的阶段: {list(stage_configs)}"
+        )
+
+    # 录制回放放在最外层，回放的调用不占用限流额度
+    cassette_config = getattr(settings.aimodel, "cassette", None) or {}
+    if cassette_config.get("mode"):
+        from backend.core.llm_cassette import CassetteChatCompletionClient
+
+        client = CassetteChatCompletionClient(
+            client,
+            path=cassette_config.get("path", "tests/cassettes"),
+            mode=cassette_config.get("mode"),
+            speed=cassette_config.get("speed", 1.0),
+        )
+        logger.info(
+            f"📼 [LLM客户端] 启用录制回放 | 模式: {client.mode} | 目录: {client.path} | 速度: {client.speed}x"
+        )
+    return client
+
+
 # 创建全局模型客户端实例
 try:
     openai_model_client = create_openai_model_client()
@@ -59,12 +190,12 @@ except Exception as e:
     openai_model_client = None
 
 
-def get_openai_model_client() -> OpenAIChatCompletionClient:
+def get_openai_model_client() -> ChatCompletionClient:
     """
     获取OpenAI模型客户端实例
 
     Returns:
-        OpenAIChatCompletionClient: 模型客户端实例
+        ChatCompletionClient: 模型客户端实例
 
     Raises:
         RuntimeError: 如果模型客户端未初始化
@@ -76,6 +207,70 @@ def get_openai_model_client() -> OpenAIChatCompletionClient:
     return openai_model_client
 
 
+# 阶段模型参数 -> 模型客户端，同样的参数复用同一个实例（智能体池按客户端实例区分）
+_stage_clients: Dict[tuple, ChatCompletionClient] = {}
+
+
+def get_stage_model_config(stage: str) -> Dict[str, Any]:
+    """
+    获取阶段单独配置的模型参数
+
+    aimodel.stages.<stage> 可以配置 model、base_url、api_key、max_tokens、temperature，
+    未配置的项沿用 aimodel 的设置
+
+    Args:
+        stage: 阶段名称
+
+    Returns:
+        Dict[str, Any]: 阶段的模型参数，未配置时为空字典
+    """
+    stages = getattr(settings.aimodel, "stages", None) or {}
+    config = stages.get(stage) or {}
+    return {str(key).lower(): value for key, value in config.items()}
+
+
+def get_stage_model_name(stage: str) -> str:
+    """获取阶段使用的模型名称"""
+    return get_stage_model_config(stage).get("model") or settings.aimodel.model
+
+
+def get_stage_model_client(stage: str) -> Optional[ChatCompletionClient]:
+    """
+    获取阶段单独配置的模型客户端
+
+    Args:
+        stage: 阶段名称
+
+    Returns:
+        Optional[ChatCompletionClient]: 阶段的模型客户端，未单独配置时返回 None（使用全局客户端）
+    """
+    config = get_stage_model_config(stage)
+    if not config:
+        return None
+    create_args = {
+        key: config[key]
+        for key in ("max_tokens", "temperature")
+        if config.get(key) is not None
+    }
+    key = (
+        config.get("model"),
+        config.get("base_url"),
+        config.get("api_key"),
+        tuple(sorted(create_args.items())),
+    )
+    client = _stage_clients.get(key)
+    if client is None:
+        logger.info(f"🧭 [LLM客户端] 为阶段 {stage} 创建单独的模型客户端")
+        client = create_openai_model_client(
+            model=config.get("model"),
+            base_url=config.get("base_url"),
+            api_key=config.get("api_key"),
+            **create_args,
+        )
+        _stage_clients[key] = client
+    return client
+
+
 def validate_model_client() -> bool:
     """
     验证模型客户端是否可用
@@ -102,5 +297,9 @@ __all__ = [
     "openai_model_client",
     "get_openai_model_client",
     "create_openai_model_client",
+    "wrap_model_client",
+    "get_stage_model_config",
+    "get_stage_model_name",
+    "get_stage_model_client",
     "validate_model_client",
 ]
@@ -0,0 +1,274 @@
+"""
+模型调用录制回放
+record 模式把真实的模型调用（包括流式分块和每个分块的到达时间）录制成 cassette 文件，
+replay 模式按录制时的节奏（或加速）回放，不访问网络，
+auto 模式命中时回放、未命中时调用真实模型并录制。
+用于在真实规模的输出上对比智能体流水线重构前后的性能
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from loguru import logger
+
+from backend.core.exceptions import ConfigurationError
+from backend.core.llm_wrappers import DelegatingChatCompletionClient
+
+CASSETTE_MODES = ("record", "replay", "auto")
+
+
+class CassetteMissError(LookupError):
+    """回放模式下没有找到对应的录制"""
+
+    pass
+
+
+def cassette_key(
+    messages: Sequence[LLMMessage],
+    json_output: Any = None,
+    extra_create_args: Mapping[str, Any] = {},
+) -> str:
+    """根据请求内容计算录制的键"""
+    payload = {
+        "messages": [
+            {"type": type(message).__name__, **message.model_dump(mode="json")}
+            for message in messages
+        ],
+        "json_output": json_output if isinstance(json_output, bool) else None,
+        "extra_create_args": dict(extra_create_args),
+    }
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CassetteChatCompletionClient(DelegatingChatCompletionClient):
+    """录制回放模型客户端"""
+
+    def __init__(
+        self,
+        inner: ChatCompletionClient,
+        path: str,
+        mode: str = "replay",
+        speed: float = 1.0,
+    ):
+        """
+        初始化录制回放客户端
+
+        Args:
+            inner: 真实的模型客户端
+            path: cassette 目录，每个请求一个 JSON 文件
+            mode: record 录制，replay 回放，auto 命中回放、未命中录制
+            speed: 回放速度倍数，1 为录制时的节奏，0 表示不等待
+        """
+        if mode not in CASSETTE_MODES:
+            raise ConfigurationError(f"不支持的 cassette 模式: {mode}")
+        super().__init__(inner)
+        self.path = Path(path)
+        self.mode = mode
+        self.speed = speed
+        self.path.mkdir(parents=True, exist_ok=True)
+        # 同一个请求录制了多次时按顺序轮流回放
+        self._replay_index: Dict[str, int] = {}
+        # 同一个键的录制串行写入，避免并发的相同请求互相覆盖
+        self._save_locks: Dict[str, asyncio.Lock] = {}
+        self._usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._last_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def _load(self, key: str) -> List[Dict[str, Any]]:
+        file = self._file(key)
+        if not file.exists():
+            return []
+        return json.loads(file.read_text(encoding="utf-8"))["recordings"]
+
+    def _next_recording(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.mode == "record":
+            return None
+        recordings = self._load(key)
+        if not recordings:
+            return None
+        index = self._replay_index.get(key, 0)
+        self._replay_index[key] = index + 1
+        return recordings[index % len(recordings)]
+
+    def _save(self, key: str, messages: Sequence[LLMMessage], recording: Dict) -> None:
+        file = self._file(key)
+        if file.exists():
+            data = json.loads(file.read_text(encoding="utf-8"))
+        else:
+            data = {
+                "key": key,
+                "preview": str(messages[-1].content)[:200] if messages else "",
+                "recordings": [],
+            }
+        data["recordings"].append(recording)
+        # 每次写入使用独立的临时文件，其他进程写同一个键时也不会互相删除
+        tmp = file.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            tmp.write_text(
+                json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            tmp.replace(file)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.recorded += 1
+
+    async def _record(
+        self, key: str, messages: Sequence[LLMMessage], recording: Dict
+    ) -> None:
+        """按键串行写入录制，写入失败只记录日志，不影响本次模型调用"""
+        lock = self._save_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            try:
+                await asyncio.to_thread(self._save, key, messages, recording)
+            except Exception as e:
+                logger.warning(
+                    f"⚠️ [录制回放] 写入录制失败 | 键: {key[:12]} | 错误: {e}"
+                )
+
+    def _miss(self, key: str) -> None:
+        self.misses += 1
+        if self.mode == "replay":
+            raise CassetteMissError(f"cassette 中没有对应的录制: {key}")
+
+    def _track_usage(self, result: CreateResult) -> None:
+        self._last_usage = result.usage
+        self._usage = RequestUsage(
+            prompt_tokens=self._usage.prompt_tokens + result.usage.prompt_tokens,
+            completion_tokens=self._usage.completion_tokens
+            + result.usage.completion_tokens,
+        )
+
+    async def _wait_until(self, started: float, offset: float) -> None:
+        if self.speed <= 0:
+            return
+        delay = offset / self.speed - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> CreateResult:
+        key = cassette_key(messages, json_output, extra_create_args)
+        started = time.perf_counter()
+        recording = self._next_recording(key)
+        if recording is not None:
+            self.hits += 1
+            await self._wait_until(started, recording["elapsed"])
+            result = CreateResult.model_validate(recording["result"])
+            self._track_usage(result)
+            return result
+
+        self._miss(key)
+        result = await super().create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+            **kwargs,
+        )
+        self._track_usage(result)
+        await self._record(
+            key,
+            messages,
+            {
+                "stream": False,
+                "elapsed": time.perf_counter() - started,
+                "chunks": [],
+                "result": result.model_dump(mode="json"),
+            },
+        )
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        key = cassette_key(messages, json_output, extra_create_args)
+        started = time.perf_counter()
+        recording = self._next_recording(key)
+        if recording is not None:
+            self.hits += 1
+            for offset, chunk in recording["chunks"]:
+                await self._wait_until(started, offset)
+                yield chunk
+            await self._wait_until(started, recording["elapsed"])
+            result = CreateResult.model_validate(recording["result"])
+            self._track_usage(result)
+            yield result
+            return
+
+        self._miss(key)
+        chunks: List[List[Any]] = []
+        async for item in super().create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+            **kwargs,
+        ):
+            if isinstance(item, CreateResult):
+                self._track_usage(item)
+                await self._record(
+                    key,
+                    messages,
+                    {
+                        "stream": True,
+                        "elapsed": time.perf_counter() - started,
+                        "chunks": chunks,
+                        "result": item.model_dump(mode="json"),
+                    },
+                )
+            else:
+                chunks.append([time.perf_counter() - started, item])
+            yield item
+
+    def actual_usage(self) -> RequestUsage:
+        return self._last_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._usage
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取录制回放统计信息"""
+        return {
+            "mode": self.mode,
+            "path": str(self.path),
+            "speed": self.speed,
+            "hits": self.hits,
+            "misses": self.misses,
+            "recorded": self.recorded,
+        }
@@ -0,0 +1,455 @@
+"""
+模型调用出站限流
+服务商按每分钟请求数（RPM）和每分钟 token 数（TPM）限流，超限后所有并发调用都会收到 429。
+这里在模型客户端外面包一层调度器：每个服务端点一组令牌桶，调用前估算 token 并排队，
+交互式聊天优先于批量测试用例生成，收到 429 时按 retry-after / x-ratelimit-* 响应头暂停整个端点
+"""
+
+import asyncio
+import heapq
+import itertools
+import re
+import time
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from loguru import logger
+
+from backend.core.llm_wrappers import DelegatingChatCompletionClient, derive_client
+from backend.core.metrics import registry
+
+# 调度优先级，数值越小越先发出
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_NORMAL = "normal"
+PRIORITY_BATCH = "batch"
+PRIORITIES = {PRIORITY_INTERACTIVE: 0, PRIORITY_NORMAL: 1, PRIORITY_BATCH: 2}
+
+llm_rate_limit_wait_seconds = registry.histogram(
+    "llm_rate_limit_wait_seconds",
+    "模型调用在出站限流队列中的等待时间",
+    ("priority",),
+)
+llm_rate_limited_total = registry.counter(
+    "llm_rate_limited_total", "服务商返回 429 的次数", ("endpoint",)
+)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """解析 x-ratelimit-reset-* 的时长，例如 "1s"、"6m0s"、"20ms" 或纯秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after_from_headers(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """从 429 响应头中取出需要暂停的秒数"""
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    delay = parse_reset(headers.get("retry-after"))
+    if delay is not None:
+        return delay
+    resets = [
+        parse_reset(headers.get("x-ratelimit-reset-requests")),
+        parse_reset(headers.get("x-ratelimit-reset-tokens")),
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    粗略估算一段文本的 token 数
+
+    不依赖 tiktoken（未知模型名时需要联网下载编码表），
+    中日韩字符按 1 个 token、其余按 4 个字符 1 个 token 计
+    """
+    wide = sum(1 for char in text if ord(char) > 0x2E80)
+    return wide + (len(text) - wide) // 4
+
+
+def estimate_tokens(messages: Sequence[LLMMessage], max_tokens: int = 0) -> int:
+    """粗略估算一次调用消耗的 token：每条消息的文本加 4 个 token 的格式开销，再加上输出上限"""
+    total = 0
+    for message in messages:
+        content = message.content
+        text = content if isinstance(content, str) else str(content)
+        total += estimate_text_tokens(text) + 4
+    return total + max_tokens
+
+
+class TokenBucket:
+    """按分钟补充的令牌桶，capacity 为每分钟额度，0 表示不限"""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.capacity / 60
+        )
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """拿到 amount 个令牌还需要等待的秒数"""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self._refill()
+            self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        """按实际用量修正预扣的令牌，amount 为负时补扣"""
+        if self.capacity:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self) -> None:
+        if self.capacity:
+            self.tokens = min(self.tokens, 0)
+            self.updated = time.monotonic()
+
+
+class RateLimitScheduler:
+    """单个服务端点的出站调度器"""
+
+    def __init__(self, endpoint: str, rpm: int = 0, tpm: int = 0):
+        """
+        初始化调度器
+
+        Args:
+            endpoint: 端点标识（base_url + 模型名）
+            rpm: 每分钟请求数上限，0 表示不限
+            tpm: 每分钟 token 数上限，0 表示不限
+        """
+        self.endpoint = endpoint
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self._waiters: List[tuple] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self.granted = 0
+        self.queued = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+
+    def _ready_in(self, cost: int) -> float:
+        return max(
+            self.paused_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(cost),
+            0.0,
+        )
+
+    def _grant(self, cost: int) -> None:
+        self.requests.take(1)
+        self.tokens.take(cost)
+        self.granted += 1
+
+    async def acquire(self, cost: int, priority: str = PRIORITY_NORMAL) -> float:
+        """
+        排队拿到一次调用的额度
+
+        Args:
+            cost: 预估 token 数
+            priority: 调度优先级
+
+        Returns:
+            float: 排队等待的秒数
+        """
+        started = time.perf_counter()
+        if not self._waiters and self._ready_in(cost) == 0:
+            self._grant(cost)
+            llm_rate_limit_wait_seconds.observe(0, priority=priority)
+            return 0.0
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(
+            self._waiters,
+            (PRIORITIES.get(priority, 1), next(self._sequence), cost, future),
+        )
+        self.queued += 1
+        self._ensure_pump()
+        self._wakeup.set()
+        await future
+
+        waited = time.perf_counter() - started
+        self.total_wait += waited
+        llm_rate_limit_wait_seconds.observe(waited, priority=priority)
+        if waited > 1:
+            logger.debug(
+                f"⏳ [出站限流] 排队 {waited:.2f}s | 端点: {self.endpoint} | 优先级: {priority}"
+            )
+        return waited
+
+    def _ensure_pump(self) -> None:
+        task = self._pump_task
+        if (
+            task is None
+            or task.done()
+            or task.get_loop() is not asyncio.get_running_loop()
+        ):
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.create_task(self._pump())
+
+    async def _pump(self) -> None:
+        """按优先级依次放行排队的调用，队首额度不足时整个队列等待"""
+        while self._waiters:
+            _, _, cost, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = self._ready_in(cost)
+            if delay == 0:
+                heapq.heappop(self._waiters)
+                self._grant(cost)
+                future.set_result(None)
+                continue
+            # 有更高优先级的调用入队或收到 429 时提前醒来重新计算
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def settle(self, estimated: int, usage: Optional[RequestUsage]) -> None:
+        """调用结束后按实际用量修正 token 桶"""
+        if usage is None:
+            return
+        actual = usage.prompt_tokens + usage.completion_tokens
+        if actual:
+            self.tokens.refund(estimated - actual)
+
+    def on_rate_limited(self, headers: Optional[Mapping[str, str]] = None) -> float:
+        """
+        收到 429 时暂停整个端点
+
+        Returns:
+            float: 暂停的秒数
+        """
+        delay = retry_after_from_headers(headers)
+        if delay is None:
+            delay = 60 / self.requests.capacity if self.requests.capacity else 1.0
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        if headers and headers.get("x-ratelimit-remaining-requests") == "0":
+            self.requests.drain()
+        if headers and headers.get("x-ratelimit-remaining-tokens") == "0":
+            self.tokens.drain()
+        self.rate_limited += 1
+        llm_rate_limited_total.inc(endpoint=self.endpoint)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        logger.warning(
+            f"🚦 [出站限流] 服务商返回 429，暂停 {delay:.2f}s | 端点: {self.endpoint}"
+        )
+        return delay
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计信息"""
+        return {
+            "endpoint": self.endpoint,
+            "rpm": self.requests.capacity,
+            "tpm": self.tokens.capacity,
+            "waiting": sum(1 for *_, future in self._waiters if not future.done()),
+            "granted": self.granted,
+            "queued": self.queued,
+            "rate_limited": self.rate_limited,
+            "total_wait": round(self.total_wait, 3),
+            "paused_for": round(max(self.paused_until - time.monotonic(), 0.0), 3),
+        }
+
+
+# 端点 -> 调度器，同一进程内共享
+_schedulers: Dict[str, RateLimitScheduler] = {}
+
+
+def get_scheduler(endpoint: str, rpm: int = 0, tpm: int = 0) -> RateLimitScheduler:
+    """获取端点的共享调度器，首次获取时按给定额度创建"""
+    scheduler = _schedulers.get(endpoint)
+    if scheduler is None:
+        scheduler = RateLimitScheduler(endpoint, rpm=rpm, tpm=tpm)
+        _schedulers[endpoint] = scheduler
+    return scheduler
+
+
+def get_rate_limit_stats() -> List[Dict[str, Any]]:
+    """获取所有端点的调度统计"""
+    return [scheduler.get_stats() for scheduler in _schedulers.values()]
+
+
+def _rate_limit_headers(error: BaseException) -> Optional[Mapping[str, str]]:
+    """429 错误返回响应头（没有响应头时返回空字典），其它错误返回 None"""
+    if getattr(error, "status_code", None) != 429:
+        return None
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+class RateLimitedChatCompletionClient(DelegatingChatCompletionClient):
+    """按端点额度排队发出调用的模型客户端"""
+
+    def __init__(
+        self,
+        inner: ChatCompletionClient,
+        scheduler: RateLimitScheduler,
+        priority: str = PRIORITY_NORMAL,
+        max_tokens: int = 1024,
+        max_retries: int = 2,
+    ):
+        """
+        初始化限流客户端
+
+        Args:
+            inner: 真实的模型客户端
+            scheduler: 端点共享的调度器
+            priority: 本客户端发出调用的优先级
+            max_tokens: 请求未指定 max_tokens 时预估的输出 token 数
+            max_retries: 收到 429（尚未输出内容）后重新排队的次数
+        """
+        super().__init__(inner)
+        self.scheduler = scheduler
+        self.priority = priority
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        # 不同优先级的视图共享内部客户端和调度器，缓存起来保证同一优先级拿到同一个实例
+        self._views: Dict[str, "RateLimitedChatCompletionClient"] = {priority: self}
+
+    def with_priority(self, priority: str) -> "RateLimitedChatCompletionClient":
+        """获取以指定优先级发出调用的客户端"""
+        view = self._views.get(priority)
+        if view is None:
+            view = RateLimitedChatCompletionClient(
+                self.inner,
+                self.scheduler,
+                priority=priority,
+                max_tokens=self.max_tokens,
+                max_retries=self.max_retries,
+            )
+            view._views = self._views
+            self._views[priority] = view
+        return view
+
+    def _estimate(
+        self, messages: Sequence[LLMMessage], extra_create_args: Mapping[str, Any]
+    ) -> int:
+        max_tokens = extra_create_args.get("max_tokens") or self.max_tokens
+        return estimate_tokens(messages, max_tokens)
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> CreateResult:
+        cost = self._estimate(messages, extra_create_args)
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(cost, self.priority)
+            try:
+                result = await super().create(
+                    messages,
+                    tools=tools,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+                    **kwargs,
+                )
+            except Exception as e:
+                headers = _rate_limit_headers(e)
+                if headers is None or attempt >= self.max_retries:
+                    raise
+                self.scheduler.on_rate_limited(headers)
+                continue
+            self.scheduler.settle(cost, result.usage)
+            return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        cost = self._estimate(messages, extra_create_args)
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(cost, self.priority)
+            started = False
+            try:
+                async for item in super().create_stream(
+                    messages,
+                    tools=tools,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+                    **kwargs,
+                ):
+                    started = True
+                    if isinstance(item, CreateResult):
+                        self.scheduler.settle(cost, item.usage)
+                    yield item
+                return
+            except Exception as e:
+                headers = _rate_limit_headers(e)
+                # 已经输出了内容就不能再重发，否则调用方会收到重复的流式块
+                if headers is None or started or attempt >= self.max_retries:
+                    raise
+                self.scheduler.on_rate_limited(headers)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取限流统计信息"""
+        return {"priority": self.priority, **self.scheduler.get_stats()}
+
+
+def with_priority(client: ChatCompletionClient, priority: str) -> ChatCompletionClient:
+    """
+    获取以指定优先级调度的模型客户端
+
+    限流客户端外面还有其它包装时逐层复制外层包装，未启用出站限流时原样返回
+    """
+    return derive_client(
+        client,
+        RateLimitedChatCompletionClient,
+        lambda limited: limited.with_priority(priority),
+        ("priority", priority),
+    )
@@ -0,0 +1,468 @@
+"""
+模型调用容错
+服务商偶发的连接错误和 5xx 会让整个多智能体阶段失败。这里在模型客户端外面包一层：
+首个流式块之前的连接错误、429 和 5xx 按指数退避加随机抖动重试（OpenAI SDK 自带的重试随之关闭），
+启用出站限流时 429 交给限流层按 retry-after 重新排队，这里不再重试，
+首 token 耗时超过该阶段历史分位数时发出对冲请求（两个请求谁先出首个流式块用谁），
+连续失败达到阈值后熔断（429 是限流而不是服务故障，不计入失败次数），在冷却时间内直接失败，不再等待超时。
+重试、退避和对冲参数可以按流水线阶段分别配置
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, fields
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+from autogen_core.tools import Tool, ToolSchema
+from loguru import logger
+
+from backend.core.exceptions import ServiceError
+from backend.core.llm_wrappers import DelegatingChatCompletionClient, derive_client
+from backend.core.metrics import registry
+
+# 未指定阶段时使用的阶段名
+DEFAULT_STAGE = "default"
+
+llm_retries_total = registry.counter(
+    "llm_retries_total", "模型调用重试次数", ("stage", "reason")
+)
+llm_hedged_requests_total = registry.counter(
+    "llm_hedged_requests_total", "模型调用对冲请求次数", ("stage", "winner")
+)
+llm_circuit_open_total = registry.counter(
+    "llm_circuit_open_total", "熔断器打开次数", ("endpoint",)
+)
+
+
+# 端点 -> 熔断器，端点 -> 阶段 -> 重试、对冲统计，同一进程内共享
+_breakers: Dict[str, "CircuitBreaker"] = {}
+_stage_stats: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+
+class CircuitOpenError(ServiceError):
+    """熔断器打开期间直接拒绝的模型调用"""
+
+    pass
+
+
+@dataclass
+class ResiliencePolicy:
+    """单个流水线阶段的容错参数"""
+
+    max_retries: int = 2
+    # 第 n 次重试的退避上限为 backoff * 2^n（不超过 max_backoff），实际等待在 0 到上限之间随机
+    backoff: float = 0.5
+    max_backoff: float = 8.0
+    # 首 token 耗时超过该阶段最近调用的该分位数时发出对冲请求，0 表示不对冲
+    hedge_percentile: float = 0.0
+    # 样本数不足时不对冲，避免冷启动阶段误判
+    hedge_min_samples: int = 20
+    # 对冲等待时间的下限（秒），避免分位数过小时几乎每次都对冲
+    hedge_min_delay: float = 1.0
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "ResiliencePolicy":
+        # 环境变量覆盖的配置键是大写的
+        names = {item.name for item in fields(cls)}
+        options = {str(key).lower(): value for key, value in config.items()}
+        return cls(**{key: value for key, value in options.items() if key in names})
+
+
+def is_retryable(error: BaseException) -> bool:
+    """连接错误、超时、429 和 5xx 可以重试，其它 4xx 和调用方取消不重试"""
+    if isinstance(error, asyncio.CancelledError):
+        return False
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    # openai.APIConnectionError / APITimeoutError 以及 httpx 的传输错误
+    names = {cls.__name__ for cls in type(error).__mro__}
+    return bool(names & {"APIConnectionError", "APITimeoutError", "TransportError"})
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """服务商返回 429"""
+    return getattr(error, "status_code", None) == 429
+
+
+class CircuitBreaker:
+    """端点级熔断器：closed 正常放行，open 直接拒绝，冷却后 half_open 放行一次试探调用"""
+
+    def __init__(
+        self, endpoint: str, failure_threshold: int = 5, reset_timeout: float = 30
+    ):
+        """
+        初始化熔断器
+
+        Args:
+            endpoint: 端点标识
+            failure_threshold: 连续失败多少次后打开，0 表示不熔断
+            reset_timeout: 打开后多少秒进入半开状态
+        """
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self) -> None:
+        """检查是否放行，熔断期间抛出 CircuitOpenError"""
+        if self.state == "open":
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(
+                    f"模型服务暂时不可用，{remaining:.0f} 秒后重试 | 端点: {self.endpoint}"
+                )
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpenError(f"模型服务恢复检测中 | 端点: {self.endpoint}")
+            self._probing = True
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info(f"🟢 [熔断器] 模型服务恢复，熔断器关闭 | 端点: {self.endpoint}")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or (
+            self.failure_threshold and self.failures >= self.failure_threshold
+        ):
+            if self.state != "open":
+                self.opened += 1
+                llm_circuit_open_total.inc(endpoint=self.endpoint)
+                logger.warning(
+                    f"🔴 [熔断器] 连续失败 {self.failures} 次，熔断 {self.reset_timeout}s | 端点: {self.endpoint}"
+                )
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """调用既没有成功也没有按服务故障失败（例如被取消、4xx）时释放试探名额"""
+        self._probing = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class TTFTWindow:
+    """最近若干次调用的首 token 耗时，用于计算对冲阈值"""
+
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+
+    def percentile(self, percentile: float) -> float:
+        ordered = sorted(self.samples)
+        index = min(int(len(ordered) * percentile / 100), len(ordered) - 1)
+        return ordered[index]
+
+
+class ResilientChatCompletionClient(DelegatingChatCompletionClient):
+    """带重试、对冲和熔断的模型客户端"""
+
+    def __init__(
+        self,
+        inner: ChatCompletionClient,
+        breaker: CircuitBreaker,
+        policies: Optional[Mapping[str, ResiliencePolicy]] = None,
+        stage: str = DEFAULT_STAGE,
+        retry_rate_limited: bool = True,
+    ):
+        """
+        初始化容错客户端
+
+        Args:
+            inner: 内部模型客户端
+            breaker: 端点共享的熔断器
+            policies: 阶段名 -> 容错参数，default 为未单独配置的阶段使用的参数
+            stage: 本客户端所属的流水线阶段
+            retry_rate_limited: 是否重试 429；内部有出站限流时由限流层按 retry-after 重新排队，
+                这里应关闭，避免两层重试次数叠加
+        """
+        super().__init__(inner)
+        self.breaker = breaker
+        self.retry_rate_limited = retry_rate_limited
+        self.policies = dict(policies or {})
+        self.policies.setdefault(DEFAULT_STAGE, ResiliencePolicy())
+        self.stage = stage
+        self.policy = self.policies.get(stage, self.policies[DEFAULT_STAGE])
+        # 各阶段的首 token 耗时窗口、统计和阶段视图在所有视图之间共享
+        self._ttft: Dict[str, TTFTWindow] = {}
+        self._stage_stats = _stage_stats.setdefault(breaker.endpoint, {})
+        self._views: Dict[tuple, "ResilientChatCompletionClient"] = {
+            (stage, id(inner)): self
+        }
+
+    def with_stage(self, stage: str) -> "ResilientChatCompletionClient":
+        """获取按指定阶段参数容错的客户端"""
+        # 按内部客户端区分，外层复制出的不同优先级视图各自派生阶段视图
+        key = (stage, id(self.inner))
+        view = self._views.get(key)
+        if view is None:
+            view = ResilientChatCompletionClient(
+                self.inner,
+                self.breaker,
+                self.policies,
+                stage=stage,
+                retry_rate_limited=self.retry_rate_limited,
+            )
+            view._ttft = self._ttft
+            view._views = self._views
+            self._views[key] = view
+        return view
+
+    def ttft_window(self, stage: str) -> TTFTWindow:
+        return self._ttft.setdefault(stage, TTFTWindow())
+
+    @property
+    def ttft(self) -> TTFTWindow:
+        return self.ttft_window(self.stage)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self._stage_stats.setdefault(
+            self.stage, {"retries": 0, "hedged": 0, "hedge_wins": 0}
+        )
+
+    def _hedge_delay(self) -> Optional[float]:
+        """对冲等待时间，未启用或样本不足时为 None"""
+        policy = self.policy
+        if (
+            not policy.hedge_percentile
+            or len(self.ttft.samples) < policy.hedge_min_samples
+        ):
+            return None
+        return max(
+            self.ttft.percentile(policy.hedge_percentile), policy.hedge_min_delay
+        )
+
+    def _can_retry(self, error: BaseException) -> bool:
+        """按错误类型更新熔断器，返回是否可以重试"""
+        if is_rate_limited(error):
+            # 429 说明端点在限流而不是故障，计入熔断会让短暂的限流拖垮所有阶段
+            self.breaker.release()
+            return self.retry_rate_limited
+        if not is_retryable(error):
+            self.breaker.release()
+            return False
+        self.breaker.record_failure()
+        return self.breaker.state != "open"
+
+    async def _backoff(self, attempt: int, error: BaseException) -> None:
+        ceiling = min(self.policy.backoff * 2**attempt, self.policy.max_backoff)
+        delay = random.uniform(0, ceiling)
+        self.stats["retries"] += 1
+        llm_retries_total.inc(stage=self.stage, reason=type(error).__name__)
+        logger.warning(
+            f"🔁 [模型容错] 第 {attempt + 1} 次重试，等待 {delay:.2f}s | 阶段: {self.stage} | 错误: {type(error).__name__}: {error}"
+        )
+        await asyncio.sleep(delay)
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> CreateResult:
+        for attempt in range(self.policy.max_retries + 1):
+            self.breaker.allow()
+            try:
+                result = await super().create(
+                    messages,
+                    tools=tools,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+                    **kwargs,
+                )
+            except BaseException as e:
+                if not self._can_retry(e) or attempt >= self.policy.max_retries:
+                    raise
+                await self._backoff(attempt, e)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _start(self, open_stream) -> tuple:
+        """
+        发起调用并等待首个流式块，超过对冲阈值时再发起一次，先出首个流式块的请求胜出
+
+        Returns:
+            tuple: (胜出的流, 首个流式块)
+        """
+        started = time.perf_counter()
+        primary = open_stream()
+        first = asyncio.ensure_future(primary.__anext__())
+        attempts = {first: primary}
+        delay = self._hedge_delay()
+        hedged = False
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({first}, timeout=delay)
+                if not done:
+                    hedged = True
+                    self.stats["hedged"] += 1
+                    hedge = open_stream()
+                    attempts[asyncio.ensure_future(hedge.__anext__())] = hedge
+                    logger.info(
+                        f"🪁 [模型容错] 首 token 超过 {delay:.2f}s，发出对冲请求 | 阶段: {self.stage}"
+                    )
+            pending = set(attempts)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        winner = attempts.pop(task)
+                        self.ttft.add(time.perf_counter() - started)
+                        if hedged:
+                            won = "primary" if task is first else "hedge"
+                            if task is not first:
+                                self.stats["hedge_wins"] += 1
+                            llm_hedged_requests_total.inc(stage=self.stage, winner=won)
+                        return winner, task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task, stream in attempts.items():
+                if not task.done():
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        def open_stream() -> AsyncIterator[Union[str, CreateResult]]:
+            return super(ResilientChatCompletionClient, self).create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+                **kwargs,
+            )
+
+        for attempt in range(self.policy.max_retries + 1):
+            self.breaker.allow()
+            try:
+                stream, first_item = await self._start(open_stream)
+            except StopAsyncIteration:
+                self.breaker.record_success()
+                return
+            except BaseException as e:
+                if not self._can_retry(e) or attempt >= self.policy.max_retries:
+                    raise
+                await self._backoff(attempt, e)
+                continue
+            break
+
+        # 已经输出首个流式块后不再重试，出错直接交给调用方
+        try:
+            yield first_item
+            async for item in stream:
+                yield item
+        except BaseException as e:
+            if is_retryable(e) and not is_rate_limited(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            await stream.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取容错统计信息"""
+        return {
+            "stage": self.stage,
+            "circuit": self.breaker.get_stats(),
+            "stages": {
+                stage: {**stats, "ttft_samples": len(self.ttft_window(stage).samples)}
+                for stage, stats in self._stage_stats.items()
+            },
+        }
+
+
+def get_breaker(
+    endpoint: str, failure_threshold: int = 5, reset_timeout: float = 30
+) -> CircuitBreaker:
+    """获取端点的共享熔断器，首次获取时按给定参数创建"""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = CircuitBreaker(endpoint, failure_threshold, reset_timeout)
+        _breakers[endpoint] = breaker
+    return breaker
+
+
+def get_resilience_stats() -> Dict[str, Dict[str, Any]]:
+    """获取所有端点的熔断器状态和各阶段的重试、对冲次数"""
+    return {
+        endpoint: {
+            "circuit": breaker.get_stats(),
+            "stages": _stage_stats.get(endpoint, {}),
+        }
+        for endpoint, breaker in _breakers.items()
+    }
+
+
+def for_stage(client: ChatCompletionClient, stage: str) -> ChatCompletionClient:
+    """
+    获取按指定流水线阶段参数容错的模型客户端
+
+    未启用容错时原样返回
+    """
+    return derive_client(
+        client,
+        ResilientChatCompletionClient,
+        lambda resilient: resilient.with_stage(stage),
+        ("stage", stage),
+    )
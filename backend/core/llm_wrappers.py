@@ -0,0 +1,170 @@
+"""
+模型客户端包装基类
+在不改动智能体代码的前提下给模型客户端叠加录制回放、限流、重试等能力，
+所有包装类都继承 DelegatingChatCompletionClient，未覆盖的方法直接转发给内部客户端
+"""
+
+import copy
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Hashable,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+
+class DelegatingChatCompletionClient(ChatCompletionClient):
+    """把所有调用转发给内部客户端的包装基类"""
+
+    def __init__(self, inner: ChatCompletionClient):
+        self.inner = inner
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> CreateResult:
+        return await self.inner.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+            **kwargs,
+        )
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        return self.inner.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+            **kwargs,
+        )
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self.inner.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self.inner.total_usage()
+
+    def count_tokens(
+        self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []
+    ) -> int:
+        return self.inner.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(
+        self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []
+    ) -> int:
+        return self.inner.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore[override]
+        return self.inner.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.inner.model_info
+
+
+class StreamUsageChatCompletionClient(DelegatingChatCompletionClient):
+    """
+    流式调用时要求服务商在最后一个块返回 token 用量
+
+    stream_options 只能用于流式请求，放进客户端的默认调用参数后非流式的 create() 也会带上，
+    会被服务商以 400 拒绝，因此只在 create_stream 中加上 include_usage
+    """
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        # 调用方自己设置了 stream_options 时以调用方为准
+        if "stream_options" not in extra_create_args:
+            kwargs.setdefault("include_usage", True)
+        return super().create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+            **kwargs,
+        )
+
+
+def derive_client(
+    client: ChatCompletionClient,
+    wrapper_type: type,
+    derive: Callable[[Any], ChatCompletionClient],
+    key: Hashable,
+) -> ChatCompletionClient:
+    """
+    在包装链中找到 wrapper_type 类型的包装并派生出新实例，逐层复制它外面的包装
+
+    派生结果按 key 缓存在每一层包装上，同一个 key 总是拿到同一个实例
+    （智能体池按模型客户端实例区分，实例不稳定会导致池无法复用）。
+    包装链中没有 wrapper_type 时原样返回
+
+    Args:
+        client: 包装后的模型客户端
+        wrapper_type: 要派生的包装类型
+        derive: 根据该层包装生成新实例的函数
+        key: 缓存键
+
+    Returns:
+        ChatCompletionClient: 派生出的客户端
+    """
+    if isinstance(client, wrapper_type):
+        return derive(client)
+    if not isinstance(client, DelegatingChatCompletionClient):
+        return client
+    inner = derive_client(client.inner, wrapper_type, derive, key)
+    if inner is client.inner:
+        return client
+    views = client.__dict__.setdefault("_derived_views", {})
+    view = views.get(key)
+    if view is None:
+        view = copy.copy(client)
+        view.inner = inner
+        view._derived_views = {}
+        views[key] = view
+    return view
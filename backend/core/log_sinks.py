@@ -0,0 +1,218 @@
+"""
+非阻塞日志文件输出
+日志记录先放入有界队列，由独立的写线程批量写入文件；
+日志轮转后的压缩和过期清理交给单独的压缩线程，不占用写线程和事件循环
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from backend.core.exceptions import ConfigurationError
+
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+_DURATION_UNITS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+    "week": 7 * 86400,
+}
+
+# 写线程每次最多合并写入的记录数
+WRITE_BATCH_SIZE = 512
+
+_STOP = object()
+
+
+def parse_size(value: Any) -> int:
+    """解析 "10 MB" 形式的大小配置，返回字节数"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?B)\s*", str(value).upper())
+    if not match:
+        raise ConfigurationError(f"无法解析日志轮转大小: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def parse_duration(value: Any) -> float:
+    """解析 "7 days" 形式的时长配置，返回秒数"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-z]+?)s?\s*", str(value).lower())
+    if not match or match.group(2) not in _DURATION_UNITS:
+        raise ConfigurationError(f"无法解析日志保留时间: {value}")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+class QueuedFileSink:
+    """
+    队列化的日志文件输出
+
+    作为 loguru 的流式 sink 使用：write() 只负责入队，
+    文件写入、轮转在写线程完成，压缩和过期清理在压缩线程完成
+    """
+
+    def __init__(
+        self,
+        path: str,
+        rotation: Any = "10 MB",
+        retention: Any = "7 days",
+        compression: Optional[str] = "zip",
+        max_queue: int = 10000,
+        overflow: str = "drop",
+        encoding: str = "utf-8",
+    ):
+        """
+        初始化文件输出
+
+        Args:
+            path: 日志文件路径
+            rotation: 单个文件的最大大小，超过后轮转
+            retention: 轮转文件的保留时间
+            compression: 轮转文件的压缩格式，目前支持 zip，为空时不压缩
+            max_queue: 队列最大长度
+            overflow: 队列满时的策略，drop 丢弃新记录，block 阻塞等待
+            encoding: 文件编码
+        """
+        if overflow not in ("drop", "block"):
+            raise ConfigurationError(f"不支持的日志队列溢出策略: {overflow}")
+        if compression not in (None, "", "zip"):
+            raise ConfigurationError(f"不支持的日志压缩格式: {compression}")
+
+        self.path = Path(path)
+        self.rotation_bytes = parse_size(rotation)
+        self.retention_seconds = parse_duration(retention)
+        self.compression = compression or None
+        self.overflow = overflow
+        self.encoding = encoding
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.compressed = 0
+        self.errors = 0
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._compressor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"log-compress-{self.path.stem}"
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding=encoding)
+        self._size = self._file.tell()
+        self._stopped = False
+        self._writer = threading.Thread(
+            target=self._run, name=f"log-writer-{self.path.stem}", daemon=True
+        )
+        self._writer.start()
+
+    def write(self, message: str) -> None:
+        """入队一条格式化后的日志（由 loguru 调用）"""
+        if self._stopped:
+            return
+        if self.overflow == "block":
+            self._queue.put(str(message))
+            return
+        try:
+            self._queue.put_nowait(str(message))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        """写线程：批量取出记录写入文件"""
+        while True:
+            item = self._queue.get()
+            batch: List[str] = []
+            stop = item is _STOP
+            if not stop:
+                batch.append(item)
+            while not stop and len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                self._write_batch(batch)
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[str]) -> None:
+        try:
+            text = "".join(batch)
+            self._file.write(text)
+            self._file.flush()
+            self._size += len(text.encode(self.encoding))
+            self.written += len(batch)
+            if self._size >= self.rotation_bytes:
+                self._rotate()
+        except Exception:
+            # 日志输出自身出错时不能再写日志，只计数
+            self.errors += 1
+
+    def _rotate(self) -> None:
+        """关闭当前文件并改名，压缩和清理交给压缩线程"""
+        self._file.close()
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S_%f")
+        rotated = self.path.with_name(f"{self.path.stem}.{timestamp}{self.path.suffix}")
+        os.replace(self.path, rotated)
+        self._file = open(self.path, "a", encoding=self.encoding)
+        self._size = 0
+        self.rotations += 1
+        self._compressor.submit(self._finish_rotation, rotated)
+
+    def _finish_rotation(self, rotated: Path) -> None:
+        """压缩线程：压缩轮转文件并清理过期文件"""
+        try:
+            if self.compression == "zip":
+                archive = rotated.with_name(rotated.name + ".zip")
+                with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+                    zf.write(rotated, arcname=rotated.name)
+                rotated.unlink()
+                self.compressed += 1
+            self._cleanup_expired()
+        except Exception:
+            self.errors += 1
+
+    def _cleanup_expired(self) -> None:
+        expire_before = time.time() - self.retention_seconds
+        pattern = f"{self.path.stem}.*{self.path.suffix}*"
+        for candidate in self.path.parent.glob(pattern):
+            if candidate == self.path:
+                continue
+            if candidate.stat().st_mtime < expire_before:
+                candidate.unlink(missing_ok=True)
+
+    def stop(self) -> None:
+        """写完队列中剩余的记录并停止线程（logger.remove 时由 loguru 调用）"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._compressor.shutdown(wait=True)
+        self._file.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取输出统计信息"""
+        return {
+            "path": str(self.path),
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+            "compressed": self.compressed,
+            "errors": self.errors,
+            "overflow": self.overflow,
+        }
@@ -6,10 +6,45 @@
 import os
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 from loguru import logger
 
+from backend.core.log_sinks import QueuedFileSink
+
+# 热路径日志默认参数
+DEFAULT_CONTENT_LIMIT = 200  # 日志中内容的最大字符数
+DEFAULT_SAMPLE_EVERY = 100  # 每个日志点每多少次记录一次
+
+
+class Truncated:
+    """
+    延迟截断的日志内容
+
+    只有在日志真正输出、被格式化时才截断字符串，级别被过滤时没有任何开销
+    """
+
+    __slots__ = ("text", "limit")
+
+    def __init__(self, text: Any, limit: Optional[int] = None):
+        self.text = text
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = "" if self.text is None else str(self.text)
+        limit = log_config.content_limit if self.limit is None else self.limit
+        if limit <= 0 or len(text) <= limit:
+            return text
+        return f"{text[:limit]}...(共{len(text)}字符)"
+
+    def __format__(self, format_spec: str) -> str:
+        return format(str(self), format_spec)
+
+
+def truncate(text: Any, limit: Optional[int] = None) -> Truncated:
+    """包装日志内容，输出时按 limit（默认 content_limit）截断"""
+    return Truncated(text, limit)
+
 
 class LoggerConfig:
     """日志配置类"""
@@ -17,6 +52,13 @@ class LoggerConfig:
     def __init__(self):
         self.log_dir = Path("logs")
         self.log_dir.mkdir(exist_ok=True)
+        # 日志器未配置前视为所有级别都启用
+        self.min_level_no = 0
+        self.content_limit = DEFAULT_CONTENT_LIMIT
+        self.sample_every = DEFAULT_SAMPLE_EVERY
+        self._site_counts: Dict[str, int] = {}
+        self._level_nos: Dict[str, int] = {}
+        self.file_sinks: List[QueuedFileSink] = []
 
     def setup_logger(
         self,
@@ -26,6 +68,11 @@ class LoggerConfig:
         retention: str = "7 days",
         compression: str = "zip",
         force_no_color: bool = False,
+        enqueue: bool = True,
+        content_limit: int = DEFAULT_CONTENT_LIMIT,
+        sample_every: int = DEFAULT_SAMPLE_EVERY,
+        queue_size: int = 10000,
+        overflow: str = "drop",
     ):
         """
         配置日志器
@@ -37,13 +84,22 @@ class LoggerConfig:
             retention: 日志保留时间
             compression: 压缩格式
             force_no_color: 强制禁用颜色输出
+            enqueue: 控制台输出是否通过队列异步写入，避免写日志阻塞事件循环
+            content_limit: 热路径日志中内容的最大字符数（<=0 不截断）
+            sample_every: 热路径日志每个日志点每多少次记录一次（<=1 不采样）
+            queue_size: 文件输出队列的最大长度
+            overflow: 文件输出队列满时的策略，drop 丢弃并计数，block 阻塞等待
         """
-        # 移除默认的控制台处理器
+        # 移除默认的控制台处理器（已有的文件输出会在移除时写完队列并停止线程）
         logger.remove()
+        self.file_sinks = []
 
-        # 检测终端是否支持颜色
-        import os
+        self.min_level_no = logger.level(log_level.upper()).no
+        self.content_limit = content_limit
+        self.sample_every = sample_every
+        self._site_counts.clear()
 
+        # 检测终端是否支持颜色
         supports_color = (
             not force_no_color
             and hasattr(sys.stdout, "isatty")
@@ -78,6 +134,7 @@ class LoggerConfig:
             level=log_level,
             format=console_format,
             colorize=colorize,
+            enqueue=enqueue,
         )
 
         # 添加文件输出
@@ -85,41 +142,106 @@ class LoggerConfig:
             log_file = "app.log"
 
         log_path = self.log_dir / log_file
+        file_format = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} | {message}"
 
-        logger.add(
-            str(log_path),
-            level=log_level,
-            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} | {message}",
-            rotation=rotation,
-            retention=retention,
-            compression=compression,
-            encoding="utf-8",
-        )
-
-        # 添加错误日志文件（只记录 ERROR 及以上级别）
-        error_log_path = self.log_dir / "error.log"
-        logger.add(
-            str(error_log_path),
-            level="ERROR",
-            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} | {message}",
-            rotation=rotation,
-            retention=retention,
-            compression=compression,
-            encoding="utf-8",
-        )
+        # 文件输出使用独立写线程，轮转压缩在后台线程完成
+        for path, level in (
+            (log_path, log_level),
+            (self.log_dir / "error.log", "ERROR"),
+        ):
+            sink = QueuedFileSink(
+                str(path),
+                rotation=rotation,
+                retention=retention,
+                compression=compression,
+                max_queue=queue_size,
+                overflow=overflow,
+            )
+            self.file_sinks.append(sink)
+            # 错误日志文件只记录 ERROR 及以上级别
+            logger.add(sink, level=level, format=file_format, colorize=False)
 
         logger.info(f"日志系统初始化完成，日志文件: {log_path}")
         return logger
 
+    def get_sink_stats(self) -> List[Dict[str, Any]]:
+        """获取文件输出的队列和丢弃统计"""
+        return [sink.get_stats() for sink in self.file_sinks]
+
+    def is_enabled(self, level: str) -> bool:
+        """判断级别是否会被输出"""
+        level_no = self._level_nos.get(level)
+        if level_no is None:
+            level_no = self._level_nos[level] = logger.level(level).no
+        return level_no >= self.min_level_no
+
+    def should_sample(self, site: str, every: Optional[int] = None) -> bool:
+        """按日志点计数，每 every 次返回一次 True（第一次总是返回 True）"""
+        every = self.sample_every if every is None else every
+        if every <= 1:
+            return True
+        count = self._site_counts.get(site, 0)
+        self._site_counts[site] = count + 1
+        return count % every == 0
+
+    def get_sample_counts(self) -> Dict[str, int]:
+        """获取各日志点的调用次数"""
+        return dict(self._site_counts)
+
 
 # 创建全局日志配置实例
 log_config = LoggerConfig()
 
 
 # 设置默认日志配置
-def setup_logging(log_level: str = "INFO", force_no_color: bool = False):
+def setup_logging(
+    log_level: str = "INFO",
+    force_no_color: bool = False,
+    enqueue: bool = True,
+    content_limit: int = DEFAULT_CONTENT_LIMIT,
+    sample_every: int = DEFAULT_SAMPLE_EVERY,
+    queue_size: int = 10000,
+    overflow: str = "drop",
+):
     """设置日志配置"""
-    return log_config.setup_logger(log_level=log_level, force_no_color=force_no_color)
+    return log_config.setup_logger(
+        log_level=log_level,
+        force_no_color=force_no_color,
+        enqueue=enqueue,
+        content_limit=content_limit,
+        sample_every=sample_every,
+        queue_size=queue_size,
+        overflow=overflow,
+    )
+
+
+def hot_log(
+    level: str,
+    site: str,
+    message: str,
+    *args: Any,
+    every: Optional[int] = None,
+    **kwargs: Any,
+) -> None:
+    """
+    热路径日志（如每个流式块一条的日志）
+
+    - 级别未启用时立即返回，不做任何格式化
+    - 按 site 采样，每 every 次（默认 sample_every）只记录一次
+    - message 使用 loguru 的 {} 占位符，参数在输出时才格式化，
+      内容参数应使用 truncate() 包装
+
+    Args:
+        level: 日志级别
+        site: 日志点标识，用于采样计数
+        message: 日志模板
+        every: 采样间隔，覆盖全局配置
+    """
+    if not log_config.is_enabled(level):
+        return
+    if not log_config.should_sample(site, every):
+        return
+    logger.opt(depth=1).log(level, message, *args, **kwargs)
 
 
 # 获取日志器实例
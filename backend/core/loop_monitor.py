@@ -0,0 +1,226 @@
+"""
+事件循环延迟监控
+后台心跳协程测量事件循环的调度延迟并记录直方图；
+独立的看门狗线程在心跳长时间未更新时抓取事件循环线程的调用栈，定位阻塞代码；
+延迟持续超过 SLO 时可拒绝新的重负载请求（返回 503）
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from fastapi import HTTPException, Request
+from loguru import logger
+
+from backend.core.metrics import registry
+
+event_loop_lag_seconds = registry.histogram(
+    "event_loop_lag_seconds",
+    "事件循环调度延迟",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+event_loop_stalls_total = registry.counter(
+    "event_loop_stalls_total", "事件循环阻塞超过阈值的次数"
+)
+requests_shed_total = registry.counter(
+    "requests_shed_total", "因事件循环过载被拒绝的请求数", ("endpoint",)
+)
+
+
+class LoopLagMonitor:
+    """事件循环延迟监控器"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        interval: float = 0.1,
+        stall_threshold: float = 0.25,
+        slo: float = 0.1,
+        window: int = 10,
+        shed: bool = False,
+        retry_after: int = 5,
+    ):
+        """
+        初始化监控器
+
+        Args:
+            enabled: 是否启用监控
+            interval: 心跳间隔（秒）
+            stall_threshold: 心跳超过该时间未更新时抓取事件循环线程的调用栈（秒）
+            slo: 延迟目标（秒），最近 window 次心跳的延迟都超过该值时视为过载
+            window: 判断过载使用的心跳次数
+            shed: 过载时是否拒绝新的重负载请求
+            retry_after: 拒绝请求时建议客户端的重试间隔（秒）
+        """
+        self.enabled = enabled
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.slo = slo
+        self.shed = shed
+        self.retry_after = retry_after
+
+        self.samples = 0
+        self.stalls = 0
+        self.shed_count = 0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.last_stall: Optional[Dict[str, Any]] = None
+        self._recent: Deque[float] = deque(maxlen=window)
+
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._last_beat = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat_task is not None and not self._heartbeat_task.done()
+
+    @property
+    def overloaded(self) -> bool:
+        """最近 window 次心跳的延迟是否都超过 SLO"""
+        recent = list(self._recent)
+        return len(recent) == self._recent.maxlen and min(recent) > self.slo
+
+    def start(self) -> None:
+        """在当前事件循环中启动心跳协程和看门狗线程"""
+        if not self.enabled or self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop_event.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+        logger.info(
+            f"🫀 [事件循环监控] 已启动 | 心跳间隔: {self.interval}s | "
+            f"阻塞阈值: {self.stall_threshold}s | SLO: {self.slo}s | 过载拒绝: {self.shed}"
+        )
+
+    async def stop(self) -> None:
+        """停止心跳协程和看门狗线程"""
+        self._stop_event.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=self.interval * 2 + 1)
+            self._watchdog = None
+        logger.info("🫀 [事件循环监控] 已停止")
+
+    async def _heartbeat(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.record(max(time.perf_counter() - started - self.interval, 0.0))
+            self._last_beat = time.monotonic()
+
+    def record(self, lag: float) -> None:
+        """记录一次调度延迟"""
+        self.samples += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self._recent.append(lag)
+        event_loop_lag_seconds.observe(lag)
+
+    def _watch(self) -> None:
+        """看门狗线程：心跳停滞超过阈值时记录一次事件循环线程的调用栈"""
+        reported_beat = None
+        while not self._stop_event.wait(self.interval):
+            beat = self._last_beat
+            blocked = time.monotonic() - beat
+            if blocked < self.stall_threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            self._report_stall(blocked)
+
+    def _report_stall(self, blocked: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else ""
+        self.stalls += 1
+        self.last_stall = {
+            "blocked_seconds": round(blocked, 4),
+            "time": time.time(),
+            "stack": stack,
+        }
+        event_loop_stalls_total.inc()
+        logger.warning(
+            f"🐢 [事件循环监控] 事件循环已阻塞 {blocked:.3f}s，"
+            f"当前执行位置:\n{stack}"
+        )
+
+    def check(self, endpoint: str) -> None:
+        """
+        过载时拒绝请求
+
+        Raises:
+            HTTPException: 开启过载拒绝且事件循环持续过载时返回 503
+        """
+        if not (self.shed and self.overloaded):
+            return
+        self.shed_count += 1
+        requests_shed_total.inc(endpoint=endpoint)
+        logger.warning(
+            f"🚦 [事件循环监控] 事件循环过载，拒绝请求 | 接口: {endpoint} | "
+            f"最近延迟: {self.last_lag:.3f}s"
+        )
+        raise HTTPException(
+            status_code=503,
+            detail="服务繁忙，请稍后重试",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取监控统计信息"""
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "samples": self.samples,
+            "last_lag": round(self.last_lag, 4),
+            "max_lag": round(self.max_lag, 4),
+            "overloaded": self.overloaded,
+            "slo": self.slo,
+            "shed_enabled": self.shed,
+            "shed_count": self.shed_count,
+            "stalls": self.stalls,
+            "last_stall": self.last_stall,
+        }
+
+
+async def shed_when_overloaded(request: Request) -> None:
+    """重负载接口的依赖：事件循环持续过载时返回 503"""
+    loop_monitor.check(request.url.path)
+
+
+def create_loop_monitor() -> LoopLagMonitor:
+    """根据配置创建事件循环监控器"""
+    try:
+        from backend.conf.config import settings
+
+        monitor_config = getattr(settings, "loop_monitor", {}) or {}
+        return LoopLagMonitor(
+            enabled=monitor_config.get("enabled", True),
+            interval=monitor_config.get("interval", 0.1),
+            stall_threshold=monitor_config.get("stall_threshold", 0.25),
+            slo=monitor_config.get("slo", 0.1),
+            window=monitor_config.get("window", 10),
+            shed=monitor_config.get("shed", False),
+            retry_after=monitor_config.get("retry_after", 5),
+        )
+    except ImportError:
+        logger.warning("无法导入配置，事件循环监控使用默认参数")
+        return LoopLagMonitor()
+
+
+loop_monitor = create_loop_monitor()
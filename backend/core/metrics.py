@@ -0,0 +1,465 @@
+"""
+进程内指标采集
+提供与 Prometheus 文本格式兼容的 Counter / Gauge / Histogram，
+由 /metrics 接口直接输出，不依赖外部服务
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from loguru import logger
+
+from backend.core.tracing import record_db_time
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 首个 token 耗时分桶（秒）
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+# 生成速度分桶（token/秒）
+RATE_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+
+LabelValues = Tuple[str, ...]
+# 采集函数返回的样本：(标签字典, 数值)
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """指标基类"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(
+                f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """只增计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """可增可减的数值"""
+
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """分桶直方图"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各分桶计数..., 总和, 总数]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def get_count(self, **labels: Any) -> int:
+        state = self._values.get(self._key(labels))
+        return int(state[-1]) if state else 0
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        bucket_names = self.labelnames + ("le",)
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(bucket_names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(bucket_names, key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {_format_value(state[-1])}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Sample]]]] = (
+            []
+        )
+
+    def _register(self, metric: Metric) -> Any:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[Sample]],
+        type_name: str = "gauge",
+    ) -> None:
+        """
+        注册采集函数，在输出指标时调用，适合直接读取现有对象状态的指标
+
+        Args:
+            name: 指标名
+            documentation: 指标说明
+            collect: 返回 (标签字典, 数值) 样本的函数
+            type_name: 指标类型
+        """
+        self._collectors = [c for c in self._collectors if c[0] != name]
+        self._collectors.append((name, documentation, type_name, collect))
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式"""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for name, documentation, type_name, collect in list(self._collectors):
+            try:
+                samples = list(collect())
+            except Exception as e:
+                logger.warning(f"⚠️ [指标] 采集失败: {name} | {e}")
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for labels, value in samples:
+                label_text = _format_labels(tuple(labels), tuple(labels.values()))
+                lines.append(f"{name}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# HTTP
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP 请求总数", ("method", "route", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP 请求耗时（流式响应计到响应结束）",
+    ("method", "route"),
+)
+sse_streams_active = registry.gauge(
+    "sse_streams_active", "当前活跃的流式响应数量", ("endpoint",)
+)
+
+# 大模型流式输出
+llm_time_to_first_token_seconds = registry.histogram(
+    "llm_time_to_first_token_seconds",
+    "从发起调用到收到首个流式块的耗时",
+    ("source",),
+    TTFT_BUCKETS,
+)
+llm_tokens_per_second = registry.histogram(
+    "llm_tokens_per_second",
+    "首个流式块之后的生成速度（无用量信息时按流式块数估算）",
+    ("source",),
+    RATE_BUCKETS,
+)
+llm_stream_chunks_total = registry.counter(
+    "llm_stream_chunks_total", "大模型流式块总数", ("source",)
+)
+llm_completion_tokens_total = registry.counter(
+    "llm_completion_tokens_total", "大模型输出 token 总数", ("source",)
+)
+llm_stage_duration_seconds = registry.histogram(
+    "llm_stage_duration_seconds",
+    "各阶段单次大模型调用的总耗时（按阶段使用的模型区分）",
+    ("source", "model"),
+    TTFT_BUCKETS,
+)
+llm_stage_tokens_total = registry.counter(
+    "llm_stage_tokens_total",
+    "各阶段消耗的 token 数（kind 为 prompt 或 completion）",
+    ("source", "model", "kind"),
+)
+
+# 数据库
+db_query_duration_seconds = registry.histogram(
+    "db_query_duration_seconds", "数据库查询耗时", ("operation",)
+)
+db_query_errors_total = registry.counter(
+    "db_query_errors_total", "数据库查询失败次数", ("operation",)
+)
+
+
+class StreamTracker:
+    """统计活跃流式响应数量的上下文管理器，可在异步生成器内跨 yield 使用"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+
+    def __enter__(self) -> "StreamTracker":
+        sse_streams_active.inc(endpoint=self.endpoint)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        sse_streams_active.dec(endpoint=self.endpoint)
+
+
+async def track_stream(endpoint: str, stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """包装流式响应生成器，在其运行期间计入活跃流式响应数量"""
+    with StreamTracker(endpoint):
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+class LLMStreamObserver:
+    """记录一次大模型流式调用的首 token 耗时、流式块数和生成速度"""
+
+    def __init__(self, source: str, model: Optional[str] = None):
+        self.source = source
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+        self.chunks = 0
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """首个流式块的耗时（秒），尚未收到时为 None"""
+        if self.first_chunk_at is None:
+            return None
+        return self.first_chunk_at - self.started
+
+    def on_chunk(self) -> None:
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+            llm_time_to_first_token_seconds.observe(
+                self.first_chunk_at - self.started, source=self.source
+            )
+        self.chunks += 1
+
+    def finish(
+        self,
+        completion_tokens: Optional[int] = None,
+        prompt_tokens: Optional[int] = None,
+    ) -> None:
+        """调用结束时记录，completion_tokens 为空时按流式块数估算；指定了模型时按模型记录总耗时和 token 数"""
+        if self.model:
+            labels = {"source": self.source, "model": self.model}
+            llm_stage_duration_seconds.observe(
+                time.perf_counter() - self.started, **labels
+            )
+            if prompt_tokens:
+                llm_stage_tokens_total.inc(prompt_tokens, kind="prompt", **labels)
+            if completion_tokens:
+                llm_stage_tokens_total.inc(
+                    completion_tokens, kind="completion", **labels
+                )
+        if self.chunks:
+            llm_stream_chunks_total.inc(self.chunks, source=self.source)
+        tokens = completion_tokens or self.chunks
+        if completion_tokens:
+            llm_completion_tokens_total.inc(completion_tokens, source=self.source)
+        if self.first_chunk_at is None or not tokens:
+            return
+        duration = time.perf_counter() - self.first_chunk_at
+        if duration > 0:
+            llm_tokens_per_second.observe(tokens / duration, source=self.source)
+
+
+class MetricsMiddleware:
+    """记录 HTTP 请求数量和耗时的 ASGI 中间件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # 使用路由模板而不是实际路径，避免标签数量失控
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_request_duration_seconds.observe(
+                time.perf_counter() - started, method=method, route=route_path
+            )
+            http_requests_total.inc(
+                method=method, route=route_path, status=status["code"]
+            )
+
+
+_DB_METHODS = (
+    "execute_query",
+    "execute_query_dict",
+    "execute_insert",
+    "execute_many",
+    "execute_script",
+)
+_DB_OPERATIONS = {"select", "insert", "update", "delete", "create", "drop", "alter"}
+
+
+def _query_operation(query: Any) -> str:
+    words = str(query).lstrip().split(None, 1)
+    operation = words[0].lower() if words else ""
+    return operation if operation in _DB_OPERATIONS else "other"
+
+
+def instrument_db_client(client_class: type) -> None:
+    """给 Tortoise 数据库客户端类的执行方法加上耗时统计（重复调用无副作用）"""
+    if getattr(client_class, "_metrics_instrumented", False):
+        return
+
+    def wrap(original):
+        async def wrapper(self, query, *args, **kwargs):
+            operation = _query_operation(query)
+            started = time.perf_counter()
+            try:
+                return await original(self, query, *args, **kwargs)
+            except Exception:
+                db_query_errors_total.inc(operation=operation)
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                db_query_duration_seconds.observe(elapsed, operation=operation)
+                record_db_time(elapsed)
+
+        wrapper.__name__ = original.__name__
+        wrapper.__doc__ = original.__doc__
+        return wrapper
+
+    for method_name in _DB_METHODS:
+        original = getattr(client_class, method_name, None)
+        if original is not None:
+            setattr(client_class, method_name, wrap(original))
+    client_class._metrics_instrumented = True
+    logger.debug(f"📈 [指标] 数据库客户端已接入耗时统计: {client_class.__name__}")
+
+
+def instrument_tortoise() -> None:
+    """为当前所有 Tortoise 连接的客户端类接入耗时统计"""
+    from tortoise import connections
+
+    for connection in connections.all():
+        instrument_db_client(type(connection))
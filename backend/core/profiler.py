@@ -0,0 +1,243 @@
+"""
+运行时性能剖析
+在运行中的进程内按需采集：
+1. 采样式 CPU 剖析：后台线程定时抓取调用栈，输出 flamegraph 可用的折叠栈格式
+2. tracemalloc 内存快照：按分配位置汇总，同样可输出折叠栈格式
+3. 对象大小估算：用于统计按对话保存的数据结构占用的内存
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+_project_root = str(Path(__file__).parent.parent.parent) + "/"
+
+# 估算对象大小时不展开的类型（共享的代码和模块对象）
+_OPAQUE_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+)
+
+
+def _frame_label(filename: str, name: str, lineno: int) -> str:
+    if filename.startswith(_project_root):
+        filename = filename[len(_project_root) :]
+    else:
+        filename = Path(filename).name
+    return f"{name} ({filename}:{lineno})".replace(";", ":")
+
+
+def _fold_frame(frame) -> List[str]:
+    """把调用栈转换为从外到内的帧名称列表"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(_frame_label(code.co_filename, code.co_name, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class ProfileBusyError(Exception):
+    """已有剖析任务在执行"""
+
+    pass
+
+
+class SamplingProfiler:
+    """采样式 CPU 剖析器"""
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    @staticmethod
+    def _sample(
+        duration: float, interval: float, thread_ids: Optional[Set[int]]
+    ) -> Dict[str, Any]:
+        """在采样线程中执行：定时抓取目标线程的调用栈并计数"""
+        own_id = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_ids is not None and thread_id not in thread_ids:
+                    continue
+                thread_name = names.get(thread_id, str(thread_id))
+                stacks[";".join([thread_name] + _fold_frame(frame))] += 1
+            samples += 1
+            time.sleep(interval)
+        return {"samples": samples, "stacks": stacks}
+
+    async def profile(
+        self, duration: float = 10.0, interval: float = 0.005, all_threads: bool = False
+    ) -> Dict[str, Any]:
+        """
+        采集一段时间的 CPU 剖析
+
+        采样在独立线程中进行，不阻塞事件循环
+
+        Args:
+            duration: 采样时长（秒）
+            interval: 采样间隔（秒）
+            all_threads: 是否采集所有线程，默认只采集事件循环所在线程
+
+        Returns:
+            dict: 采样次数和折叠栈计数
+
+        Raises:
+            ProfileBusyError: 已有剖析任务在执行
+        """
+        if self._lock.locked():
+            raise ProfileBusyError("已有剖析任务在执行")
+        async with self._lock:
+            thread_ids = None if all_threads else {threading.get_ident()}
+            logger.info(
+                f"🔬 [性能剖析] 开始 CPU 采样 | 时长: {duration}s | 间隔: {interval}s | "
+                f"全部线程: {all_threads}"
+            )
+            result = await asyncio.to_thread(
+                self._sample, duration, interval, thread_ids
+            )
+            logger.info(
+                f"🔬 [性能剖析] CPU 采样完成 | 采样次数: {result['samples']} | "
+                f"不同调用栈: {len(result['stacks'])}"
+            )
+            return result
+
+    async def memory_snapshot(
+        self, duration: float = 0.0, frames: int = 25, top: int = 50
+    ) -> Dict[str, Any]:
+        """
+        采集 tracemalloc 内存快照
+
+        未开启 tracemalloc 时临时开启，只能统计开启之后的分配，
+        因此可以通过 duration 等待一段时间再拍快照
+
+        Args:
+            duration: 开启追踪后等待的时间（秒）
+            frames: 每次分配记录的调用栈深度
+            top: 返回占用最多的分配位置数量
+
+        Returns:
+            dict: 总占用、占用最多的分配位置和折叠栈计数（按字节）
+
+        Raises:
+            ProfileBusyError: 已有剖析任务在执行
+        """
+        if self._lock.locked():
+            raise ProfileBusyError("已有剖析任务在执行")
+        async with self._lock:
+            started_here = not tracemalloc.is_tracing()
+            if started_here:
+                tracemalloc.start(frames)
+            try:
+                if duration > 0:
+                    await asyncio.sleep(duration)
+                snapshot = tracemalloc.take_snapshot()
+            finally:
+                if started_here:
+                    tracemalloc.stop()
+
+            snapshot = snapshot.filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),)
+            )
+            statistics = await asyncio.to_thread(snapshot.statistics, "traceback")
+
+        stacks: Counter = Counter()
+        for stat in statistics:
+            # tracemalloc 的调用栈按从外到内排列，最后一帧是分配位置
+            folded = ";".join(
+                _frame_label(frame.filename, "<alloc>", frame.lineno)
+                for frame in stat.traceback
+            )
+            stacks[folded] += stat.size
+
+        top_stats = [
+            {
+                "location": _frame_label(
+                    stat.traceback[-1].filename, "<alloc>", stat.traceback[-1].lineno
+                ),
+                "size": stat.size,
+                "count": stat.count,
+            }
+            for stat in statistics[:top]
+        ]
+        total = sum(stat.size for stat in statistics)
+        logger.info(
+            f"🔬 [性能剖析] 内存快照完成 | 追踪到的占用: {total} 字节 | "
+            f"分配位置: {len(statistics)}"
+        )
+        return {
+            "traced_bytes": total,
+            "tracing_started_here": started_here,
+            "top": top_stats,
+            "stacks": stacks,
+        }
+
+
+def render_folded(stacks: Counter) -> str:
+    """输出 flamegraph.pl / speedscope 可读取的折叠栈文本"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def approx_size(obj: Any, seen: Optional[Set[int]] = None, max_depth: int = 8) -> int:
+    """
+    估算对象及其引用对象占用的字节数
+
+    同一个 seen 集合内共享的对象只统计一次，超过 max_depth 的引用不再展开
+
+    Args:
+        obj: 要统计的对象
+        seen: 已统计对象的 id 集合
+        max_depth: 最大展开深度
+
+    Returns:
+        int: 估算的字节数
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, _OPAQUE_TYPES):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if max_depth <= 0 or isinstance(obj, (str, bytes, bytearray, int, float, bool)):
+        return size
+
+    children: Iterable[Any] = ()
+    if isinstance(obj, dict):
+        children = [item for pair in obj.items() for item in pair]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        children = obj
+    elif hasattr(obj, "__dict__"):
+        children = [vars(obj)]
+    if hasattr(type(obj), "__slots__"):
+        children = list(children) + [
+            getattr(obj, slot)
+            for slot in type(obj).__slots__
+            if isinstance(slot, str) and hasattr(obj, slot)
+        ]
+    for child in children:
+        size += approx_size(child, seen, max_depth - 1)
+    return size
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,247 @@
+"""
+优雅停机
+收到退出信号后停止接受新的流式请求，等待进行中的流式生成完成，
+超过排空时间仍未结束的流会被中断；
+之后再由应用生命周期保存未完成对话的进度、清理运行时并关闭数据库
+"""
+
+import asyncio
+import signal
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException, Request
+from loguru import logger
+
+from backend.core.metrics import registry
+
+streams_interrupted_total = registry.counter(
+    "streams_interrupted_total", "停机时未完成而被中断的流式响应数", ("endpoint",)
+)
+requests_rejected_draining_total = registry.counter(
+    "requests_rejected_draining_total", "停机排空期间被拒绝的请求数", ("endpoint",)
+)
+
+
+@dataclass
+class ActiveStream:
+    """进行中的流式响应"""
+
+    endpoint: str
+    conversation_id: str
+    started: float = field(default_factory=time.monotonic)
+
+
+class StreamDrainer:
+    """流式响应排空管理器"""
+
+    def __init__(
+        self,
+        drain_timeout: float = 30.0,
+        poll_interval: float = 0.1,
+        retry_after: int = 5,
+    ):
+        """
+        初始化排空管理器
+
+        Args:
+            drain_timeout: 收到退出信号后等待进行中的流完成的最长时间（秒）
+            poll_interval: 检查流是否全部完成的间隔（秒）
+            retry_after: 排空期间拒绝请求时建议客户端的重试间隔（秒）
+        """
+        self.drain_timeout = drain_timeout
+        self.poll_interval = poll_interval
+        self.retry_after = retry_after
+
+        self.draining = False
+        self.expired = False
+        self.drain_started: Optional[float] = None
+        self.finished_while_draining = 0
+        self.interrupted = 0
+        self.rejected = 0
+
+        self._active: Dict[int, ActiveStream] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._drain_task: Optional[asyncio.Task] = None
+
+    @property
+    def active_count(self) -> int:
+        return len(self._active)
+
+    def start(self) -> None:
+        """
+        在应用启动时调用：记录当前事件循环，并在服务器已安装的退出信号处理函数之前插入排空
+
+        服务器（uvicorn）仍按原逻辑停止监听并等待连接关闭，排空在此期间进行
+        """
+        self._loop = asyncio.get_running_loop()
+        installed = False
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                self.request_drain()
+                previous(signum, frame)
+
+            try:
+                signal.signal(sig, handler)
+                installed = True
+            except ValueError:
+                # 不在主线程（例如测试客户端）时无法安装，保持服务器原有行为
+                return
+        if installed:
+            self._disable_sse_auto_drain()
+
+    @staticmethod
+    def _disable_sse_auto_drain() -> None:
+        """sse_starlette 默认在收到退出信号后立即结束所有 SSE 流，改由这里排空"""
+        try:
+            from sse_starlette.sse import AppStatus
+        except ImportError:
+            return
+        if hasattr(AppStatus, "disable_automatic_graceful_drain"):
+            AppStatus.disable_automatic_graceful_drain()
+
+    def request_drain(self) -> None:
+        """在信号处理函数中调用：线程安全地在事件循环中开始排空"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self.begin_drain)
+
+    def begin_drain(self) -> None:
+        """进入排空状态并在后台等待进行中的流完成，重复调用不会重新计时"""
+        if self.draining:
+            return
+        self.draining = True
+        self.drain_started = time.monotonic()
+        self._drain_task = asyncio.get_running_loop().create_task(self._drain())
+        logger.warning(
+            f"🚧 [优雅停机] 开始排空 | 进行中的流: {self.active_count} | "
+            f"最长等待: {self.drain_timeout}s"
+        )
+
+    async def _drain(self) -> None:
+        deadline = self.drain_started + self.drain_timeout
+        while self._active and time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+        if self._active:
+            # 剩余的流在下一次输出后结束，长时间没有输出的由服务器的停机超时取消
+            self.expired = True
+            logger.warning(
+                f"⏱️ [优雅停机] 排空超时，中断剩余的流: {self.active_count} 个"
+            )
+        else:
+            logger.info(
+                f"✅ [优雅停机] 进行中的流已全部完成 | 耗时: "
+                f"{time.monotonic() - self.drain_started:.2f}s"
+            )
+
+    async def guard(
+        self,
+        endpoint: str,
+        conversation_id: str,
+        stream: AsyncIterator[Any],
+    ) -> AsyncIterator[Any]:
+        """
+        包装流式响应生成器，登记为进行中的流，排空超时后在下一次输出后结束
+
+        Args:
+            endpoint: 接口名称
+            conversation_id: 对话ID
+            stream: 原始的流式响应生成器
+        """
+        record = ActiveStream(endpoint, conversation_id)
+        key = id(record)
+        self._active[key] = record
+        completed = False
+        try:
+            async for item in stream:
+                yield item
+                if self.expired:
+                    break
+            else:
+                completed = True
+        finally:
+            del self._active[key]
+            if self.draining:
+                if completed:
+                    self.finished_while_draining += 1
+                else:
+                    self.interrupted += 1
+                    streams_interrupted_total.inc(endpoint=endpoint)
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def check(self, endpoint: str) -> None:
+        """
+        排空期间拒绝新的流式请求
+
+        Raises:
+            HTTPException: 正在排空时返回 503
+        """
+        if not self.draining:
+            return
+        self.rejected += 1
+        requests_rejected_draining_total.inc(endpoint=endpoint)
+        raise HTTPException(
+            status_code=503,
+            detail="服务正在停机，请稍后重试",
+            headers={"Retry-After": str(self.retry_after), "Connection": "close"},
+        )
+
+    async def shutdown(self) -> None:
+        """应用停止时调用：进入排空状态并等待排空结束"""
+        self.begin_drain()
+        if self._drain_task is not None:
+            await self._drain_task
+        logger.info(
+            f"🛑 [优雅停机] 排空结束 | 排空期间完成: {self.finished_while_draining} | "
+            f"中断: {self.interrupted}"
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取排空统计信息"""
+        now = time.monotonic()
+        return {
+            "draining": self.draining,
+            "expired": self.expired,
+            "drain_timeout": self.drain_timeout,
+            "active": [
+                {
+                    "endpoint": record.endpoint,
+                    "conversation_id": record.conversation_id,
+                    "elapsed": round(now - record.started, 3),
+                }
+                for record in self._active.values()
+            ],
+            "finished_while_draining": self.finished_while_draining,
+            "interrupted": self.interrupted,
+            "rejected": self.rejected,
+        }
+
+
+async def reject_when_draining(request: Request) -> None:
+    """流式接口的依赖：停机排空期间返回 503"""
+    stream_drainer.check(request.url.path)
+
+
+def create_stream_drainer() -> StreamDrainer:
+    """根据配置创建排空管理器"""
+    try:
+        from backend.conf.config import settings
+
+        server_config = getattr(settings, "server", {}) or {}
+        return StreamDrainer(
+            drain_timeout=float(server_config.get("drain_timeout", 30.0)),
+            retry_after=server_config.get("retry_after", 5),
+        )
+    except ImportError:
+        logger.warning("无法导入配置，优雅停机使用默认参数")
+        return StreamDrainer()
+
+
+stream_drainer = create_stream_drainer()
@@ -0,0 +1,165 @@
+"""
+流式请求去重（singleflight）
+相同键的并发请求只执行一次底层流式任务，后到的请求挂载到正在运行的任务上，
+按顺序回放已产生的事件并继续接收后续事件
+"""
+
+import asyncio
+import hashlib
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from loguru import logger
+
+
+def build_dedup_key(*parts: Any) -> str:
+    """
+    根据多个部分计算去重键
+
+    Args:
+        parts: 参与计算的内容，None 会被视为空字符串
+
+    Returns:
+        str: sha256 十六进制摘要
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str("" if part is None else part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class InflightStream:
+    """正在运行的流式任务，缓存已产生的事件供后到的订阅者回放"""
+
+    def __init__(self, key: str, owner_id: str):
+        self.key = key
+        self.owner_id = owner_id  # 首个请求的标识（如对话ID）
+        self.events: List[Dict] = []
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, event: Dict) -> None:
+        """追加事件并唤醒所有订阅者"""
+        async with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    async def finish(self) -> None:
+        """标记任务结束"""
+        async with self._changed:
+            self.done = True
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncGenerator[Dict, None]:
+        """从头回放事件，并等待新事件直到任务结束"""
+        index = 0
+        self.subscribers += 1
+        try:
+            while True:
+                async with self._changed:
+                    while index >= len(self.events) and not self.done:
+                        await self._changed.wait()
+                    pending = self.events[index:]
+                    finished = self.done
+                index += len(pending)
+                for event in pending:
+                    # 每个订阅者拿到独立副本，避免下游修改共享事件
+                    yield dict(event)
+                if finished and index >= len(self.events):
+                    return
+        finally:
+            self.subscribers -= 1
+
+
+class StreamSingleFlight:
+    """
+    流式任务去重器
+
+    底层流式任务在后台任务中运行，因此即使首个请求的客户端断开，
+    已挂载的其他请求仍能收到完整输出
+    """
+
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self._inflight: Dict[str, InflightStream] = {}
+        self.leader_count = 0
+        self.follower_count = 0
+
+    def get(self, key: str) -> Optional[InflightStream]:
+        """获取正在运行的任务"""
+        return self._inflight.get(key)
+
+    async def stream(
+        self,
+        key: str,
+        owner_id: str,
+        factory: Callable[[], AsyncGenerator[Dict, None]],
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        执行或挂载流式任务
+
+        Args:
+            key: 去重键
+            owner_id: 当前请求的标识，成为首个请求时记录为任务标识，
+                挂载时事件中的 conversation_id 会改写为该标识
+            factory: 创建底层流式生成器的函数，只在没有同键任务时调用
+
+        Yields:
+            Dict: 流式事件
+        """
+        job = self._inflight.get(key)
+        if job is None:
+            job = InflightStream(key, owner_id)
+            self._inflight[key] = job
+            job.task = asyncio.create_task(self._run(job, factory))
+            self.leader_count += 1
+            logger.info(
+                f"🆕 [请求去重:{self.name}] 启动新任务 | 键: {key[:12]} | 标识: {owner_id}"
+            )
+        else:
+            self.follower_count += 1
+            logger.info(
+                f"🔗 [请求去重:{self.name}] 挂载到运行中的任务 | 键: {key[:12]} | 原始标识: {job.owner_id} | 请求标识: {owner_id}"
+            )
+
+        follower = job.owner_id != owner_id
+        async for event in job.subscribe():
+            # 挂载的请求使用自己的对话，回放时把对话ID换成请求自己的标识
+            if follower and "conversation_id" in event:
+                event["conversation_id"] = owner_id
+            yield event
+
+    async def _run(
+        self, job: InflightStream, factory: Callable[[], AsyncGenerator[Dict, None]]
+    ) -> None:
+        """在后台驱动底层生成器并广播事件"""
+        try:
+            async for event in factory():
+                await job.publish(event)
+        except Exception as e:
+            logger.error(
+                f"❌ [请求去重:{self.name}] 任务执行失败 | 键: {job.key[:12]} | 错误: {e}"
+            )
+            await job.publish(
+                {
+                    "type": "error",
+                    "source": "system",
+                    "content": f"任务执行失败: {str(e)}",
+                    "conversation_id": job.owner_id,
+                }
+            )
+        finally:
+            # 先移出运行表，保证之后的相同请求会重新执行
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+            await job.finish()
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取去重统计信息"""
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leader_count,
+            "followers": self.follower_count,
+        }
@@ -0,0 +1,318 @@
+"""
+轻量级链路追踪
+记录带 conversation_id 的耗时区间（span），用于拆解一次测试用例生成中
+文件解析、各阶段智能体、大模型调用、流式输出和数据库操作各自的耗时。
+span 保存在内存中（有上限），也可以按 JSON Lines 写入本地文件
+"""
+
+import functools
+import json
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from loguru import logger
+
+
+class Span:
+    """一个耗时区间"""
+
+    __slots__ = (
+        "name",
+        "conversation_id",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_time",
+        "duration",
+        "status",
+        "attributes",
+        "_started",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        conversation_id: Optional[str] = None,
+        parent: Optional["Span"] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.conversation_id = conversation_id or (
+            parent.conversation_id if parent else None
+        )
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self.duration: Optional[float] = None
+        self.status = "ok"
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self._started = time.perf_counter()
+
+    def set(self, key: str, value: Any) -> None:
+        """设置属性"""
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float) -> None:
+        """累加数值属性"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self, status: Optional[str] = None) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+        if status:
+            self.status = status
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "conversation_id": self.conversation_id,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空 span"""
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def add(self, key: str, amount: float) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class InMemorySpanExporter:
+    """内存中保存最近的 span"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class JsonlSpanExporter:
+    """按 JSON Lines 写入文件，写入由队列化的文件输出在后台线程完成"""
+
+    def __init__(self, path: str):
+        from backend.core.log_sinks import QueuedFileSink
+
+        self.sink = QueuedFileSink(path, rotation="50 MB", retention="7 days")
+
+    def export(self, span: Span) -> None:
+        self.sink.write(
+            json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        )
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    index = min(int(len(sorted_values) * percent), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Tracer:
+    """span 的创建与导出"""
+
+    def __init__(self, enabled: bool = True, max_spans: int = 10000):
+        self.enabled = enabled
+        self.memory = InMemorySpanExporter(max_spans)
+        self.exporters: List[Any] = [self.memory]
+
+    def add_exporter(self, exporter: Any) -> None:
+        self.exporters.append(exporter)
+
+    def _export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning(f"⚠️ [链路追踪] span 导出失败: {e}")
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
+
+    @contextmanager
+    def span(
+        self, name: str, conversation_id: Optional[str] = None, **attributes: Any
+    ) -> Iterator[Any]:
+        """
+        记录一个 span，并作为其中代码的父 span
+
+        conversation_id 为空时继承父 span 的对话ID。
+        不要在异步生成器中跨 yield 使用，流式输出请使用 trace_stream()
+        """
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+
+        span = Span(name, conversation_id, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set("error", f"{type(e).__name__}: {e}")
+            span.end("error")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            self._export(span)
+
+    def traced(
+        self, name: str, conversation_id: Optional[Callable[..., Optional[str]]] = None
+    ) -> Callable:
+        """
+        异步函数装饰器
+
+        Args:
+            name: span 名称
+            conversation_id: 从调用参数中取对话ID的函数，参数与被装饰函数相同
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+                cid = conversation_id(*args, **kwargs) if conversation_id else None
+                with self.span(name, cid):
+                    return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    async def trace_stream(
+        self, name: str, conversation_id: Optional[str], stream: AsyncIterator[Any]
+    ) -> AsyncIterator[Any]:
+        """
+        包装流式输出，记录整个流的耗时、事件数和首个事件的等待时间
+
+        该 span 不会成为其他 span 的父 span
+        """
+        if not self.enabled:
+            async for item in stream:
+                yield item
+            return
+
+        span = Span(name, conversation_id, _current_span.get())
+        events = 0
+        status = "ok"
+        try:
+            async for item in stream:
+                if events == 0:
+                    span.set("first_event_seconds", time.perf_counter() - span._started)
+                events += 1
+                yield item
+        except BaseException as e:
+            status = "error" if isinstance(e, Exception) else "cancelled"
+            span.set("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.set("events", events)
+            span.end(status)
+            self._export(span)
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def get_spans(self, conversation_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取内存中的 span，按开始时间排序"""
+        spans = [
+            span
+            for span in list(self.memory.spans)
+            if conversation_id is None or span.conversation_id == conversation_id
+        ]
+        spans.sort(key=lambda span: span.start_time)
+        return [span.to_dict() for span in spans]
+
+    def get_summary(self, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        按 span 名称汇总耗时
+
+        Returns:
+            dict: 每个 span 名称的次数、总耗时、平均、p50、p95、最大耗时
+        """
+        durations: Dict[str, List[float]] = {}
+        for span in list(self.memory.spans):
+            if conversation_id is not None and span.conversation_id != conversation_id:
+                continue
+            if span.duration is not None:
+                durations.setdefault(span.name, []).append(span.duration)
+
+        stages = {}
+        for name, values in durations.items():
+            values.sort()
+            stages[name] = {
+                "count": len(values),
+                "total": round(sum(values), 4),
+                "avg": round(sum(values) / len(values), 4),
+                "p50": round(_percentile(values, 0.5), 4),
+                "p95": round(_percentile(values, 0.95), 4),
+                "max": round(values[-1], 4),
+            }
+        return {
+            "conversation_id": conversation_id,
+            "span_count": sum(stage["count"] for stage in stages.values()),
+            "stages": dict(
+                sorted(stages.items(), key=lambda item: item[1]["total"], reverse=True)
+            ),
+        }
+
+
+def record_db_time(seconds: float) -> None:
+    """把数据库耗时累加到当前 span"""
+    span = _current_span.get()
+    if span is not None:
+        span.add("db_seconds", seconds)
+        span.add("db_queries", 1)
+
+
+def create_tracer() -> Tracer:
+    """根据配置创建追踪器"""
+    try:
+        from backend.conf.config import settings
+
+        tracing_config = getattr(settings, "tracing", {}) or {}
+        tracer = Tracer(
+            enabled=tracing_config.get("enabled", True),
+            max_spans=tracing_config.get("max_spans", 10000),
+        )
+        if tracer.enabled and tracing_config.get("file"):
+            tracer.add_exporter(JsonlSpanExporter(tracing_config.get("file")))
+        return tracer
+    except ImportError:
+        logger.warning("无法导入配置，链路追踪使用默认参数")
+        return Tracer()
+
+
+tracer = create_tracer()
@@ -0,0 +1,139 @@
+"""
+预热对象池
+后台维持一定数量已初始化完成的对象，请求到来时直接取用，
+取走后异步补充，避免初始化开销落在请求路径上
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Generic, Optional, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+
+class WarmPool(Generic[T]):
+    """预热对象池"""
+
+    def __init__(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        size: int = 2,
+        dispose: Optional[Callable[[T], Awaitable[Any]]] = None,
+        name: str = "pool",
+    ):
+        """
+        初始化预热池
+
+        Args:
+            factory: 创建并初始化对象的异步函数
+            size: 预热对象数量，为 0 时不预热，每次取用都直接创建
+            dispose: 关闭池时释放未使用对象的异步函数
+            name: 池名称，用于日志和统计
+        """
+        self.factory = factory
+        self.size = size
+        self.dispose = dispose
+        self.name = name
+        self._ready: "asyncio.Queue[T]" = asyncio.Queue()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.failures = 0
+
+    @property
+    def ready_count(self) -> int:
+        """当前可直接取用的对象数量"""
+        return self._ready.qsize()
+
+    async def start(self) -> None:
+        """启动预热（可选，首次取用时也会自动触发补充）"""
+        self._closed = False
+        self._schedule_refill()
+
+    async def acquire(self) -> T:
+        """
+        取用一个对象
+
+        池中有预热对象时立即返回（命中），否则当场创建（未命中），
+        两种情况下都会触发后台补充
+        """
+        try:
+            item = self._ready.get_nowait()
+            self.hits += 1
+            logger.debug(
+                f"♨️ [预热池:{self.name}] 命中预热对象 | 剩余: {self._ready.qsize()}"
+            )
+        except asyncio.QueueEmpty:
+            self.misses += 1
+            logger.debug(f"🧊 [预热池:{self.name}] 未命中，同步创建对象")
+            item = await self._create()
+
+        self._schedule_refill()
+        return item
+
+    async def _create(self) -> T:
+        item = await self.factory()
+        self.created += 1
+        return item
+
+    def _schedule_refill(self) -> None:
+        """在后台补充预热对象"""
+        if self._closed or self.size <= 0:
+            return
+        if self._refill_task is not None and not self._refill_task.done():
+            return
+        self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self) -> None:
+        while not self._closed and self._ready.qsize() < self.size:
+            try:
+                item = await self._create()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"⚠️ [预热池:{self.name}] 预热对象创建失败: {e}")
+                return
+            if self._closed:
+                await self._dispose(item)
+                return
+            self._ready.put_nowait(item)
+        logger.debug(
+            f"♨️ [预热池:{self.name}] 预热完成 | 可用对象: {self._ready.qsize()}"
+        )
+
+    async def _dispose(self, item: T) -> None:
+        if self.dispose is None:
+            return
+        try:
+            await self.dispose(item)
+        except Exception as e:
+            logger.warning(f"⚠️ [预热池:{self.name}] 释放对象失败: {e}")
+
+    async def close(self) -> None:
+        """停止补充并释放所有未使用的对象"""
+        self._closed = True
+        if self._refill_task is not None and not self._refill_task.done():
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+        while not self._ready.empty():
+            await self._dispose(self._ready.get_nowait())
+        logger.info(f"🛑 [预热池:{self.name}] 预热池已关闭")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预热池统计信息"""
+        acquisitions = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": self.size,
+            "ready": self._ready.qsize(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / acquisitions, 4) if acquisitions else 0.0,
+            "created": self.created,
+            "failures": self.failures,
+        }
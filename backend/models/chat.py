@@ -20,6 +20,7 @@ class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
     system_message: Optional[str] = "你是一个有用的AI助手"
+    use_cache: bool = True  # 是否允许首轮消息使用响应缓存
 
 
 class ChatResponse(BaseModel):
@@ -246,6 +246,13 @@ class TestCaseStatistics(Model):
     total_feedbacks = fields.IntField(default=0, description="反馈总数")
     avg_rounds = fields.FloatField(default=0.0, description="平均轮次")
 
+    # 大模型用量统计
+    total_llm_calls = fields.IntField(default=0, description="大模型调用次数")
+    total_prompt_tokens = fields.BigIntField(default=0, description="输入 token 总数")
+    total_completion_tokens = fields.BigIntField(
+        default=0, description="输出 token 总数"
+    )
+
     # 时间戳
     created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
     updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
@@ -257,3 +264,92 @@ class TestCaseStatistics(Model):
 
     def __str__(self):
         return f"TestCaseStatistics({self.date})"
+
+
+class TestCaseStageCache(Model):
+    """测试用例流水线阶段结果缓存"""
+
+    id = fields.IntField(pk=True)
+    cache_key = fields.CharField(max_length=64, unique=True, description="缓存键")
+    stage = fields.CharField(max_length=50, description="流水线阶段")
+    model = fields.CharField(max_length=100, description="模型名称")
+    content = fields.TextField(description="阶段输出内容")
+    hit_count = fields.IntField(default=0, description="命中次数")
+
+    # 时间戳
+    created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
+    last_accessed = fields.DatetimeField(description="最后访问时间")
+
+    class Meta:
+        table = "testcase_stage_cache"
+        ordering = ["-last_accessed"]
+
+    def __str__(self):
+        return f"TestCaseStageCache({self.stage}: {self.cache_key[:12]})"
+
+
+class ConversationSnapshot(Model):
+    """对话状态快照，多个 worker 进程之间共享未完成对话的记忆和状态"""
+
+    id = fields.IntField(pk=True)
+    kind = fields.CharField(max_length=20, description="对话类型: testcase/chat")
+    conversation_id = fields.CharField(max_length=255, description="对话ID")
+    data = fields.JSONField(description="快照内容")
+
+    # 时间戳
+    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+
+    class Meta:
+        table = "conversation_snapshots"
+        unique_together = (("kind", "conversation_id"),)
+
+    def __str__(self):
+        return f"ConversationSnapshot({self.kind}: {self.conversation_id})"
+
+
+class TokenUsage(Model):
+    """大模型 token 用量，按日期、对话、阶段和模型汇总"""
+
+    id = fields.IntField(pk=True)
+    date = fields.DateField(description="统计日期")
+    user_id = fields.IntField(null=True, description="用户ID")
+    conversation_id = fields.CharField(max_length=255, description="对话ID")
+    stage = fields.CharField(max_length=50, description="流水线阶段或 chat")
+    model = fields.CharField(max_length=100, description="模型名称")
+
+    # 用量
+    calls = fields.IntField(default=0, description="调用次数")
+    prompt_tokens = fields.BigIntField(default=0, description="输入 token 数")
+    completion_tokens = fields.BigIntField(default=0, description="输出 token 数")
+    duration = fields.FloatField(default=0.0, description="调用总耗时（秒）")
+
+    # 时间戳
+    created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
+    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+
+    class Meta:
+        table = "token_usage"
+        unique_together = (("date", "conversation_id", "stage", "model"),)
+        indexes = (("user_id", "date"),)
+        ordering = ["-date"]
+
+    def __str__(self):
+        return f"TokenUsage({self.date} {self.conversation_id}: {self.stage})"
+
+
+class UserQuotaUsage(Model):
+    """用户每天的请求数和 token 用量，用于配额控制"""
+
+    id = fields.IntField(pk=True)
+    user_id = fields.IntField(description="用户ID")
+    date = fields.DateField(description="统计日期")
+    requests = fields.IntField(default=0, description="请求数")
+    tokens = fields.BigIntField(default=0, description="token 数")
+    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+
+    class Meta:
+        table = "user_quota_usage"
+        unique_together = (("user_id", "date"),)
+
+    def __str__(self):
+        return f"UserQuotaUsage({self.user_id}: {self.date})"
@@ -0,0 +1,123 @@
+"""
+AssistantAgent 复用池
+同一角色（名称、模型客户端、系统提示词相同）的 AssistantAgent 在任务之间复用，
+归还时重置对话上下文，避免每条消息都重新构建智能体
+"""
+
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from autogen_agentchat.agents import AssistantAgent
+from autogen_core import CancellationToken
+from loguru import logger
+
+
+class AssistantAgentPool:
+    """单个角色的 AssistantAgent 池"""
+
+    def __init__(
+        self,
+        name: str,
+        model_client: Any,
+        system_message: str,
+        max_idle: int = 8,
+    ):
+        """
+        初始化智能体池
+
+        Args:
+            name: 智能体名称
+            model_client: 模型客户端
+            system_message: 系统提示词
+            max_idle: 最多保留的空闲智能体数量，超出的归还后直接丢弃
+        """
+        self.name = name
+        self.model_client = model_client
+        self.system_message = system_message
+        self.max_idle = max_idle
+        self._idle: List[AssistantAgent] = []
+        self.in_use = 0
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _create(self) -> AssistantAgent:
+        self.created += 1
+        return AssistantAgent(
+            name=self.name,
+            model_client=self.model_client,
+            system_message=self.system_message,
+            model_client_stream=True,
+        )
+
+    def acquire(self) -> AssistantAgent:
+        """取用一个空闲智能体，没有空闲智能体时新建"""
+        if self._idle:
+            assistant = self._idle.pop()
+            self.reused += 1
+        else:
+            assistant = self._create()
+        self.in_use += 1
+        return assistant
+
+    async def release(self, assistant: AssistantAgent) -> None:
+        """重置智能体上下文并归还到池中，重置失败时丢弃"""
+        self.in_use -= 1
+        try:
+            await assistant.on_reset(CancellationToken())
+        except Exception as e:
+            self.discarded += 1
+            logger.warning(f"⚠️ [智能体池:{self.name}] 智能体重置失败，已丢弃: {e}")
+            return
+
+        if len(self._idle) >= self.max_idle:
+            self.discarded += 1
+            return
+        self._idle.append(assistant)
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[AssistantAgent]:
+        """在上下文内独占使用一个智能体，退出时自动归还"""
+        assistant = self.acquire()
+        try:
+            yield assistant
+        finally:
+            await self.release(assistant)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取池统计信息"""
+        return {
+            "name": self.name,
+            "idle": len(self._idle),
+            "in_use": self.in_use,
+            "created": self.created,
+            "reused": self.reused,
+            "discarded": self.discarded,
+        }
+
+
+_pools: Dict[Tuple[str, int, str], AssistantAgentPool] = {}
+
+
+def get_assistant_pool(
+    name: str, model_client: Any, system_message: str
+) -> AssistantAgentPool:
+    """
+    获取角色对应的智能体池，不存在时创建
+
+    同一进程内所有运行时共享同一角色的池
+    """
+    prompt_digest = hashlib.sha256(system_message.encode("utf-8")).hexdigest()
+    key = (name, id(model_client), prompt_digest)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = AssistantAgentPool(name, model_client, system_message)
+        _pools[key] = pool
+        logger.debug(f"🧩 [智能体池] 创建角色智能体池: {name}")
+    return pool
+
+
+def get_assistant_pool_stats() -> List[Dict[str, Any]]:
+    """获取所有智能体池的统计信息"""
+    return [pool.get_stats() for pool in _pools.values()]
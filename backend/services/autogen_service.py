@@ -1,11 +1,15 @@
 import asyncio
+import hashlib
 import os
 import sys
+import time
 import uuid
-from typing import AsyncGenerator, Optional
+from array import array
+from typing import AsyncGenerator, List, Optional, Tuple
 
 from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.messages import ModelClientStreamingChunkEvent
+from autogen_agentchat.messages import ModelClientStreamingChunkEvent, TextMessage
+from autogen_core.models import AssistantMessage, RequestUsage, UserMessage
 from loguru import logger
 
 # 添加项目根目录到 Python 路径
@@ -13,14 +17,29 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 sys.path.append(project_root)
 
 # 使用 backend 目录下的配置
+from backend.conf.config import settings
+from backend.core.cache import LRUTTLCache
 from backend.core.llm import get_openai_model_client
+from backend.core.llm_ratelimit import PRIORITY_INTERACTIVE, with_priority
+from backend.core.llm_resilience import for_stage
+from backend.core.logger import hot_log, truncate
+from backend.core.metrics import LLMStreamObserver
+from backend.core.profiler import approx_size
+from backend.services.conversation_store import ConversationStore, conversation_store
+from backend.services.usage_service import resolve_usage, usage_recorder
 
 
 class AutoGenService:
     """AutoGen 服务类"""
 
     def __init__(
-        self, max_agents: int = 100, cleanup_interval: int = 3600, agent_ttl: int = 7200
+        self,
+        max_agents: int = 100,
+        cleanup_interval: int = 3600,
+        agent_ttl: int = 7200,
+        response_cache: Optional[LRUTTLCache] = None,
+        cache_chunk_delay: float = 0.0,
+        store: Optional[ConversationStore] = None,
     ):
         """
         初始化 AutoGen 服务
@@ -29,14 +48,21 @@ class AutoGenService:
             max_agents: 最大 Agent 数量
             cleanup_interval: 清理检查间隔（秒）
             agent_ttl: Agent 生存时间（秒）
+            response_cache: 首轮对话响应缓存，为 None 时不缓存
+            cache_chunk_delay: 回放缓存响应时每个数据块之间的间隔（秒）
+            store: 对话状态存储，每轮结束后保存 Agent 上下文，为 None 时不保存
         """
         self.agents = {}
         self.max_agents = max_agents
         self.cleanup_interval = cleanup_interval
         self.agent_ttl = agent_ttl
+        self.response_cache = response_cache
+        self.cache_chunk_delay = cache_chunk_delay
+        self.store = store
+        self.restored = 0
         self._last_cleanup = asyncio.get_event_loop().time()
         logger.info(
-            f"AutoGen 服务初始化 | 最大Agent数: {max_agents} | TTL: {agent_ttl}s"
+            f"AutoGen 服务初始化 | 最大Agent数: {max_agents} | TTL: {agent_ttl}s | 响应缓存: {'开启' if response_cache else '关闭'}"
         )
 
     def create_agent(
@@ -49,7 +75,9 @@ class AutoGenService:
             safe_name = f"assistant_{conversation_id.replace('-', '_')}"
             agent = AssistantAgent(
                 name=safe_name,
-                model_client=get_openai_model_client(),
+                model_client=with_priority(
+                    for_stage(get_openai_model_client(), "chat"), PRIORITY_INTERACTIVE
+                ),
                 system_message=system_message,
                 model_client_stream=True,
             )
@@ -130,10 +158,13 @@ class AutoGenService:
         message: str,
         conversation_id: Optional[str] = None,
         system_message: str = "你是一个有用的AI助手",
+        use_cache: bool = True,
+        user_id: Optional[int] = None,
     ) -> AsyncGenerator[str, None]:
         """流式聊天"""
         if not conversation_id:
             conversation_id = str(uuid.uuid4())
+        usage_recorder.bind_user(conversation_id, user_id)
 
         logger.info(
             f"开始流式聊天 | 对话ID: {conversation_id} | 消息: {message[:100]}..."
@@ -141,9 +172,27 @@ class AutoGenService:
 
         # 执行自动清理
         self._auto_cleanup()
+        await self._restore_agent(conversation_id)
+
+        # 只有新对话的首轮消息才使用响应缓存，后续轮次依赖上下文
+        cache_key = None
+        if use_cache and self._is_first_turn(conversation_id):
+            cache_key = self._make_cache_key(system_message, message)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"命中响应缓存 | 对话ID: {conversation_id}")
+                async for chunk in self._replay_cached_response(
+                    conversation_id, system_message, message, cached
+                ):
+                    yield chunk
+                return
 
         agent = self.create_agent(conversation_id, system_message)
 
+        chunks: List[str] = []
+        observer = LLMStreamObserver("chat")
+        completion_tokens = None
+        prompt_tokens = None
         try:
             # 获取流式响应
             logger.debug(f"调用 Agent 流式响应 | 对话ID: {conversation_id}")
@@ -153,11 +202,26 @@ class AutoGenService:
             async for item in result:
                 if isinstance(item, ModelClientStreamingChunkEvent):
                     if item.content:
+                        observer.on_chunk()
                         chunk_count += 1
-                        logger.debug(
-                            f"收到流式数据块 {chunk_count} | 对话ID: {conversation_id} | 内容: {item.content[:50]}..."
+                        chunks.append(item.content)
+                        hot_log(
+                            "DEBUG",
+                            "autogen.chat_stream.chunk",
+                            "收到流式数据块 {} | 对话ID: {} | 内容: {}",
+                            chunk_count,
+                            conversation_id,
+                            truncate(item.content, 50),
                         )
                         yield item.content
+                elif isinstance(item, TextMessage) and item.models_usage:
+                    completion_tokens = item.models_usage.completion_tokens
+                    prompt_tokens = item.models_usage.prompt_tokens
+
+            observer.finish(completion_tokens)
+            if cache_key and chunks:
+                self._store_cached_response(cache_key, chunks)
+            await self._save_agent(conversation_id, system_message)
 
             logger.success(
                 f"流式聊天完成 | 对话ID: {conversation_id} | 总块数: {chunk_count}"
@@ -166,16 +230,33 @@ class AutoGenService:
         except Exception as e:
             logger.error(f"流式聊天失败 | 对话ID: {conversation_id} | 错误: {e}")
             yield f"错误: {str(e)}"
+        finally:
+            # 客户端中途断开或模型出错时也要记录已经消耗的用量
+            usage_recorder.record(
+                conversation_id,
+                "chat",
+                settings.aimodel.model,
+                resolve_usage(
+                    prompt_tokens,
+                    completion_tokens,
+                    system_message + message,
+                    "".join(chunks),
+                ),
+                time.perf_counter() - observer.started,
+            )
 
     async def chat(
         self,
         message: str,
         conversation_id: Optional[str] = None,
         system_message: str = "你是一个有用的AI助手",
+        use_cache: bool = True,
+        user_id: Optional[int] = None,
     ) -> tuple[str, str]:
         """非流式聊天"""
         if not conversation_id:
             conversation_id = str(uuid.uuid4())
+        usage_recorder.bind_user(conversation_id, user_id)
 
         logger.info(
             f"开始普通聊天 | 对话ID: {conversation_id} | 消息: {message[:100]}..."
@@ -183,13 +264,44 @@ class AutoGenService:
 
         # 执行自动清理
         self._auto_cleanup()
+        await self._restore_agent(conversation_id)
+
+        cache_key = None
+        if use_cache and self._is_first_turn(conversation_id):
+            cache_key = self._make_cache_key(system_message, message)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"命中响应缓存 | 对话ID: {conversation_id}")
+                response = "".join(
+                    [
+                        chunk
+                        async for chunk in self._replay_cached_response(
+                            conversation_id, system_message, message, cached, delay=0
+                        )
+                    ]
+                )
+                return response, conversation_id
 
         agent = self.create_agent(conversation_id, system_message)
 
         try:
             logger.debug(f"调用 Agent 普通响应 | 对话ID: {conversation_id}")
+            started = time.perf_counter()
             result = await agent.run(task=message)
+            usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+            for item in result.messages:
+                if item.models_usage:
+                    usage.prompt_tokens += item.models_usage.prompt_tokens
+                    usage.completion_tokens += item.models_usage.completion_tokens
+            usage_recorder.record(
+                conversation_id,
+                "chat",
+                settings.aimodel.model,
+                usage,
+                time.perf_counter() - started,
+            )
             response = str(result)
+            await self._save_agent(conversation_id, system_message)
             logger.success(
                 f"普通聊天完成 | 对话ID: {conversation_id} | 响应长度: {len(response)}"
             )
@@ -198,8 +310,111 @@ class AutoGenService:
             logger.error(f"普通聊天失败 | 对话ID: {conversation_id} | 错误: {e}")
             return f"错误: {str(e)}", conversation_id
 
-    def clear_conversation(self, conversation_id: str):
-        """清除对话"""
+    async def _restore_agent(self, conversation_id: str) -> None:
+        """
+        当前进程没有该对话的 Agent 时按对话快照恢复上下文
+
+        对话的上一轮由其他 worker 处理，或 Agent 已被淘汰时使用
+        """
+        if self.store is None or conversation_id in self.agents:
+            return
+        snapshot = await self.store.load("chat", conversation_id)
+        if snapshot is None:
+            return
+        agent = self.create_agent(conversation_id, snapshot["system_message"])
+        try:
+            await agent.load_state(snapshot["agent_state"])
+        except Exception as e:
+            logger.warning(
+                f"恢复 Agent 上下文失败 | 对话ID: {conversation_id} | 错误: {e}"
+            )
+            del self.agents[conversation_id]
+            return
+        self.restored += 1
+        logger.info(f"已从对话存储恢复 Agent | 对话ID: {conversation_id}")
+
+    async def _save_agent(self, conversation_id: str, system_message: str) -> None:
+        """保存 Agent 上下文，供其他 worker 继续该对话"""
+        if self.store is None or conversation_id not in self.agents:
+            return
+        agent = self.agents[conversation_id]["agent"]
+        await self.store.save(
+            "chat",
+            conversation_id,
+            {
+                "system_message": system_message,
+                "agent_state": await agent.save_state(),
+            },
+        )
+
+    def _is_first_turn(self, conversation_id: str) -> bool:
+        """是否为可以使用响应缓存的新对话首轮消息"""
+        return self.response_cache is not None and conversation_id not in self.agents
+
+    @staticmethod
+    def _make_cache_key(system_message: Optional[str], message: str) -> str:
+        """根据系统消息和用户消息计算响应缓存键"""
+        digest = hashlib.sha256()
+        digest.update((system_message or "").encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(message.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _store_cached_response(self, cache_key: str, chunks: List[str]) -> None:
+        """
+        缓存完整响应
+
+        只保存拼接后的文本和原始数据块的结束位置，回放时按原始分块输出
+        """
+        text = "".join(chunks)
+        ends = array("I")
+        position = 0
+        for chunk in chunks:
+            position += len(chunk)
+            ends.append(position)
+        size = len(text.encode("utf-8")) + ends.itemsize * len(ends)
+        if self.response_cache.set(cache_key, (text, ends), size=size):
+            logger.debug(f"响应已缓存 | 长度: {len(text)} | 块数: {len(ends)}")
+
+    async def _replay_cached_response(
+        self,
+        conversation_id: str,
+        system_message: str,
+        message: str,
+        cached: Tuple[str, array],
+        delay: Optional[float] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        回放缓存的响应
+
+        同时创建对话 Agent 并写入本轮问答，保证后续轮次仍有完整上下文
+        """
+        text, ends = cached
+        agent = self.create_agent(conversation_id, system_message)
+        await agent.model_context.add_message(
+            UserMessage(content=message, source="user")
+        )
+        await agent.model_context.add_message(
+            AssistantMessage(content=text, source=agent.name)
+        )
+        await self._save_agent(conversation_id, system_message)
+
+        delay = self.cache_chunk_delay if delay is None else delay
+        start = 0
+        for end in ends:
+            yield text[start:end]
+            start = end
+            # 让出事件循环，模拟真实的流式节奏
+            await asyncio.sleep(delay)
+
+        logger.success(
+            f"缓存响应回放完成 | 对话ID: {conversation_id} | 总块数: {len(ends)}"
+        )
+
+    async def clear_conversation(self, conversation_id: str):
+        """清除对话和对话快照"""
+        if self.store is not None:
+            await self.store.delete("chat", conversation_id)
         if conversation_id in self.agents:
             logger.info(f"清除对话 | 对话ID: {conversation_id}")
             del self.agents[conversation_id]
@@ -226,6 +441,33 @@ class AutoGenService:
             "max_agents": self.max_agents,
             "agent_ttl": self.agent_ttl,
             "cleanup_interval": self.cleanup_interval,
+            "response_cache": (
+                self.response_cache.get_stats() if self.response_cache else None
+            ),
+            "conversation_store": (
+                {**self.store.get_stats(), "restored": self.restored}
+                if self.store is not None
+                else None
+            ),
+        }
+
+    def get_memory_usage(self) -> dict:
+        """估算每个对话的 Agent 上下文（历史消息）占用的内存"""
+        conversations = {}
+        for conversation_id, agent_info in list(self.agents.items()):
+            model_context = getattr(agent_info["agent"], "_model_context", None)
+            conversations[conversation_id] = {
+                "model_context": approx_size(model_context) if model_context else 0
+            }
+        return {
+            "total_agents": len(self.agents),
+            "total_bytes": sum(
+                item["model_context"] for item in conversations.values()
+            ),
+            "response_cache_entries": (
+                len(self.response_cache) if self.response_cache else 0
+            ),
+            "conversations": conversations,
         }
 
     def force_cleanup(self):
@@ -234,6 +476,8 @@ class AutoGenService:
         self._cleanup_expired_agents()
         if len(self.agents) > self.max_agents:
             self._cleanup_oldest_agents(self.max_agents // 2)
+        if self.response_cache:
+            self.response_cache.purge_expired()
         logger.info("强制清理完成")
 
 
@@ -251,10 +495,24 @@ def create_autogen_service():
         )
         agent_ttl = getattr(settings, "autogen", {}).get("agent_ttl", 7200)
 
+        # 首轮对话响应缓存配置
+        cache_config = getattr(settings, "autogen", {}).get("response_cache", {}) or {}
+        response_cache = None
+        if cache_config.get("enabled", True):
+            response_cache = LRUTTLCache(
+                max_entries=cache_config.get("max_entries", 500),
+                max_bytes=cache_config.get("max_bytes", 32 * 1024 * 1024),
+                ttl=cache_config.get("ttl", 3600),
+                name="chat_response",
+            )
+
         return AutoGenService(
             max_agents=max_agents,
             cleanup_interval=cleanup_interval,
             agent_ttl=agent_ttl,
+            response_cache=response_cache,
+            cache_chunk_delay=cache_config.get("chunk_delay", 0.0),
+            store=conversation_store,
         )
     except ImportError:
         logger.warning("无法导入配置，使用默认参数")
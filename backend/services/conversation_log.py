@@ -0,0 +1,169 @@
+"""
+对话事件日志
+按列存储智能体发送到结果收集器的消息：内容拼接在分段文本缓冲区中，
+来源和消息类型做字符串驻留，时间戳使用单调时钟偏移量，
+只有在需要时（如 /history 接口）才还原成完整的消息字典
+"""
+
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+# 未压缩的内容块达到该数量后合并成一个文本分段
+COMPACT_THRESHOLD = 256
+
+
+class ConversationEventLog:
+    """单个对话的只追加事件日志"""
+
+    def __init__(self, conversation_id: str):
+        self.conversation_id = conversation_id
+        self._started_wall = time.time()
+        self._started_monotonic = time.monotonic()
+
+        # 事件列
+        self._starts = array("Q")  # 内容在文本缓冲区中的起始偏移
+        self._sources = array("H")  # 来源名称下标
+        self._types = array("H")  # 消息类型下标
+        self._rounds = array("H")
+        self._finals = bytearray()
+        self._timestamps = array("d")  # 相对创建时刻的秒数
+
+        # 驻留的来源和消息类型
+        self._names: List[str] = []
+        self._name_index: Dict[str, int] = {}
+
+        # 文本缓冲区：已合并的分段 + 尚未合并的内容块（与事件一一对应）
+        self._segments: List[str] = []
+        self._segment_starts: List[int] = []
+        self._pending: List[str] = []
+        self._pending_first = 0  # 第一个未合并内容块对应的事件下标
+        self._length = 0
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def _intern(self, name: str) -> int:
+        index = self._name_index.get(name)
+        if index is None:
+            index = len(self._names)
+            self._names.append(name)
+            self._name_index[name] = index
+        return index
+
+    def append(
+        self,
+        source: str,
+        content: str,
+        message_type: str,
+        is_final: bool = False,
+        round_number: int = 1,
+    ) -> int:
+        """
+        追加一条事件
+
+        Returns:
+            int: 追加后的事件总数
+        """
+        self._starts.append(self._length)
+        self._sources.append(self._intern(source))
+        self._types.append(self._intern(message_type))
+        self._rounds.append(round_number)
+        self._finals.append(1 if is_final else 0)
+        self._timestamps.append(time.monotonic() - self._started_monotonic)
+
+        self._pending.append(content)
+        self._length += len(content)
+        if len(self._pending) >= COMPACT_THRESHOLD:
+            self._compact()
+        return len(self._starts)
+
+    def _compact(self) -> None:
+        """把未合并的内容块合并成一个文本分段"""
+        if not self._pending:
+            return
+        self._segment_starts.append(self._starts[self._pending_first])
+        self._segments.append("".join(self._pending))
+        self._pending_first += len(self._pending)
+        self._pending = []
+
+    def content(self, index: int) -> str:
+        """获取事件内容"""
+        if index >= self._pending_first:
+            return self._pending[index - self._pending_first]
+        start = self._starts[index]
+        end = self._starts[index + 1] if index + 1 < len(self) else self._length
+        segment_index = bisect_right(self._segment_starts, start) - 1
+        offset = self._segment_starts[segment_index]
+        return self._segments[segment_index][start - offset : end - offset]
+
+    def source(self, index: int) -> str:
+        """获取事件来源"""
+        return self._names[self._sources[index]]
+
+    def message_type(self, index: int) -> str:
+        """获取事件消息类型"""
+        return self._names[self._types[index]]
+
+    def is_final(self, index: int) -> bool:
+        """事件是否为最终消息"""
+        return bool(self._finals[index])
+
+    def has_final(self, start: int = 0) -> bool:
+        """从 start 开始是否存在最终消息"""
+        return self._finals.find(1, max(start, 0)) != -1
+
+    def timestamp(self, index: int) -> str:
+        """获取事件的 ISO 时间"""
+        return datetime.fromtimestamp(
+            self._started_wall + self._timestamps[index]
+        ).isoformat()
+
+    def get(self, index: int) -> Dict[str, Any]:
+        """还原单条事件为消息字典"""
+        return {
+            "content": self.content(index),
+            "agent_type": "agent",
+            "agent_name": self.source(index),
+            "conversation_id": self.conversation_id,
+            "round_number": self._rounds[index],
+            "timestamp": self.timestamp(index),
+            "is_complete": self.is_final(index),
+            "message_type": self.message_type(index),
+        }
+
+    def iter_messages(self, start: int = 0) -> Iterator[Dict[str, Any]]:
+        """从 start 开始逐条还原消息字典"""
+        for index in range(start, len(self)):
+            yield self.get(index)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """还原所有事件为消息字典列表"""
+        return list(self.iter_messages())
+
+    def nbytes(self) -> int:
+        """估算日志大小（文本按字符数计，不含驻留字符串）"""
+        columns = (
+            self._starts,
+            self._sources,
+            self._types,
+            self._rounds,
+            self._timestamps,
+        )
+        size = sum(column.itemsize * len(column) for column in columns)
+        size += len(self._finals)
+        size += sum(len(segment) for segment in self._segments)
+        size += sum(len(chunk) for chunk in self._pending)
+        return size
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取日志统计信息"""
+        return {
+            "events": len(self),
+            "text_length": self._length,
+            "segments": len(self._segments),
+            "pending_chunks": len(self._pending),
+            "approx_bytes": self.nbytes(),
+        }
@@ -0,0 +1,89 @@
+"""
+对话记忆存储
+以原生字典保存对话过程中的用户输入、反馈和各阶段结果，
+并按记录类型和轮次建立索引，读取历史时无需反复解析 JSON
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class ConversationMemory:
+    """单个对话的记忆存储"""
+
+    def __init__(self, conversation_id: str):
+        self.conversation_id = conversation_id
+        self._records: List[Dict[str, Any]] = []
+        self._by_type: Dict[str, List[int]] = {}
+        self._by_round: Dict[int, List[int]] = {}
+        self._by_type_round: Dict[Tuple[str, int], List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, data: Dict[str, Any]) -> None:
+        """
+        追加一条记录
+
+        保存的是调用方字典的浅拷贝，之后修改原字典不会影响已保存的记录
+
+        Args:
+            data: 记录内容，通常包含 type 和 round_number 字段
+        """
+        record = dict(data)
+        index = len(self._records)
+        self._records.append(record)
+        entry_type = record.get("type", "unknown")
+        self._by_type.setdefault(entry_type, []).append(index)
+        round_number = record.get("round_number")
+        if round_number is not None:
+            self._by_round.setdefault(round_number, []).append(index)
+            self._by_type_round.setdefault((entry_type, round_number), []).append(index)
+
+    def query(
+        self,
+        entry_type: Optional[str] = None,
+        round_number: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        按类型和轮次查询记录
+
+        Args:
+            entry_type: 记录类型，为空时不过滤
+            round_number: 轮次，为空时不过滤
+            limit: 只返回最近的 limit 条
+
+        Returns:
+            List[Dict[str, Any]]: 按写入顺序排列的记录（调用方不应修改）
+        """
+        if entry_type is None and round_number is None:
+            indexes = None
+        elif round_number is None:
+            indexes = self._by_type.get(entry_type, [])
+        elif entry_type is None:
+            indexes = self._by_round.get(round_number, [])
+        else:
+            indexes = self._by_type_round.get((entry_type, round_number), [])
+
+        if indexes is None:
+            return self._records[-limit:] if limit else self._records[:]
+
+        if limit:
+            indexes = indexes[-limit:]
+        return [self._records[index] for index in indexes]
+
+    def latest(self, entry_type: str) -> Optional[Dict[str, Any]]:
+        """获取指定类型的最新一条记录"""
+        indexes = self._by_type.get(entry_type)
+        return self._records[indexes[-1]] if indexes else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取记录统计信息"""
+        return {
+            "total": len(self._records),
+            "types": {
+                entry_type: len(indexes)
+                for entry_type, indexes in self._by_type.items()
+            },
+            "rounds": sorted(self._by_round),
+        }
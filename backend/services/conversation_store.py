@@ -0,0 +1,235 @@
+"""
+对话状态存储
+智能体运行时只存在于单个 worker 进程的内存中，多 worker 部署时同一对话的后续请求
+（例如测试用例的反馈、聊天的下一轮消息）可能落到另一个 worker 上。
+各阶段结束后把可序列化的对话快照（记忆、状态、Agent 上下文）写入存储，
+当前进程没有该对话时再按快照恢复
+
+- memory: 进程内 LRU，只在单 worker 下生效，Agent 被淘汰后仍可恢复上下文
+- sqlite: 写入应用数据库（Tortoise 默认开启 WAL），同一台机器上的所有 worker 共享
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from loguru import logger
+from tortoise import timezone
+
+from backend.models.testcase import ConversationSnapshot
+
+
+class ConversationStore:
+    """对话状态存储基类，快照必须可以 JSON 序列化"""
+
+    backend = "none"
+
+    def __init__(self, ttl: int = 86400):
+        """
+        Args:
+            ttl: 快照有效期（秒），超过后按不存在处理
+        """
+        self.ttl = ttl
+        self.loads = 0
+        self.hits = 0
+        self.saves = 0
+        self.deletes = 0
+        self.errors = 0
+
+    async def load(self, kind: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        读取对话快照
+
+        Args:
+            kind: 对话类型（testcase/chat）
+            conversation_id: 对话ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 快照内容，不存在、已过期或读取失败时返回 None
+        """
+        self.loads += 1
+        try:
+            snapshot = await self._load(kind, conversation_id)
+        except Exception as e:
+            # 存储不可用时按不存在处理，不影响当前进程内的对话
+            self.errors += 1
+            logger.warning(
+                f"⚠️ [对话存储] 读取快照失败 | 类型: {kind} | 对话ID: {conversation_id} | 错误: {e}"
+            )
+            return None
+        if snapshot is not None:
+            self.hits += 1
+        return snapshot
+
+    async def save(
+        self, kind: str, conversation_id: str, snapshot: Dict[str, Any]
+    ) -> None:
+        """写入对话快照，覆盖同一对话之前的快照"""
+        try:
+            await self._save(kind, conversation_id, snapshot)
+            self.saves += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(
+                f"⚠️ [对话存储] 写入快照失败 | 类型: {kind} | 对话ID: {conversation_id} | 错误: {e}"
+            )
+
+    async def delete(self, kind: str, conversation_id: str) -> None:
+        """删除对话快照"""
+        try:
+            await self._delete(kind, conversation_id)
+            self.deletes += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(
+                f"⚠️ [对话存储] 删除快照失败 | 类型: {kind} | 对话ID: {conversation_id} | 错误: {e}"
+            )
+
+    async def purge_expired(self) -> int:
+        """删除过期快照，返回删除数量"""
+        return 0
+
+    async def _load(self, kind: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def _save(
+        self, kind: str, conversation_id: str, snapshot: Dict[str, Any]
+    ) -> None:
+        raise NotImplementedError
+
+    async def _delete(self, kind: str, conversation_id: str) -> None:
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计信息"""
+        return {
+            "backend": self.backend,
+            "ttl": self.ttl,
+            "loads": self.loads,
+            "hits": self.hits,
+            "saves": self.saves,
+            "deletes": self.deletes,
+            "errors": self.errors,
+        }
+
+
+class MemoryConversationStore(ConversationStore):
+    """进程内对话状态存储，超过容量时淘汰最久未写入的快照"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 1000, ttl: int = 86400):
+        super().__init__(ttl=ttl)
+        self.max_entries = max_entries
+        # (对话类型, 对话ID) -> (写入时间, 快照)
+        self._snapshots: OrderedDict = OrderedDict()
+
+    async def _load(self, kind: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        key = (kind, conversation_id)
+        entry = self._snapshots.get(key)
+        if entry is None:
+            return None
+        updated_at, snapshot = entry
+        if updated_at < datetime.now() - timedelta(seconds=self.ttl):
+            del self._snapshots[key]
+            return None
+        return snapshot
+
+    async def _save(
+        self, kind: str, conversation_id: str, snapshot: Dict[str, Any]
+    ) -> None:
+        key = (kind, conversation_id)
+        self._snapshots[key] = (datetime.now(), snapshot)
+        self._snapshots.move_to_end(key)
+        while len(self._snapshots) > self.max_entries:
+            self._snapshots.popitem(last=False)
+
+    async def _delete(self, kind: str, conversation_id: str) -> None:
+        self._snapshots.pop((kind, conversation_id), None)
+
+    async def purge_expired(self) -> int:
+        expire_before = datetime.now() - timedelta(seconds=self.ttl)
+        expired = [
+            key
+            for key, (updated_at, _) in self._snapshots.items()
+            if updated_at < expire_before
+        ]
+        for key in expired:
+            del self._snapshots[key]
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats.update({"entries": len(self._snapshots), "max_entries": self.max_entries})
+        return stats
+
+
+class SQLiteConversationStore(ConversationStore):
+    """基于应用数据库的对话状态存储，多个 worker 进程共享"""
+
+    backend = "sqlite"
+
+    async def _load(self, kind: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        entry = await ConversationSnapshot.get_or_none(
+            kind=kind, conversation_id=conversation_id
+        )
+        if entry is None:
+            return None
+        # updated_at 由 Tortoise 按 timezone.now() 写入，比较时使用同一时钟
+        if entry.updated_at < timezone.now() - timedelta(seconds=self.ttl):
+            await entry.delete()
+            logger.debug(
+                f"🗑️ [对话存储] 快照已过期 | 类型: {kind} | 对话ID: {conversation_id}"
+            )
+            return None
+        return entry.data
+
+    async def _save(
+        self, kind: str, conversation_id: str, snapshot: Dict[str, Any]
+    ) -> None:
+        await ConversationSnapshot.update_or_create(
+            defaults={"data": snapshot}, kind=kind, conversation_id=conversation_id
+        )
+
+    async def _delete(self, kind: str, conversation_id: str) -> None:
+        await ConversationSnapshot.filter(
+            kind=kind, conversation_id=conversation_id
+        ).delete()
+
+    async def purge_expired(self) -> int:
+        expire_before = timezone.now() - timedelta(seconds=self.ttl)
+        try:
+            deleted = await ConversationSnapshot.filter(
+                updated_at__lt=expire_before
+            ).delete()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️ [对话存储] 清理过期快照失败: {e}")
+            return 0
+        if deleted:
+            logger.info(f"🗑️ [对话存储] 已清理过期快照: {deleted} 条")
+        return deleted
+
+
+def create_conversation_store() -> ConversationStore:
+    """根据配置创建对话状态存储"""
+    try:
+        from backend.conf.config import settings
+
+        store_config = getattr(settings, "conversation_store", {}) or {}
+        backend = store_config.get("backend", "memory")
+        ttl = store_config.get("ttl", 86400)
+        if backend == "sqlite":
+            store: ConversationStore = SQLiteConversationStore(ttl=ttl)
+        else:
+            store = MemoryConversationStore(
+                max_entries=store_config.get("max_entries", 1000), ttl=ttl
+            )
+        logger.info(f"对话状态存储初始化 | 后端: {store.backend} | TTL: {ttl}s")
+        return store
+    except ImportError:
+        logger.warning("无法导入配置，对话状态存储使用进程内存储")
+        return MemoryConversationStore()
+
+
+conversation_store = create_conversation_store()
@@ -0,0 +1,383 @@
+"""
+用户配额控制
+按用户限制每天、每月的请求数和 token 用量，超出后返回 429 并告知多久后重置。
+计数保存在内存中（数据库中的已有用量 + 本进程尚未写库的增量），
+后台任务定期把增量写入 user_quota_usage 表，多个进程通过数据库汇总彼此的用量
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from fastapi import HTTPException
+from loguru import logger
+
+from backend.core.batch_flush import PeriodicFlusher, upsert_increments
+from backend.core.metrics import registry
+from backend.models.testcase import UserQuotaUsage
+
+quota_rejected_total = registry.counter(
+    "quota_rejected_total", "因超出用户配额被拒绝的请求数", ("endpoint", "limit")
+)
+
+# 配额项的显示名称
+QUOTA_LABELS = {
+    "daily_tokens": "每日 token",
+    "daily_requests": "每日请求",
+    "monthly_tokens": "每月 token",
+    "monthly_requests": "每月请求",
+}
+
+
+@dataclass
+class QuotaLimits:
+    """单个用户的配额，0 表示不限"""
+
+    daily_tokens: int = 0
+    daily_requests: int = 0
+    monthly_tokens: int = 0
+    monthly_requests: int = 0
+
+    @classmethod
+    def from_config(
+        cls, config: Mapping[str, Any], base: Optional["QuotaLimits"] = None
+    ) -> "QuotaLimits":
+        """从配置创建配额，未配置的项沿用 base"""
+        values = {
+            str(key).lower(): value
+            for key, value in (config or {}).items()
+            if str(key).lower() in QUOTA_LABELS
+        }
+        limits = cls(**(base.__dict__ if base else {}))
+        for name, value in values.items():
+            setattr(limits, name, int(value or 0))
+        return limits
+
+    @property
+    def unlimited(self) -> bool:
+        return not any(getattr(self, f.name) for f in fields(self))
+
+
+def next_reset(period: str, now: Optional[datetime] = None) -> datetime:
+    """配额周期的下一次重置时间：daily 为次日零点，monthly 为下月一日零点"""
+    now = now or datetime.now()
+    today = datetime.combine(now.date(), datetime.min.time())
+    if period == "daily":
+        return today + timedelta(days=1)
+    if now.month == 12:
+        return today.replace(year=now.year + 1, month=1, day=1)
+    return today.replace(month=now.month + 1, day=1)
+
+
+def format_duration(seconds: float) -> str:
+    """把秒数格式化为便于阅读的时长"""
+    seconds = max(1, math.ceil(seconds))
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    if days:
+        return f"{days}天{hours}小时"
+    if hours:
+        return f"{hours}小时{minutes}分钟"
+    if minutes:
+        return f"{minutes}分钟"
+    return f"{secs}秒"
+
+
+class QuotaManager:
+    """用户配额管理器"""
+
+    def __init__(
+        self,
+        limits: Optional[QuotaLimits] = None,
+        overrides: Optional[Dict[int, QuotaLimits]] = None,
+        flush_interval: float = 10.0,
+        max_users: int = 10000,
+    ):
+        """
+        初始化配额管理器
+
+        Args:
+            limits: 所有用户的默认配额
+            overrides: 按用户ID单独设置的配额
+            flush_interval: 用量写库和从数据库刷新的间隔（秒）
+            max_users: 内存中最多缓存多少个用户的已有用量
+        """
+        self.limits = limits or QuotaLimits()
+        self.overrides = overrides or {}
+        self.enabled = not (
+            self.limits.unlimited
+            and all(limits.unlimited for limits in self.overrides.values())
+        )
+        self.flush_interval = flush_interval
+        self.max_users = max_users
+        # (用户ID, 日期) -> 尚未写库的请求数和 token 数
+        self._pending: Dict[Tuple[int, date], Dict[str, int]] = {}
+        self._inflight: Dict[Tuple[int, date], Dict[str, int]] = {}
+        # 用户ID -> 数据库中本月每天的用量
+        self._bases: OrderedDict = OrderedDict()
+        self._flush_lock = asyncio.Lock()
+        self._flusher = PeriodicFlusher("用户配额", self.flush, flush_interval)
+        self.admitted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.errors = 0
+        self.last_flush: Optional[float] = None
+        logger.info(
+            f"用户配额初始化 | 启用: {self.enabled} | 默认配额: {self.limits} | "
+            f"单独配置的用户: {len(self.overrides)}"
+        )
+
+    def limits_for(self, user_id: int) -> QuotaLimits:
+        """获取用户的配额"""
+        return self.overrides.get(user_id, self.limits)
+
+    async def admit(self, user_id: Optional[int], endpoint: str = "") -> None:
+        """
+        请求开始前检查配额，放行时计入一次请求
+
+        Raises:
+            HTTPException: 未登录时返回 401；
+                超出配额时返回 429，Retry-After 为距离重置的秒数
+        """
+        if user_id is None:
+            # 配额按登录用户计算，匿名请求无法计入任何人的配额
+            raise HTTPException(status_code=401, detail="请先登录")
+        if not self.enabled:
+            return
+        limits = self.limits_for(user_id)
+        if limits.unlimited:
+            return
+        base = await self._fresh_base(user_id)
+        # 从这里到计入本次请求之间没有 await，同一用户的并发请求依次检查，不会读到同一个计数一起放行
+        usage = self._usage(user_id, base)
+
+        now = datetime.now()
+        exceeded = []
+        for name in QUOTA_LABELS:
+            quota = getattr(limits, name)
+            period, kind = name.split("_")
+            used = usage[period][kind]
+            if quota and used >= quota:
+                exceeded.append((next_reset(period, now), name, used, quota))
+        if exceeded:
+            # 多项超出时以最晚重置的一项为准
+            reset_at, name, used, quota = max(exceeded)
+            retry_after = max(1, math.ceil((reset_at - now).total_seconds()))
+            self.rejected += 1
+            quota_rejected_total.inc(endpoint=endpoint, limit=name)
+            message = (
+                f"已超出{QUOTA_LABELS[name]}配额（{used}/{quota}），"
+                f"{format_duration(retry_after)}后重置"
+            )
+            logger.warning(
+                f"🚫 [用户配额] 拒绝请求 | 用户ID: {user_id} | 接口: {endpoint} | {message}"
+            )
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "message": message,
+                    "limit": name,
+                    "used": used,
+                    "quota": quota,
+                    "reset_at": reset_at.isoformat(),
+                    "retry_after": retry_after,
+                },
+                headers={"Retry-After": str(retry_after)},
+            )
+
+        self._add(user_id, requests=1)
+        self.admitted += 1
+
+    def consume(self, user_id: Optional[int], tokens: int) -> None:
+        """记录用户消耗的 token（只写内存）"""
+        if not self.enabled or user_id is None or tokens <= 0:
+            return
+        self._add(user_id, tokens=tokens)
+
+    def _add(self, user_id: int, requests: int = 0, tokens: int = 0) -> None:
+        key = (user_id, date.today())
+        entry = self._pending.setdefault(key, {"requests": 0, "tokens": 0})
+        entry["requests"] += requests
+        entry["tokens"] += tokens
+
+    async def get_usage(self, user_id: int) -> Dict[str, Dict[str, int]]:
+        """
+        获取用户今天和本月的用量
+
+        Returns:
+            Dict[str, Dict[str, int]]: {"daily": {...}, "monthly": {...}}，各含 requests 和 tokens
+        """
+        return self._usage(user_id, await self._fresh_base(user_id))
+
+    async def _fresh_base(self, user_id: int) -> Dict[str, Any]:
+        """加载用户本月的已有用量，等待期间写库使其失效时重新加载，保证与内存中的增量一致"""
+        while True:
+            base = await self._load_base(user_id, date.today().replace(day=1))
+            if self._bases.get(user_id) is base:
+                return base
+
+    def _usage(self, user_id: int, base: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+        """按数据库中的用量加上尚未写库的增量计算今天和本月的用量"""
+        today = date.today()
+        month = today.replace(day=1)
+        usage = {
+            "daily": {"requests": 0, "tokens": 0},
+            "monthly": {"requests": 0, "tokens": 0},
+        }
+        days: List[Tuple[date, Mapping[str, int]]] = list(base["days"].items())
+        for pending in (self._inflight, self._pending):
+            days.extend(
+                (day, entry) for (uid, day), entry in pending.items() if uid == user_id
+            )
+        for day, entry in days:
+            if day < month:
+                continue
+            for kind in ("requests", "tokens"):
+                usage["monthly"][kind] += entry[kind]
+                if day == today:
+                    usage["daily"][kind] += entry[kind]
+        return usage
+
+    async def _load_base(self, user_id: int, month: date) -> Dict[str, Any]:
+        """加载数据库中用户本月的用量，超过刷新间隔后重新加载以汇总其他进程的用量"""
+        base = self._bases.get(user_id)
+        if base is not None and base["month"] == month:
+            # 写库期间不刷新，避免正在写入的增量被重复计算
+            if (
+                self._flush_lock.locked()
+                or time.monotonic() - base["loaded_at"] < self.flush_interval
+            ):
+                return base
+
+        rows = await UserQuotaUsage.filter(user_id=user_id, date__gte=month).values(
+            "date", "requests", "tokens"
+        )
+        base = {
+            "month": month,
+            "days": {
+                row["date"]: {"requests": row["requests"], "tokens": row["tokens"]}
+                for row in rows
+            },
+            "loaded_at": time.monotonic(),
+        }
+        self._bases[user_id] = base
+        self._bases.move_to_end(user_id)
+        while len(self._bases) > self.max_users:
+            self._bases.popitem(last=False)
+        return base
+
+    async def get_quota(self, user_id: int) -> Dict[str, Any]:
+        """获取用户的配额、已用量、剩余量和重置时间"""
+        limits = self.limits_for(user_id)
+        usage = await self.get_usage(user_id)
+        items = {}
+        for name in QUOTA_LABELS:
+            period, kind = name.split("_")
+            quota = getattr(limits, name)
+            used = usage[period][kind]
+            items[name] = {
+                "quota": quota,
+                "used": used,
+                "remaining": max(0, quota - used) if quota else None,
+                "reset_at": next_reset(period).isoformat(),
+            }
+        return {"user_id": user_id, "enabled": self.enabled, "quotas": items}
+
+    async def flush(self) -> int:
+        """
+        把内存中的用量增量写入数据库
+
+        Returns:
+            int: 写入的行数
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            self._inflight = pending
+            written = 0
+            failed = []
+            try:
+                for key, entry in pending.items():
+                    try:
+                        await self._write(key, entry)
+                        written += 1
+                    except Exception as e:
+                        self.errors += 1
+                        failed.append((key, entry))
+                        logger.warning(f"⚠️ [用户配额] 写入用量失败，稍后重试: {e}")
+            finally:
+                self._inflight = {}
+                for key, entry in failed:
+                    current = self._pending.setdefault(
+                        key, {"requests": 0, "tokens": 0}
+                    )
+                    current["requests"] += entry["requests"]
+                    current["tokens"] += entry["tokens"]
+                # 已写入的增量下次检查时从数据库重新加载
+                for user_id, _ in pending:
+                    self._bases.pop(user_id, None)
+
+            self.flushed += written
+            self.last_flush = time.time()
+            return written
+
+    @staticmethod
+    async def _write(key: Tuple[int, date], entry: Dict[str, int]) -> None:
+        user_id, day = key
+        await upsert_increments(
+            UserQuotaUsage, {"user_id": user_id, "date": day}, entry
+        )
+
+    def start(self) -> None:
+        """在当前事件循环中启动定期写库任务"""
+        if self.enabled:
+            self._flusher.start()
+
+    async def stop(self) -> None:
+        """停止定期写库并写入剩余用量"""
+        await self._flusher.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取配额管理器统计信息"""
+        return {
+            "enabled": self.enabled,
+            "limits": self.limits.__dict__,
+            "overrides": len(self.overrides),
+            "cached_users": len(self._bases),
+            "pending": len(self._pending),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "errors": self.errors,
+            "last_flush": self.last_flush,
+        }
+
+
+def create_quota_manager() -> QuotaManager:
+    """创建配额管理器实例"""
+    try:
+        from backend.conf.config import settings
+
+        quota_config = getattr(settings, "quota", {}) or {}
+        limits = QuotaLimits.from_config(quota_config)
+        overrides = {
+            int(user_id): QuotaLimits.from_config(user_config, base=limits)
+            for user_id, user_config in (quota_config.get("users") or {}).items()
+        }
+        return QuotaManager(
+            limits=limits,
+            overrides=overrides,
+            flush_interval=quota_config.get("flush_interval", 10.0),
+        )
+    except ImportError:
+        logger.warning("无法导入配置，用户配额使用默认参数")
+        return QuotaManager()
+
+
+quota_manager = create_quota_manager()
@@ -0,0 +1,170 @@
+"""
+测试用例流水线阶段结果缓存
+相同的阶段提示词、模型、系统提示词和输入会得到相同的缓存键，
+命中时直接返回上次的阶段输出，避免重复调用大模型
+缓存存储在 SQLite 中，按最后访问时间做 LRU 淘汰，并支持 TTL 过期
+"""
+
+import hashlib
+from datetime import timedelta
+from typing import Dict, Optional
+
+from loguru import logger
+from tortoise import timezone
+
+from backend.models.testcase import TestCaseStageCache
+
+
+class StageResultCache:
+    """阶段结果缓存"""
+
+    def __init__(
+        self, enabled: bool = False, max_entries: int = 1000, ttl: int = 7 * 86400
+    ):
+        """
+        初始化阶段结果缓存
+
+        Args:
+            enabled: 是否启用缓存（默认关闭，需要显式开启）
+            max_entries: 最大缓存条数，超过后按最后访问时间淘汰
+            ttl: 缓存有效期（秒）
+        """
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+        logger.info(
+            f"阶段结果缓存初始化 | 启用: {enabled} | 最大条数: {max_entries} | TTL: {ttl}s"
+        )
+
+    @staticmethod
+    def make_key(stage: str, model: str, system_prompt: str, task: str) -> str:
+        """根据阶段、模型、系统提示词和任务输入计算缓存键"""
+        digest = hashlib.sha256()
+        for part in (stage, model, system_prompt.strip(), task):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    async def get(self, cache_key: str) -> Optional[str]:
+        """
+        查询缓存
+
+        Args:
+            cache_key: 缓存键
+
+        Returns:
+            Optional[str]: 命中时返回阶段输出，否则返回 None
+        """
+        try:
+            entry = await TestCaseStageCache.get_or_none(cache_key=cache_key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # created_at 由 Tortoise 按 timezone.now() 写入，比较时使用同一时钟
+            now = timezone.now()
+            if entry.created_at < now - timedelta(seconds=self.ttl):
+                await entry.delete()
+                self.misses += 1
+                self.evictions += 1
+                logger.debug(f"🗑️ [阶段缓存] 缓存已过期 | 键: {cache_key[:12]}")
+                return None
+
+            entry.hit_count += 1
+            entry.last_accessed = now
+            await entry.save(update_fields=["hit_count", "last_accessed"])
+            self.hits += 1
+            return entry.content
+
+        except Exception as e:
+            # 缓存不可用时按未命中处理，不影响主流程
+            self.errors += 1
+            self.misses += 1
+            logger.warning(f"⚠️ [阶段缓存] 查询缓存失败，按未命中处理: {e}")
+            return None
+
+    async def set(self, cache_key: str, stage: str, model: str, content: str) -> None:
+        """写入缓存并执行容量淘汰"""
+        try:
+            now = timezone.now()
+            await TestCaseStageCache.update_or_create(
+                defaults={
+                    "stage": stage,
+                    "model": model,
+                    "content": content,
+                    "last_accessed": now,
+                },
+                cache_key=cache_key,
+            )
+            self.writes += 1
+            await self._evict()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️ [阶段缓存] 写入缓存失败: {e}")
+
+    async def _evict(self) -> None:
+        """删除过期缓存，并按最后访问时间淘汰超出容量的缓存"""
+        expire_before = timezone.now() - timedelta(seconds=self.ttl)
+        expired = await TestCaseStageCache.filter(created_at__lt=expire_before).delete()
+
+        overflow = await TestCaseStageCache.all().count() - self.max_entries
+        evicted = 0
+        if overflow > 0:
+            oldest_ids = (
+                await TestCaseStageCache.all()
+                .order_by("last_accessed")
+                .limit(overflow)
+                .values_list("id", flat=True)
+            )
+            evicted = await TestCaseStageCache.filter(id__in=oldest_ids).delete()
+
+        if expired or evicted:
+            self.evictions += expired + evicted
+            logger.info(
+                f"🗑️ [阶段缓存] 缓存淘汰完成 | 过期: {expired} | 超出容量: {evicted}"
+            )
+
+    async def clear(self) -> int:
+        """清空缓存"""
+        deleted = await TestCaseStageCache.all().delete()
+        logger.info(f"🗑️ [阶段缓存] 缓存已清空 | 删除条数: {deleted}")
+        return deleted
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
+
+
+def create_stage_cache() -> StageResultCache:
+    """创建阶段结果缓存实例"""
+    try:
+        from backend.conf.config import settings
+
+        cache_config = getattr(settings, "testcase_cache", {}) or {}
+        return StageResultCache(
+            enabled=cache_config.get("enabled", False),
+            max_entries=cache_config.get("max_entries", 1000),
+            ttl=cache_config.get("ttl", 7 * 86400),
+        )
+    except ImportError:
+        logger.warning("无法导入配置，阶段结果缓存使用默认参数")
+        return StageResultCache()
+
+
+stage_cache = create_stage_cache()
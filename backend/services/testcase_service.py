@@ -20,9 +20,11 @@ AI测试用例生成服务 - 重新设计版本
 
 import asyncio
 import base64
+import hashlib
 import json
 import os
 import tempfile
+import time
 import uuid
 from dataclasses import dataclass
 from datetime import datetime
@@ -51,12 +53,25 @@ from autogen_core import (
     message_handler,
     type_subscription,
 )
-from autogen_core.memory import ListMemory, MemoryContent, MemoryMimeType
 from llama_index.core import Document, SimpleDirectoryReader
 from loguru import logger
 from pydantic import BaseModel, Field
 
-from backend.core.llm import get_openai_model_client, validate_model_client
+from backend.conf.config import settings
+from backend.core.llm import (
+    get_openai_model_client,
+    get_stage_model_client,
+    get_stage_model_name,
+    validate_model_client,
+)
+from backend.core.llm_ratelimit import PRIORITY_BATCH, with_priority
+from backend.core.llm_resilience import for_stage
+from backend.core.logger import hot_log, truncate
+from backend.core.metrics import LLMStreamObserver
+from backend.core.profiler import approx_size
+from backend.core.singleflight import StreamSingleFlight, build_dedup_key
+from backend.core.tracing import tracer
+from backend.core.warm_pool import WarmPool
 from backend.models.chat import AgentMessage, AgentType, FileUpload, TestCaseRequest
 from backend.models.testcase import (
     TestCaseConversation,
@@ -64,6 +79,13 @@ from backend.models.testcase import (
     TestCaseFile,
     TestCaseMessage,
 )
+from backend.services.agent_pool import AssistantAgentPool, get_assistant_pool
+from backend.services.conversation_log import ConversationEventLog
+from backend.services.conversation_memory import ConversationMemory
+from backend.services.conversation_store import ConversationStore, conversation_store
+from backend.services.stage_cache import stage_cache
+from backend.services.testcase_workers import testcase_workers
+from backend.services.usage_service import resolve_usage, usage_recorder
 
 # 定义主题类型 - 重新设计的消息流
 requirement_analysis_topic_type = "requirement_analysis"  # 需求分析
@@ -82,6 +104,8 @@ class RequirementMessage(BaseModel):
     file_paths: Optional[List[str]] = Field(default=None, description="文件路径列表")
     conversation_id: str = Field(..., description="对话ID")
     round_number: int = Field(default=1, description="轮次")
+    bypass_cache: bool = Field(default=False, description="是否跳过阶段结果缓存")
+    user_id: Optional[int] = Field(default=None, description="发起请求的用户ID")
 
 
 class FeedbackMessage(BaseModel):
@@ -91,6 +115,7 @@ class FeedbackMessage(BaseModel):
     conversation_id: str = Field(..., description="对话ID")
     round_number: int = Field(..., description="轮次")
     previous_testcases: Optional[str] = Field(default="", description="之前的测试用例")
+    user_id: Optional[int] = Field(default=None, description="发起请求的用户ID")
 
 
 class ResponseMessage(BaseModel):
@@ -140,20 +165,189 @@ class TestCaseMessage:
     content: Any
     conversation_id: str = ""
     round_number: int = 1
+    bypass_cache: bool = False
+
+
+@dataclass
+class RuntimeSlot:
+    """已注册智能体并启动的运行时，绑定对话ID后才开始收集该对话的消息"""
+
+    runtime: SingleThreadedAgentRuntime
+    conversation_id: Optional[str] = None
 
 
 class TestCaseGenerationRuntime:
     """测试用例生成运行时管理器"""
 
-    def __init__(self):
+    def __init__(self, store: Optional[ConversationStore] = None):
+        """
+        Args:
+            store: 对话状态存储，为 None 时不保存快照，对话只能在当前进程中继续
+        """
         self.runtimes: Dict[str, SingleThreadedAgentRuntime] = {}  # 按对话ID存储运行时
-        self.memories: Dict[str, ListMemory] = {}  # 按对话ID存储历史消息
-        self.collected_messages: Dict[str, List[Dict]] = {}  # 收集的消息
+        self.memories: Dict[str, ConversationMemory] = {}  # 按对话ID存储历史消息
+        self.collected_messages: Dict[str, ConversationEventLog] = {}  # 收集的消息
         self.conversation_states: Dict[str, Dict] = {}  # 对话状态
         self.streaming_messages: Dict[str, List[Dict]] = {}  # 流式消息收集
         self.agent_streams: Dict[str, AsyncGenerator] = {}  # 智能体流式输出
+        self.conversation_aliases: Dict[str, str] = {}  # 去重挂载的对话ID -> 实际对话ID
+        self.store = store  # 对话快照，其他 worker 据此恢复对话
+        self.restored = 0
+        testcase_config = getattr(settings, "testcase", {}) or {}
+        # 预热运行时池：提前创建好注册并启动智能体的运行时
+        self.runtime_pool: WarmPool[RuntimeSlot] = WarmPool(
+            self._build_runtime,
+            size=testcase_config.get("warm_pool_size", 2),
+            dispose=self._dispose_runtime_slot,
+            name="testcase_runtime",
+        )
         logger.info("测试用例生成运行时管理器初始化完成")
 
+    def resolve_conversation_id(self, conversation_id: str) -> str:
+        """解析对话ID，去重挂载的请求会映射到实际运行的对话"""
+        return self.conversation_aliases.get(conversation_id, conversation_id)
+
+    async def add_conversation_alias(self, alias_id: str, conversation_id: str) -> None:
+        """记录对话别名，使挂载请求的后续反馈能找到实际运行时"""
+        if alias_id == conversation_id:
+            return
+        self.conversation_aliases[alias_id] = conversation_id
+        if self.store is not None:
+            await self.store.save("testcase", alias_id, {"alias_of": conversation_id})
+        logger.info(
+            f"🔗 [运行时管理] 记录对话别名 | 别名: {alias_id} -> 对话ID: {conversation_id}"
+        )
+
+    async def remove_conversation_alias(self, alias_id: str) -> bool:
+        """
+        删除对话别名，不影响别名指向的对话
+
+        Returns:
+            bool: alias_id 是否为别名
+        """
+        removed = self.conversation_aliases.pop(alias_id, None) is not None
+        if self.store is not None:
+            snapshot = await self.store.load("testcase", alias_id)
+            if snapshot is not None and snapshot.get("alias_of"):
+                await self.store.delete("testcase", alias_id)
+                removed = True
+        if removed:
+            logger.info(f"🔗 [运行时管理] 删除对话别名 | 别名: {alias_id}")
+        return removed
+
+    async def fork_conversation(self, alias_id: str) -> bool:
+        """
+        把去重挂载的请求转为独立对话
+
+        共享的流式输出结束后，把实际对话的记忆和状态复制到挂载方自己的对话ID下并删除别名，
+        之后挂载方的反馈和清理只作用于自己的对话
+
+        Args:
+            alias_id: 挂载方的对话ID
+
+        Returns:
+            bool: 是否复制了对话内容
+        """
+        conversation_id = self.conversation_aliases.get(alias_id)
+        await self.remove_conversation_alias(alias_id)
+        memory = self.memories.get(conversation_id) if conversation_id else None
+        if memory is None or alias_id in self.runtimes:
+            return False
+
+        state = dict(self.conversation_states.get(conversation_id) or {})
+        if self.store is not None:
+            # 挂载方的后续请求按快照恢复运行时，无需立即占用运行时
+            await self.store.save(
+                "testcase", alias_id, {"records": memory.query(), "state": state}
+            )
+        else:
+            await self._init_runtime(alias_id)
+            for record in memory.query():
+                self.memories[alias_id].add(record)
+            self.conversation_states[alias_id] = state
+        logger.info(
+            f"🍴 [运行时管理] 挂载请求已转为独立对话 | 对话ID: {alias_id} | "
+            f"来源对话ID: {conversation_id} | 记录数: {len(memory)}"
+        )
+        return True
+
+    async def update_conversation_state(
+        self, conversation_id: str, state: Dict, replace: bool = False
+    ) -> None:
+        """
+        更新对话状态并保存对话快照
+
+        Args:
+            conversation_id: 对话唯一标识符
+            state: 状态字段
+            replace: 为 True 时替换整个状态，否则合并到已有状态
+        """
+        current = self.conversation_states.get(conversation_id)
+        if replace or current is None:
+            self.conversation_states[conversation_id] = dict(state)
+        else:
+            current.update(state)
+        await self._save_snapshot(conversation_id)
+
+    async def _save_snapshot(self, conversation_id: str) -> None:
+        """把对话记忆和状态写入对话存储，供其他 worker 恢复"""
+        memory = self.memories.get(conversation_id)
+        if self.store is None or memory is None:
+            # 对话已清理时不再写入
+            return
+        await self.store.save(
+            "testcase",
+            conversation_id,
+            {
+                "records": memory.query(),
+                "state": dict(self.conversation_states.get(conversation_id) or {}),
+            },
+        )
+
+    async def ensure_conversation(self, conversation_id: str) -> str:
+        """
+        确保对话的运行时在当前进程中可用
+
+        对话由其他 worker 创建或在本进程中已被清理时，按对话快照重新分配运行时，
+        并恢复对话记忆和状态
+
+        Args:
+            conversation_id: 对话ID（可以是去重挂载的别名）
+
+        Returns:
+            str: 实际运行的对话ID
+
+        Raises:
+            ValueError: 当前进程和对话存储中都没有该对话
+        """
+        conversation_id = self.resolve_conversation_id(conversation_id)
+        if conversation_id in self.runtimes:
+            return conversation_id
+
+        snapshot = None
+        if self.store is not None:
+            snapshot = await self.store.load("testcase", conversation_id)
+            if snapshot is not None and snapshot.get("alias_of"):
+                alias_id, conversation_id = conversation_id, snapshot["alias_of"]
+                self.conversation_aliases[alias_id] = conversation_id
+                if conversation_id in self.runtimes:
+                    return conversation_id
+                snapshot = await self.store.load("testcase", conversation_id)
+        if snapshot is None:
+            raise ValueError(f"对话不存在或已过期: {conversation_id}")
+
+        await self._init_runtime(conversation_id)
+        memory = self.memories[conversation_id]
+        for record in snapshot.get("records", []):
+            memory.add(record)
+        self.conversation_states[conversation_id] = dict(snapshot.get("state") or {})
+        self.restored += 1
+        logger.info(
+            f"♻️  [运行时管理] 已从对话存储恢复对话 | 对话ID: {conversation_id} | "
+            f"记录数: {len(memory)} | 阶段: {self.conversation_states[conversation_id].get('stage', 'unknown')}"
+        )
+        return conversation_id
+
     async def start_requirement_analysis(self, requirement: RequirementMessage) -> None:
         """
         启动需求分析阶段
@@ -226,7 +420,9 @@ class TestCaseGenerationRuntime:
                 "last_update": datetime.now().isoformat(),
                 "status": "processing",
             }
-            self.conversation_states[conversation_id] = conversation_state
+            await self.update_conversation_state(
+                conversation_id, conversation_state, replace=True
+            )
             logger.debug(f"📊 [需求分析阶段] 对话状态已更新: {conversation_state}")
             logger.success(
                 f"🎉 [需求分析阶段] 需求分析流程启动完成 | 对话ID: {conversation_id}"
@@ -293,15 +489,17 @@ class TestCaseGenerationRuntime:
             logger.error(f"   📄 错误详情: {str(e)}")
             raise
 
+    @tracer.traced(
+        "runtime.init", conversation_id=lambda self, conversation_id: conversation_id
+    )
     async def _init_runtime(self, conversation_id: str) -> None:
         """
         初始化运行时环境
 
-        为指定对话ID创建独立的运行时环境，包括：
-        1. SingleThreadedAgentRuntime 实例
-        2. ListMemory 内存管理
+        为指定对话ID分配独立的运行时环境，包括：
+        1. 从预热池取用已注册智能体并启动的运行时（池空时当场创建）
+        2. ConversationMemory 对话记忆
         3. 消息收集器
-        4. 智能体注册
 
         Args:
             conversation_id: 对话唯一标识符
@@ -318,32 +516,27 @@ class TestCaseGenerationRuntime:
         )
 
         try:
-            # 步骤1: 创建SingleThreadedAgentRuntime实例
-            logger.info(f"   📦 步骤1: 创建SingleThreadedAgentRuntime实例")
-            runtime = SingleThreadedAgentRuntime()
-            self.runtimes[conversation_id] = runtime
-            logger.debug(f"   ✅ SingleThreadedAgentRuntime创建成功: {type(runtime)}")
-
-            # 步骤2: 创建ListMemory内存管理
-            logger.info(f"   🧠 步骤2: 创建ListMemory内存管理实例")
-            memory = ListMemory()
-            self.memories[conversation_id] = memory
-            logger.debug(f"   ✅ ListMemory创建成功: {type(memory)}")
+            # 步骤1: 从预热池取用运行时并绑定对话ID
+            logger.info(f"   📦 步骤1: 从预热池取用运行时")
+            slot = await self.runtime_pool.acquire()
+            slot.conversation_id = conversation_id
+            self.runtimes[conversation_id] = slot.runtime
+            logger.debug(
+                f"   ✅ 运行时取用成功 | 预热池统计: {self.runtime_pool.get_stats()}"
+            )
+
+            # 步骤2: 创建对话记忆
+            logger.info(f"   🧠 步骤2: 创建ConversationMemory对话记忆实例")
+            self.memories[conversation_id] = ConversationMemory(conversation_id)
+            logger.debug(f"   ✅ ConversationMemory创建成功")
 
             # 步骤3: 初始化消息收集器
             logger.info(f"   📨 步骤3: 初始化消息收集器")
-            self.collected_messages[conversation_id] = []
+            self.collected_messages[conversation_id] = ConversationEventLog(
+                conversation_id
+            )
             logger.debug(f"   ✅ 消息收集器初始化完成，当前消息数: 0")
 
-            # 步骤4: 注册所有智能体到运行时
-            logger.info(f"   🤖 步骤4: 注册智能体到运行时")
-            await self._register_agents(runtime, conversation_id)
-
-            # 步骤5: 启动运行时
-            logger.info(f"   🚀 步骤5: 启动运行时")
-            runtime.start()
-            logger.debug(f"   ✅ 运行时启动成功")
-
             # 记录运行时状态
             logger.info(f"📊 [运行时初始化] 当前运行时统计:")
             logger.info(f"   🔢 总运行时数量: {len(self.runtimes)}")
@@ -367,79 +560,123 @@ class TestCaseGenerationRuntime:
                 del self.collected_messages[conversation_id]
             raise
 
+    async def _build_runtime(self) -> RuntimeSlot:
+        """
+        创建运行时：注册所有智能体、提前实例化并启动
+
+        创建出的运行时尚未绑定对话ID，供预热池使用
+        """
+        runtime = SingleThreadedAgentRuntime()
+        slot = RuntimeSlot(runtime=runtime)
+        await self._register_agents(runtime, slot)
+        runtime.start()
+
+        # 提前实例化各阶段智能体，避免首条消息时再创建
+        for agent_type in (
+            requirement_analysis_topic_type,
+            testcase_generation_topic_type,
+            testcase_optimization_topic_type,
+            testcase_finalization_topic_type,
+        ):
+            try:
+                await runtime.get(agent_type, lazy=False)
+            except Exception as e:
+                logger.debug(f"   ⚠️ 智能体预实例化跳过: {agent_type} | {e}")
+        return slot
+
+    async def _dispose_runtime_slot(self, slot: RuntimeSlot) -> None:
+        """释放未被使用的预热运行时"""
+        await slot.runtime.stop_when_idle()
+        await slot.runtime.close()
+
     async def _save_to_memory(self, conversation_id: str, data: Dict) -> None:
         """
         保存数据到内存
 
-        将对话相关的数据保存到ListMemory中，用于历史记录和上下文管理
+        将对话相关的数据以原生字典保存到ConversationMemory中，用于历史记录和上下文管理，
+        同时更新对话快照
 
         Args:
             conversation_id: 对话唯一标识符
             data: 要保存的数据字典
         """
-        logger.debug(f"💾 [内存管理] 开始保存数据到内存 | 对话ID: {conversation_id}")
-        logger.debug(f"   📦 数据类型: {data.get('type', 'unknown')}")
-        logger.debug(
-            f"   📄 数据大小: {len(json.dumps(data, ensure_ascii=False))} 字符"
-        )
-
         # 检查内存是否存在
-        if conversation_id not in self.memories:
+        memory = self.memories.get(conversation_id)
+        if memory is None:
             logger.warning(
                 f"⚠️  [内存管理] 内存实例不存在，跳过保存 | 对话ID: {conversation_id}"
             )
             return
 
-        try:
-            memory = self.memories[conversation_id]
-
-            # 创建内存内容对象
-            memory_content = MemoryContent(
-                content=json.dumps(data, ensure_ascii=False),
-                mime_type=MemoryMimeType.JSON,
-            )
-
-            # 保存到内存
-            await memory.add(memory_content)
-
-            logger.debug(f"✅ [内存管理] 数据保存成功 | 对话ID: {conversation_id}")
-            logger.debug(f"   📝 保存内容: {data}")
-
-        except Exception as e:
-            logger.error(f"❌ [内存管理] 数据保存失败 | 对话ID: {conversation_id}")
-            logger.error(f"   🐛 错误类型: {type(e).__name__}")
-            logger.error(f"   📄 错误详情: {str(e)}")
-            logger.error(f"   📦 尝试保存的数据: {data}")
-            raise
+        memory.add(data)
+        await self._save_snapshot(conversation_id)
+        logger.debug(
+            f"💾 [内存管理] 数据保存成功 | 对话ID: {conversation_id} | 类型: {data.get('type', 'unknown')} | 轮次: {data.get('round_number')} | 记录总数: {len(memory)}"
+        )
 
-    async def get_conversation_history(self, conversation_id: str) -> List[Dict]:
-        """获取对话历史"""
-        if conversation_id not in self.memories:
-            return []
+    async def get_conversation_history(
+        self,
+        conversation_id: str,
+        entry_type: Optional[str] = None,
+        round_number: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        获取对话历史
 
-        memory = self.memories[conversation_id]
-        history = []
+        Args:
+            conversation_id: 对话唯一标识符
+            entry_type: 只返回指定类型的记录（如 testcase_generation）
+            round_number: 只返回指定轮次的记录
+        """
+        memory = self.memories.get(conversation_id)
+        if memory is None:
+            # 对话在其他 worker 上运行时从快照读取历史
+            snapshot = (
+                await self.store.load("testcase", conversation_id)
+                if self.store is not None
+                else None
+            )
+            if not snapshot or "records" not in snapshot:
+                return []
+            memory = ConversationMemory(conversation_id)
+            for record in snapshot["records"]:
+                memory.add(record)
+        return memory.query(entry_type=entry_type, round_number=round_number)
 
-        # ListMemory 使用 get_all() 方法，但需要检查是否存在
-        try:
-            if hasattr(memory, "get_all"):
-                async for content in memory.get_all():
-                    try:
-                        data = json.loads(content.content)
-                        history.append(data)
-                    except json.JSONDecodeError:
-                        logger.warning(f"解析历史消息失败: {content.content}")
-            else:
-                # 如果没有 get_all 方法，尝试其他方式
-                logger.warning(f"内存对象没有 get_all 方法: {type(memory)}")
-        except Exception as e:
-            logger.error(f"获取历史记录失败: {e}")
+    def get_collected_messages(self, conversation_id: str) -> List[Dict]:
+        """获取收集的消息（按需还原为消息字典）"""
+        event_log = self.collected_messages.get(conversation_id)
+        return event_log.to_list() if event_log is not None else []
 
-        return history
+    def get_memory_usage(self) -> Dict[str, Any]:
+        """
+        估算按对话保存的数据结构占用的内存
 
-    def get_collected_messages(self, conversation_id: str) -> List[Dict]:
-        """获取收集的消息"""
-        return self.collected_messages.get(conversation_id, [])
+        Returns:
+            dict: 每个对话各数据结构的估算字节数和运行时数量
+        """
+        structures = {
+            "collected_messages": self.collected_messages,
+            "memories": self.memories,
+            "conversation_states": self.conversation_states,
+            "streaming_messages": self.streaming_messages,
+        }
+        conversations: Dict[str, Dict[str, int]] = {}
+        totals = {name: 0 for name in structures}
+        for name, store in structures.items():
+            for conversation_id, value in list(store.items()):
+                if isinstance(value, ConversationEventLog):
+                    size = value.nbytes()
+                else:
+                    size = approx_size(value)
+                conversations.setdefault(conversation_id, {})[name] = size
+                totals[name] += size
+        return {
+            "runtimes": len(self.runtimes),
+            "agent_streams": len(self.agent_streams),
+            "totals": totals,
+            "conversations": conversations,
+        }
 
     async def _optimize_testcases(
         self, conversation_id: str, feedback: FeedbackMessage
@@ -498,7 +735,7 @@ class TestCaseGenerationRuntime:
                 "last_update": datetime.now().isoformat(),
                 "status": "processing",
             }
-            self.conversation_states[conversation_id].update(state_update)
+            await self.update_conversation_state(conversation_id, state_update)
             logger.debug(f"   📊 状态更新: {state_update}")
 
             logger.success(
@@ -556,7 +793,7 @@ class TestCaseGenerationRuntime:
                 f"   📄 测试用例来源: {'对话状态' if state.get('last_testcases') else '反馈参数'}"
             )
             logger.info(f"   📝 测试用例长度: {len(last_testcases or '')} 字符")
-            logger.debug(f"   📋 测试用例完整内容: {last_testcases or ''}")
+            logger.debug("   📋 测试用例内容: {}", truncate(last_testcases or ""))
 
             # 步骤3: 创建最终化消息
             logger.info(
@@ -596,7 +833,7 @@ class TestCaseGenerationRuntime:
                 "last_update": datetime.now().isoformat(),
                 "status": "processing",
             }
-            self.conversation_states[conversation_id].update(state_update)
+            await self.update_conversation_state(conversation_id, state_update)
             logger.debug(f"   📊 状态更新: {state_update}")
 
             logger.success(
@@ -612,44 +849,62 @@ class TestCaseGenerationRuntime:
             raise
 
     async def _register_agents(
-        self, runtime: SingleThreadedAgentRuntime, conversation_id: str
+        self, runtime: SingleThreadedAgentRuntime, slot: RuntimeSlot
     ) -> None:
-        """注册智能体到运行时"""
-        logger.info(f"[智能体注册] 开始注册智能体 | 对话ID: {conversation_id}")
+        """
+        注册智能体到运行时
+
+        智能体本身与对话无关，结果收集器通过 slot 获取绑定的对话ID，
+        因此运行时可以在对话到来之前预先创建
+        """
+        logger.info(f"[智能体注册] 开始注册智能体")
 
         if not validate_model_client():
             logger.error("模型客户端未初始化或验证失败")
             return
 
-        # 获取模型客户端
+        # 获取模型客户端：aimodel.stages 单独配置了模型参数的阶段使用自己的客户端，
+        # 各阶段按自己的参数重试和对冲，批量生成让位于交互式聊天
         model_client = get_openai_model_client()
 
+        def stage_client(stage: str):
+            client = get_stage_model_client(stage) or model_client
+            return with_priority(for_stage(client, stage), PRIORITY_BATCH)
+
         # 注册需求分析智能体
         await RequirementAnalysisAgent.register(
             runtime,
             requirement_analysis_topic_type,
-            lambda: RequirementAnalysisAgent(model_client),
+            lambda: RequirementAnalysisAgent(
+                stage_client(requirement_analysis_topic_type)
+            ),
         )
 
         # 注册测试用例生成智能体
         await TestCaseGenerationAgent.register(
             runtime,
             testcase_generation_topic_type,
-            lambda: TestCaseGenerationAgent(model_client),
+            lambda: TestCaseGenerationAgent(
+                stage_client(testcase_generation_topic_type)
+            ),
         )
 
         # 注册测试用例优化智能体
         await TestCaseOptimizationAgent.register(
             runtime,
             testcase_optimization_topic_type,
-            lambda: TestCaseOptimizationAgent(model_client),
+            lambda: TestCaseOptimizationAgent(
+                stage_client(testcase_optimization_topic_type)
+            ),
         )
 
         # 注册测试用例最终化智能体
         await TestCaseFinalizationAgent.register(
             runtime,
             testcase_finalization_topic_type,
-            lambda: TestCaseFinalizationAgent(model_client),
+            lambda: TestCaseFinalizationAgent(
+                stage_client(testcase_finalization_topic_type)
+            ),
         )
 
         # 注册结果收集器 - 使用ClosureAgent
@@ -666,38 +921,45 @@ class TestCaseGenerationRuntime:
                 message: 响应消息对象
                 ctx: 消息上下文
             """
-            logger.info(
-                f"📨 [结果收集器] 收到智能体消息 | 对话ID: {conversation_id} | 智能体: {message.source} | 消息类型: {message.message_type} | 内容长度: {len(message.content)} | 是否最终: {message.is_final} | 完整内容: {message.content}"
-            )
+            conversation_id = slot.conversation_id
+            if conversation_id is None:
+                logger.warning(f"⚠️  [结果收集器] 运行时未绑定对话，丢弃消息")
+                return
 
             # 确保消息收集器已初始化
-            if conversation_id not in self.collected_messages:
+            event_log = self.collected_messages.get(conversation_id)
+            if event_log is None:
                 logger.warning(
                     f"⚠️  [结果收集器] 消息收集器未初始化，创建新的 | 对话ID: {conversation_id}"
                 )
-                self.collected_messages[conversation_id] = []
-
-            # 转换为统一的字典格式
-            result_dict = {
-                "content": message.content,
-                "agent_type": "agent",
-                "agent_name": message.source,
-                "conversation_id": conversation_id,
-                "round_number": 1,  # 默认轮次，可以从上下文获取
-                "timestamp": datetime.now().isoformat(),
-                "is_complete": message.is_final,
-                "message_type": message.message_type,
-            }
-
-            # 添加到消息收集器
-            self.collected_messages[conversation_id].append(result_dict)
-            current_count = len(self.collected_messages[conversation_id])
-
-            logger.success(
-                f"✅ [结果收集器] 消息收集成功 | 当前消息总数: {current_count} | 智能体: {message.source} | 消息类型: {message.message_type}"
-            )
+                event_log = ConversationEventLog(conversation_id)
+                self.collected_messages[conversation_id] = event_log
+
+            # 按列追加到事件日志，读取时再还原为消息字典
+            current_count = event_log.append(
+                source=message.source,
+                content=message.content,
+                message_type=message.message_type,
+                is_final=message.is_final,
+            )
+
+            # 流式块数量很大，只在调试级别记录
+            if message.message_type == "streaming_chunk":
+                hot_log(
+                    "DEBUG",
+                    "testcase.collect_result.chunk",
+                    "📨 [结果收集器] 收到流式块 | 对话ID: {} | 智能体: {} | 内容长度: {} | 当前消息总数: {}",
+                    conversation_id,
+                    message.source,
+                    len(message.content),
+                    current_count,
+                )
+            else:
+                logger.info(
+                    f"📨 [结果收集器] 收到智能体消息 | 对话ID: {conversation_id} | 智能体: {message.source} | 消息类型: {message.message_type} | 内容长度: {len(message.content)} | 是否最终: {message.is_final} | 当前消息总数: {current_count}"
+                )
 
-        logger.info(f"📝 [智能体注册] 注册结果收集器 | 对话ID: {conversation_id}")
+        logger.info(f"📝 [智能体注册] 注册结果收集器")
         await ClosureAgent.register_closure(
             runtime,
             "collect_result",
@@ -710,7 +972,7 @@ class TestCaseGenerationRuntime:
         )
         logger.debug(f"   ✅ 结果收集器注册成功，订阅主题: {task_result_topic_type}")
 
-        logger.success(f"[智能体注册] 所有智能体注册完成 | 对话ID: {conversation_id}")
+        logger.success(f"[智能体注册] 所有智能体注册完成")
 
     async def start_streaming_generation(
         self, requirement: RequirementMessage
@@ -839,23 +1101,29 @@ class TestCaseGenerationRuntime:
 
         while wait_time < max_wait_time:
             # 获取新消息
-            messages = self.get_collected_messages(conversation_id)
-            current_count = len(messages)
+            event_log = self.collected_messages.get(conversation_id)
+            current_count = len(event_log) if event_log is not None else 0
 
             if current_count > last_message_count:
                 # 处理新消息
                 for i in range(last_message_count, current_count):
-                    msg = messages[i]
-                    agent_name = msg.get("agent_name", "unknown")
-                    content = msg.get("content", "")
-                    msg_type = msg.get("message_type", "info")
-                    is_final = msg.get("is_final", False)
+                    agent_name = event_log.source(i)
+                    content = event_log.content(i)
+                    msg_type = event_log.message_type(i)
+                    is_final = event_log.is_final(i)
 
                     # 创建消息唯一标识
                     msg_id = f"{agent_name}_{msg_type}_{hash(content)}_{i}"
 
-                    logger.debug(
-                        f"📤 [流式输出] 处理消息 {i+1} | 智能体: {agent_name} | 消息类型: {msg_type} | 是否最终: {is_final} | 内容长度: {len(content)}"
+                    hot_log(
+                        "DEBUG",
+                        "testcase.stream_output.process",
+                        "📤 [流式输出] 处理消息 {} | 智能体: {} | 消息类型: {} | 是否最终: {} | 内容长度: {}",
+                        i + 1,
+                        agent_name,
+                        msg_type,
+                        is_final,
+                        len(content),
                     )
 
                     # 检查是否应该流式输出
@@ -873,13 +1141,15 @@ class TestCaseGenerationRuntime:
                                 "content": content,
                                 "conversation_id": conversation_id,
                                 "message_type": "streaming",
-                                "timestamp": msg.get(
-                                    "timestamp", datetime.now().isoformat()
-                                ),
+                                "timestamp": event_log.timestamp(i),
                             }
                             yield chunk_data
-                            logger.info(
-                                f"📡 [流式输出] 发送流式块 | 智能体: {agent_name} | 内容: {content[:100]}..."
+                            hot_log(
+                                "INFO",
+                                "testcase.stream_output.chunk",
+                                "📡 [流式输出] 发送流式块 | 智能体: {} | 内容: {}",
+                                agent_name,
+                                truncate(content, 100),
                             )
                         else:
                             # 发送完整消息 (智能体的完整输出)
@@ -890,9 +1160,7 @@ class TestCaseGenerationRuntime:
                                 "conversation_id": conversation_id,
                                 "message_type": msg_type,
                                 "is_complete": is_final,
-                                "timestamp": msg.get(
-                                    "timestamp", datetime.now().isoformat()
-                                ),
+                                "timestamp": event_log.timestamp(i),
                             }
                             yield complete_data
                             logger.info(
@@ -900,14 +1168,19 @@ class TestCaseGenerationRuntime:
                             )
                     else:
                         # 记录过滤的消息到日志
-                        logger.debug(
-                            f"🚫 [流式输出] 消息已过滤 | 智能体: {agent_name} | 类型: {msg_type} | 内容: {content[:50]}..."
+                        hot_log(
+                            "DEBUG",
+                            "testcase.stream_output.filtered",
+                            "🚫 [流式输出] 消息已过滤 | 智能体: {} | 类型: {} | 内容: {}",
+                            agent_name,
+                            msg_type,
+                            truncate(content, 50),
                         )
 
                 last_message_count = current_count
 
                 # 检查是否完成
-                if messages and any(msg.get("is_complete") for msg in messages[-3:]):
+                if event_log.has_final(current_count - 3):
                     logger.info(
                         f"🏁 [流式输出] 检测到完成信号 | 对话ID: {conversation_id}"
                     )
@@ -917,7 +1190,7 @@ class TestCaseGenerationRuntime:
                         "type": "task_result",
                         "messages": [
                             msg
-                            for msg in messages
+                            for msg in event_log.iter_messages()
                             if self._should_stream_message(
                                 msg.get("agent_name", ""),
                                 msg.get("message_type", ""),
@@ -976,11 +1249,107 @@ class TestCaseGenerationRuntime:
             del self.agent_streams[conversation_id]
             logger.debug(f"   ✅ 智能体流已清理")
 
+        # 清理指向该对话的别名
+        aliases = [
+            alias
+            for alias, target in self.conversation_aliases.items()
+            if target == conversation_id or alias == conversation_id
+        ]
+        for alias in aliases:
+            del self.conversation_aliases[alias]
+        if aliases:
+            logger.debug(f"   ✅ 对话别名已清理: {len(aliases)} 个")
+
         logger.success(f"🎉 [运行时清理] 对话数据清理完成 | 对话ID: {conversation_id}")
 
+    async def checkpoint_conversation(self, conversation_id: str) -> bool:
+        """
+        保存未完成对话的进度
+
+        把已完成阶段的结果写入对话记录，状态标记为 interrupted
+
+        Returns:
+            bool: 是否有可保存的进度
+        """
+        memory = self.memories.get(conversation_id)
+        state = self.conversation_states.get(conversation_id) or {}
+        if memory is None and not state:
+            return False
+
+        def latest_content(*entry_types: str) -> Optional[str]:
+            for entry_type in entry_types:
+                record = memory.latest(entry_type) if memory is not None else None
+                if record is None:
+                    continue
+                content = record.get("content")
+                if isinstance(content, str):
+                    return content
+                return json.dumps(content, ensure_ascii=False, default=str)
+            return None
+
+        text_content = latest_content("user_input")
+        await TestCaseConversation.update_or_create(
+            defaults={
+                "title": text_content[:100] if text_content else None,
+                "status": "interrupted",
+                "round_number": state.get("round_number", 1),
+                "text_content": text_content,
+                "requirement_analysis": latest_content("requirement_analysis"),
+                "generated_testcases": latest_content(
+                    "testcase_optimization", "testcase_generation"
+                ),
+                "final_testcases": latest_content("testcase_finalization"),
+            },
+            conversation_id=conversation_id,
+        )
+        logger.info(
+            f"💾 [运行时管理] 已保存中断对话的进度 | 对话ID: {conversation_id} | "
+            f"阶段: {state.get('stage', 'unknown')}"
+        )
+        return True
+
+    async def cleanup_all(self, timeout: float = 5.0) -> None:
+        """
+        停机时保存未完成对话的进度并清理所有对话
+
+        运行时只存在于内存中，重启后无法继续，因此除已最终化的对话外都保存进度；
+        仍在执行智能体的运行时最多等待 timeout 秒
+        """
+        conversation_ids = list(
+            dict.fromkeys([*self.runtimes, *self.collected_messages])
+        )
+        if not conversation_ids:
+            return
+
+        checkpointed = 0
+        for conversation_id in conversation_ids:
+            state = self.conversation_states.get(conversation_id) or {}
+            if state.get("stage") == "completed":
+                continue
+            try:
+                if await self.checkpoint_conversation(conversation_id):
+                    checkpointed += 1
+            except Exception as e:
+                logger.error(
+                    f"❌ [运行时清理] 保存对话进度失败 | 对话ID: {conversation_id} | 错误: {e}"
+                )
+
+        results = await asyncio.gather(
+            *(
+                asyncio.wait_for(self.cleanup_runtime(conversation_id), timeout)
+                for conversation_id in conversation_ids
+            ),
+            return_exceptions=True,
+        )
+        timed_out = sum(isinstance(result, asyncio.TimeoutError) for result in results)
+        logger.info(
+            f"🗑️ [运行时清理] 停机清理对话: {len(conversation_ids)} 个 | "
+            f"保存进度: {checkpointed} 个 | 停止超时: {timed_out} 个"
+        )
+
 
 # 全局运行时管理器实例
-testcase_runtime = TestCaseGenerationRuntime()
+testcase_runtime = TestCaseGenerationRuntime(store=conversation_store)
 
 
 class TestCaseService:
@@ -988,33 +1357,134 @@ class TestCaseService:
 
     def __init__(self):
         self.max_rounds = 3
-        logger.info("AI测试用例生成服务初始化完成")
+        testcase_config = getattr(settings, "testcase", {}) or {}
+        # 相同需求的并发生成请求去重，默认开启
+        self.dedup_enabled = testcase_config.get("dedup_enabled", True)
+        self.generation_flight = StreamSingleFlight("testcase_generation")
+        # 进程模式下智能体运行在工作进程中，本进程只转发请求（工作进程中不启动）
+        self.workers = testcase_workers
+        logger.info(
+            f"AI测试用例生成服务初始化完成 | 请求去重: {'开启' if self.dedup_enabled else '关闭'}"
+        )
 
     async def start_generation(self, requirement: RequirementMessage) -> None:
         """启动测试用例生成"""
         await testcase_runtime.start_requirement_analysis(requirement)
 
+    @property
+    def remote(self) -> bool:
+        """是否把请求转发到工作进程"""
+        return self.workers is not None and self.workers.started
+
     async def start_streaming_generation(
         self, requirement: RequirementMessage
     ) -> AsyncGenerator[Dict, None]:
-        """启动流式测试用例生成"""
-        async for stream_data in testcase_runtime.start_streaming_generation(
-            requirement
-        ):
-            yield stream_data
+        """
+        启动流式测试用例生成
+
+        相同文本、文件和选项的并发请求只会启动一次智能体流程，
+        后到的请求挂载到正在运行的任务上接收同样的流式输出
+        """
+        if self.remote:
+            async for stream_data in self.workers.stream(
+                "generate", requirement.conversation_id, requirement.model_dump()
+            ):
+                yield stream_data
+            return
+
+        usage_recorder.bind_user(requirement.conversation_id, requirement.user_id)
+        if not self.dedup_enabled:
+            async for stream_data in testcase_runtime.start_streaming_generation(
+                requirement
+            ):
+                yield stream_data
+            return
+
+        conversation_id = requirement.conversation_id
+        dedup_key = await self._build_generation_key(requirement)
+        inflight = self.generation_flight.get(dedup_key)
+        follower = inflight is not None and inflight.owner_id != conversation_id
+        if follower:
+            # 别名只在回放共享输出期间使用，结束后挂载方拥有自己的对话
+            await testcase_runtime.add_conversation_alias(
+                conversation_id, inflight.owner_id
+            )
+
+        completed = False
+        try:
+            async for stream_data in self.generation_flight.stream(
+                dedup_key,
+                conversation_id,
+                lambda: testcase_runtime.start_streaming_generation(requirement),
+            ):
+                yield stream_data
+            completed = True
+        finally:
+            if follower:
+                if completed:
+                    await testcase_runtime.fork_conversation(conversation_id)
+                else:
+                    await testcase_runtime.remove_conversation_alias(conversation_id)
+
+    async def _build_generation_key(self, requirement: RequirementMessage) -> str:
+        """根据用户、文本内容、文件哈希和生成选项计算去重键，不同用户的请求不会合并"""
+        file_hashes = [
+            hashlib.sha256(f.content.encode("utf-8")).hexdigest()
+            for f in requirement.files or []
+        ]
+        if requirement.file_paths:
+            # 文件内容哈希放到线程中计算，避免阻塞事件循环
+            file_hashes.extend(
+                await asyncio.to_thread(_hash_file_paths, requirement.file_paths)
+            )
+        return build_dedup_key(
+            (requirement.text_content or "").strip(),
+            ",".join(sorted(file_hashes)),
+            requirement.round_number,
+            requirement.bypass_cache,
+            requirement.user_id,
+        )
 
     async def process_feedback(self, feedback: FeedbackMessage) -> None:
         """处理用户反馈"""
+        conversation_id = await testcase_runtime.ensure_conversation(
+            feedback.conversation_id
+        )
+        if conversation_id != feedback.conversation_id:
+            feedback = feedback.model_copy(update={"conversation_id": conversation_id})
+        usage_recorder.bind_user(conversation_id, feedback.user_id)
         await testcase_runtime.process_user_feedback(feedback)
 
     async def process_streaming_feedback(
         self, feedback: FeedbackMessage
     ) -> AsyncGenerator[Dict, None]:
-        """处理用户反馈并返回流式输出"""
-        conversation_id = feedback.conversation_id
+        """
+        处理用户反馈并返回流式输出
+
+        对话在其他 worker 上生成时，先从对话存储恢复运行时
+        """
+        if self.remote:
+            async for stream_data in self.workers.stream(
+                "feedback", feedback.conversation_id, feedback.model_dump()
+            ):
+                yield stream_data
+            return
+
+        conversation_id = testcase_runtime.resolve_conversation_id(
+            feedback.conversation_id
+        )
         logger.info(f"🔄 [流式反馈] 开始处理用户反馈 | 对话ID: {conversation_id}")
 
         try:
+            conversation_id = await testcase_runtime.ensure_conversation(
+                feedback.conversation_id
+            )
+            if conversation_id != feedback.conversation_id:
+                feedback = feedback.model_copy(
+                    update={"conversation_id": conversation_id}
+                )
+            usage_recorder.bind_user(conversation_id, feedback.user_id)
+
             # 启动反馈处理
             await testcase_runtime.process_user_feedback(feedback)
 
@@ -1036,22 +1506,218 @@ class TestCaseService:
                 "timestamp": datetime.now().isoformat(),
             }
 
-    def get_messages(self, conversation_id: str) -> List[Dict]:
+    async def get_messages(self, conversation_id: str) -> List[Dict]:
         """获取消息"""
-        return testcase_runtime.get_collected_messages(conversation_id)
+        if self.remote:
+            return await self.workers.call(
+                "messages", conversation_id, {"conversation_id": conversation_id}
+            )
+        return testcase_runtime.get_collected_messages(
+            testcase_runtime.resolve_conversation_id(conversation_id)
+        )
 
-    async def get_history(self, conversation_id: str) -> List[Dict]:
-        """获取历史"""
-        return await testcase_runtime.get_conversation_history(conversation_id)
+    async def get_history(
+        self,
+        conversation_id: str,
+        entry_type: Optional[str] = None,
+        round_number: Optional[int] = None,
+    ) -> List[Dict]:
+        """获取历史，可按记录类型和轮次过滤"""
+        if self.remote:
+            return await self.workers.call(
+                "history",
+                conversation_id,
+                {
+                    "conversation_id": conversation_id,
+                    "entry_type": entry_type,
+                    "round_number": round_number,
+                },
+            )
+        return await testcase_runtime.get_conversation_history(
+            testcase_runtime.resolve_conversation_id(conversation_id),
+            entry_type=entry_type,
+            round_number=round_number,
+        )
 
     async def clear_conversation(self, conversation_id: str) -> None:
-        """清除对话历史和消息"""
+        """
+        清除对话历史、消息和对话快照
+
+        对话ID是去重挂载的别名时只删除别名，别名指向的对话不受影响
+        """
+        if self.remote:
+            await self.workers.call(
+                "clear", conversation_id, {"conversation_id": conversation_id}
+            )
+            return
+        if await testcase_runtime.remove_conversation_alias(conversation_id):
+            return
         await testcase_runtime.cleanup_runtime(conversation_id)
+        if testcase_runtime.store is not None:
+            await testcase_runtime.store.delete("testcase", conversation_id)
+
+
+def _hash_file_paths(file_paths: List[str]) -> List[str]:
+    """计算文件内容哈希，文件不存在时使用路径本身"""
+    hashes = []
+    for file_path in file_paths:
+        path = Path(file_path)
+        if not path.is_file():
+            hashes.append(hashlib.sha256(file_path.encode("utf-8")).hexdigest())
+            continue
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(65536), b""):
+                digest.update(block)
+        hashes.append(digest.hexdigest())
+    return hashes
 
 
 # 智能体实现
 
 
+async def run_stage_stream(
+    agent: RoutedAgent,
+    stage: str,
+    source: str,
+    assistant_pool: AssistantAgentPool,
+    system_prompt: str,
+    task: str,
+    conversation_id: str,
+    use_cache: bool = False,
+) -> str:
+    """
+    执行流水线单个阶段的AssistantAgent流式任务
+
+    流式块实时发布到结果收集器，返回智能体的完整输出。
+    use_cache 为 True 且阶段缓存已启用时，先查询阶段结果缓存，命中则直接回放缓存内容
+
+    Args:
+        agent: 发布消息的RoutedAgent
+        stage: 流水线阶段名称
+        source: 消息来源（智能体显示名称）
+        assistant_pool: 阶段角色的AssistantAgent池，命中缓存时不会取用
+        system_prompt: 系统提示词
+        task: 阶段任务内容
+        conversation_id: 对话ID
+        use_cache: 是否使用阶段结果缓存
+
+    Returns:
+        str: 智能体的完整输出
+    """
+    with tracer.span(f"llm.{stage}", conversation_id) as span:
+        topic_id = TopicId(type=task_result_topic_type, source=agent.id.key)
+
+        model_name = get_stage_model_name(stage)
+        cache_key = None
+        if use_cache and stage_cache.enabled:
+            cache_key = stage_cache.make_key(stage, model_name, system_prompt, task)
+            cached_content = await stage_cache.get(cache_key)
+            if cached_content is not None:
+                logger.info(
+                    f"⚡ [{source}] 命中阶段结果缓存 | 对话ID: {conversation_id} | 阶段: {stage} | 内容长度: {len(cached_content)}"
+                )
+                await agent.publish_message(
+                    ResponseMessage(
+                        source=source,
+                        content=cached_content,
+                        message_type="streaming_chunk",
+                    ),
+                    topic_id=topic_id,
+                )
+                span.set("cache_hit", True)
+                return cached_content
+
+        content_parts = []
+        final_content = ""
+
+        observer = LLMStreamObserver(stage, model_name)
+        completion_tokens = None
+        prompt_tokens = None
+
+        try:
+            async with assistant_pool.lease() as assistant:
+                logger.debug(f"   ✅ AssistantAgent取用成功: {assistant.name}")
+
+                # 使用AutoGen最佳实践处理流式结果
+                async for item in assistant.run_stream(task=task):
+                    if isinstance(item, ModelClientStreamingChunkEvent):
+                        # 流式输出到前端
+                        if item.content:
+                            observer.on_chunk()
+                            content_parts.append(item.content)
+                            await agent.publish_message(
+                                ResponseMessage(
+                                    source=source,
+                                    content=item.content,
+                                    message_type="streaming_chunk",  # 标记为流式块
+                                ),
+                                topic_id=topic_id,
+                            )
+                            hot_log(
+                                "DEBUG",
+                                "testcase.stage_stream.chunk",
+                                "📡 [{}] 发送流式块 | 对话ID: {} | 内容长度: {}",
+                                source,
+                                conversation_id,
+                                len(item.content),
+                            )
+
+                    elif isinstance(item, TextMessage):
+                        # 记录智能体的完整输出
+                        final_content = item.content
+                        if item.models_usage:
+                            completion_tokens = (
+                                completion_tokens or 0
+                            ) + item.models_usage.completion_tokens
+                            prompt_tokens = (
+                                prompt_tokens or 0
+                            ) + item.models_usage.prompt_tokens
+                        logger.info(
+                            f"📝 [{source}] 收到完整输出 | 对话ID: {conversation_id} | 内容长度: {len(item.content)}"
+                        )
+
+                    elif isinstance(item, TaskResult):
+                        # 记录用户输入和最终结果
+                        if item.messages:
+                            user_input = item.messages[0].content  # 用户的输入
+                            final_content = item.messages[
+                                -1
+                            ].content  # 智能体的最终输出
+                            logger.info(
+                                f"📊 [{source}] TaskResult | 对话ID: {conversation_id} | 用户输入长度: {len(user_input)} | 最终输出长度: {len(final_content)}"
+                            )
+
+            observer.finish(completion_tokens, prompt_tokens)
+        finally:
+            # 客户端断开或模型出错导致阶段中断时也要记录已经消耗的用量
+            usage_recorder.record(
+                conversation_id,
+                stage,
+                model_name,
+                resolve_usage(
+                    prompt_tokens,
+                    completion_tokens,
+                    system_prompt + task,
+                    "".join(content_parts),
+                ),
+                time.perf_counter() - observer.started,
+            )
+        span.set("cache_hit", False)
+        span.set("model", model_name)
+        span.set("ttft", observer.ttft)
+        span.set("chunks", observer.chunks)
+
+        # 使用最终结果，优先使用TaskResult或TextMessage的内容
+        content = final_content or "".join(content_parts)
+
+        if cache_key and content:
+            await stage_cache.set(cache_key, stage, model_name, content)
+            logger.debug(f"💾 [{source}] 阶段结果已写入缓存 | 阶段: {stage}")
+
+        return content
+
+
 @type_subscription(topic_type=requirement_analysis_topic_type)
 class RequirementAnalysisAgent(RoutedAgent):
     """需求分析智能体"""
@@ -1071,6 +1737,7 @@ class RequirementAnalysisAgent(RoutedAgent):
 请用专业、清晰的语言输出分析结果，为后续的测试用例生成提供准确的需求基础。
         """
 
+    @tracer.traced("requirement.parse_files")
     async def get_document_from_files(self, files: List[FileUpload]) -> str:
         """
         使用 llama_index 获取文件内容
@@ -1148,7 +1815,7 @@ class RequirementAnalysisAgent(RoutedAgent):
                 content = doc.text
 
                 logger.success(f"   ✅ 文件解析完成 | 总内容长度: {len(content)} 字符")
-                logger.debug(f"   📄 解析内容预览: {content[:200]}...")
+                logger.debug("   📄 解析内容预览: {}", truncate(content))
 
                 return content
 
@@ -1158,6 +1825,7 @@ class RequirementAnalysisAgent(RoutedAgent):
             logger.error(f"   📄 错误详情: {str(e)}")
             raise Exception(f"文件读取失败: {str(e)}")
 
+    @tracer.traced("requirement.parse_files")
     async def get_document_from_file_paths(self, file_paths: List[str]) -> str:
         """
         使用 llama_index 从文件路径获取文件内容 - 参考examples实现
@@ -1205,7 +1873,7 @@ class RequirementAnalysisAgent(RoutedAgent):
             content = doc.text
 
             logger.success(f"   ✅ 文件路径解析完成 | 总内容长度: {len(content)} 字符")
-            logger.debug(f"   📄 解析内容预览: {content[:200]}...")
+            logger.debug("   📄 解析内容预览: {}", truncate(content))
 
             return content
 
@@ -1214,6 +1882,10 @@ class RequirementAnalysisAgent(RoutedAgent):
             raise Exception(f"文件路径读取失败: {str(e)}")
 
     @message_handler
+    @tracer.traced(
+        "agent.requirement_analysis",
+        conversation_id=lambda self, message, ctx: message.conversation_id,
+    )
     async def handle_requirement_analysis(
         self, message: RequirementMessage, ctx: MessageContext
     ) -> None:
@@ -1306,7 +1978,7 @@ class RequirementAnalysisAgent(RoutedAgent):
                 f"📝 [需求分析智能体] 步骤2: 准备分析内容 | 对话ID: {conversation_id}"
             )
             analysis_content = message.text_content or ""
-            logger.debug(f"   📄 基础文本内容: {analysis_content}")
+            logger.debug("   📄 基础文本内容: {}", truncate(analysis_content))
 
             # 处理文件内容 - 支持两种方式：文件路径（推荐）和文件对象
             document_content_display = ""
@@ -1440,17 +2112,14 @@ class RequirementAnalysisAgent(RoutedAgent):
                     f"✅ [需求分析智能体] 文档内容已输出到前端 | 对话ID: {conversation_id}"
                 )
 
-            # 步骤3: 创建需求分析智能体实例
+            # 步骤3: 准备需求分析AssistantAgent（从智能体池取用，执行完成后归还）
             logger.info(
-                f"🤖 [需求分析智能体] 步骤3: 创建AssistantAgent实例 | 对话ID: {conversation_id}"
+                f"🤖 [需求分析智能体] 步骤3: 准备AssistantAgent实例 | 对话ID: {conversation_id}"
             )
-            analyst_agent = AssistantAgent(
-                name="requirement_analyst",
-                model_client=self._model_client,
-                system_message=self._prompt,
-                model_client_stream=True,
+
+            assistant_pool = get_assistant_pool(
+                "requirement_analyst", self._model_client, self._prompt
             )
-            logger.debug(f"   ✅ AssistantAgent创建成功: {analyst_agent.name}")
 
             # 步骤4: 发送分析开始标识
             analysis_start_display = (
@@ -1474,52 +2143,18 @@ class RequirementAnalysisAgent(RoutedAgent):
                 f"⚡ [需求分析智能体] 步骤5: 开始执行需求分析流式输出 | 对话ID: {conversation_id}"
             )
             analysis_task = f"请分析以下需求：\n\n{analysis_content}"
-            logger.debug(f"   📋 分析任务: {analysis_task}")
-
-            requirements_parts = []
-            final_requirements = ""
-            user_input = ""
-
-            # 使用AutoGen最佳实践处理流式结果
-            async for item in analyst_agent.run_stream(task=analysis_task):
-                if isinstance(item, ModelClientStreamingChunkEvent):
-                    # 流式输出到前端
-                    if item.content:
-                        requirements_parts.append(item.content)
-                        await self.publish_message(
-                            ResponseMessage(
-                                source="需求分析智能体",
-                                content=item.content,
-                                message_type="streaming_chunk",  # 标记为流式块
-                            ),
-                            topic_id=TopicId(
-                                type=task_result_topic_type, source=self.id.key
-                            ),
-                        )
-                        logger.debug(
-                            f"📡 [需求分析智能体] 发送流式块 | 对话ID: {conversation_id} | 内容长度: {len(item.content)}"
-                        )
-
-                elif isinstance(item, TextMessage):
-                    # 记录智能体的完整输出
-                    final_requirements = item.content
-                    logger.info(
-                        f"📝 [需求分析智能体] 收到完整输出 | 对话ID: {conversation_id} | 内容长度: {len(item.content)}"
-                    )
-
-                elif isinstance(item, TaskResult):
-                    # 记录用户输入和最终结果
-                    if item.messages:
-                        user_input = item.messages[0].content  # 用户的输入
-                        final_requirements = item.messages[
-                            -1
-                        ].content  # 智能体的最终输出
-                        logger.info(
-                            f"📊 [需求分析智能体] TaskResult | 对话ID: {conversation_id} | 用户输入长度: {len(user_input)} | 最终输出长度: {len(final_requirements)}"
-                        )
-
-            # 使用最终结果，优先使用TaskResult或TextMessage的内容
-            requirements = final_requirements or "".join(requirements_parts)
+            logger.debug("   📋 分析任务: {}", truncate(analysis_task))
+
+            requirements = await run_stage_stream(
+                self,
+                stage="requirement_analysis",
+                source="需求分析智能体",
+                assistant_pool=assistant_pool,
+                system_prompt=self._prompt,
+                task=analysis_task,
+                conversation_id=conversation_id,
+                use_cache=not message.bypass_cache,
+            )
 
             # 发送完整消息 (text_message 类型)
             await self.publish_message(
@@ -1562,6 +2197,7 @@ class RequirementAnalysisAgent(RoutedAgent):
                 source="requirement_analyst",
                 content=requirements,
                 conversation_id=conversation_id,
+                bypass_cache=message.bypass_cache,
             )
             await self.publish_message(
                 testcase_message,
@@ -1613,6 +2249,10 @@ class TestCaseGenerationAgent(RoutedAgent):
         """
 
     @message_handler
+    @tracer.traced(
+        "agent.testcase_generation",
+        conversation_id=lambda self, message, ctx: message.conversation_id,
+    )
     async def handle_testcase_generation(
         self, message: TestCaseMessage, ctx: MessageContext
     ) -> None:
@@ -1657,69 +2297,34 @@ class TestCaseGenerationAgent(RoutedAgent):
                 f"📝 [测试用例生成智能体] 步骤2: 准备生成任务内容 | 对话ID: {conversation_id}"
             )
             requirements_content = str(message.content)
-            logger.debug(f"   📄 需求分析内容: {requirements_content}")
+            logger.debug("   📄 需求分析内容: {}", truncate(requirements_content))
 
-            # 步骤3: 创建测试用例生成智能体实例
+            # 步骤3: 准备测试用例生成AssistantAgent（从智能体池取用，执行完成后归还）
             logger.info(
-                f"🤖 [测试用例生成智能体] 步骤3: 创建AssistantAgent实例 | 对话ID: {conversation_id}"
+                f"🤖 [测试用例生成智能体] 步骤3: 准备AssistantAgent实例 | 对话ID: {conversation_id}"
             )
-            generator_agent = AssistantAgent(
-                name="testcase_generator",
-                model_client=self._model_client,
-                system_message=self._prompt,
-                model_client_stream=True,
+
+            assistant_pool = get_assistant_pool(
+                "testcase_generator", self._model_client, self._prompt
             )
-            logger.debug(f"   ✅ AssistantAgent创建成功: {generator_agent.name}")
 
             # 步骤4: 执行测试用例生成（流式输出）
             logger.info(
                 f"⚡ [测试用例生成智能体] 步骤4: 开始执行测试用例生成流式输出 | 对话ID: {conversation_id}"
             )
             generation_task = f"请为以下需求生成测试用例：\n\n{requirements_content}"
-            logger.debug(f"   📋 生成任务: {generation_task}")
-
-            testcases_parts = []
-            final_testcases = ""
-            user_input = ""
-
-            # 使用AutoGen最佳实践处理流式结果
-            async for item in generator_agent.run_stream(task=generation_task):
-                if isinstance(item, ModelClientStreamingChunkEvent):
-                    # 流式输出到前端
-                    if item.content:
-                        testcases_parts.append(item.content)
-                        await self.publish_message(
-                            ResponseMessage(
-                                source="测试用例生成智能体",
-                                content=item.content,
-                                message_type="streaming_chunk",  # 标记为流式块
-                            ),
-                            topic_id=TopicId(
-                                type=task_result_topic_type, source=self.id.key
-                            ),
-                        )
-                        logger.debug(
-                            f"📡 [测试用例生成智能体] 发送流式块 | 对话ID: {conversation_id} | 内容长度: {len(item.content)}"
-                        )
-
-                elif isinstance(item, TextMessage):
-                    # 记录智能体的完整输出
-                    final_testcases = item.content
-                    logger.info(
-                        f"📝 [测试用例生成智能体] 收到完整输出 | 对话ID: {conversation_id} | 内容长度: {len(item.content)}"
-                    )
-
-                elif isinstance(item, TaskResult):
-                    # 记录用户输入和最终结果
-                    if item.messages:
-                        user_input = item.messages[0].content  # 用户的输入
-                        final_testcases = item.messages[-1].content  # 智能体的最终输出
-                        logger.info(
-                            f"📊 [测试用例生成智能体] TaskResult | 对话ID: {conversation_id} | 用户输入长度: {len(user_input)} | 最终输出长度: {len(final_testcases)}"
-                        )
-
-            # 使用最终结果，优先使用TaskResult或TextMessage的内容
-            testcases = final_testcases or "".join(testcases_parts)
+            logger.debug("   📋 生成任务: {}", truncate(generation_task))
+
+            testcases = await run_stage_stream(
+                self,
+                stage="testcase_generation",
+                source="测试用例生成智能体",
+                assistant_pool=assistant_pool,
+                system_prompt=self._prompt,
+                task=generation_task,
+                conversation_id=conversation_id,
+                use_cache=not message.bypass_cache,
+            )
 
             # 发送完整消息 (text_message 类型)
             await self.publish_message(
@@ -1759,7 +2364,9 @@ class TestCaseGenerationAgent(RoutedAgent):
                 "last_update": datetime.now().isoformat(),
                 "status": "completed",
             }
-            testcase_runtime.conversation_states[conversation_id] = conversation_state
+            await testcase_runtime.update_conversation_state(
+                conversation_id, conversation_state, replace=True
+            )
             logger.debug(f"   📊 对话状态已更新: {conversation_state}")
 
             # 步骤7: 记录生成结果（仅日志记录，不重复发送）
@@ -1811,6 +2418,10 @@ class TestCaseOptimizationAgent(RoutedAgent):
         """
 
     @message_handler
+    @tracer.traced(
+        "agent.testcase_optimization",
+        conversation_id=lambda self, message, ctx: message.conversation_id,
+    )
     async def handle_testcase_optimization(
         self, message: FeedbackMessage, ctx: MessageContext
     ) -> None:
@@ -1865,68 +2476,32 @@ class TestCaseOptimizationAgent(RoutedAgent):
             logger.debug(f"   📋 优化任务长度: {len(optimization_task)} 字符")
             logger.debug(f"   💬 用户反馈详情: {message.feedback}")
             logger.debug(
-                f"   📄 原测试用例完整内容: {message.previous_testcases or ''}"
+                "   📄 原测试用例内容: {}", truncate(message.previous_testcases or "")
             )
 
-            # 步骤3: 创建优化智能体实例
+            # 步骤3: 准备用例评审优化AssistantAgent（从智能体池取用，执行完成后归还）
             logger.info(
-                f"🤖 [用例评审优化智能体] 步骤3: 创建AssistantAgent实例 | 对话ID: {conversation_id}"
+                f"🤖 [用例评审优化智能体] 步骤3: 准备AssistantAgent实例 | 对话ID: {conversation_id}"
             )
-            optimizer_agent = AssistantAgent(
-                name="testcase_optimizer",
-                model_client=self._model_client,
-                system_message=self._prompt,
-                model_client_stream=True,
+
+            assistant_pool = get_assistant_pool(
+                "testcase_optimizer", self._model_client, self._prompt
             )
-            logger.debug(f"   ✅ AssistantAgent创建成功: {optimizer_agent.name}")
 
             # 步骤4: 执行测试用例优化（流式输出）
             logger.info(
                 f"⚡ [用例评审优化智能体] 步骤4: 开始执行测试用例优化流式输出 | 对话ID: {conversation_id}"
             )
 
-            optimized_parts = []
-            final_optimized = ""
-            user_input = ""
-
-            # 使用AutoGen最佳实践处理流式结果
-            async for item in optimizer_agent.run_stream(task=optimization_task):
-                if isinstance(item, ModelClientStreamingChunkEvent):
-                    # 流式输出到前端
-                    if item.content:
-                        optimized_parts.append(item.content)
-                        await self.publish_message(
-                            ResponseMessage(
-                                source="用例评审优化智能体",
-                                content=item.content,
-                                message_type="streaming_chunk",  # 标记为流式块
-                            ),
-                            topic_id=TopicId(
-                                type=task_result_topic_type, source=self.id.key
-                            ),
-                        )
-                        logger.debug(
-                            f"📡 [用例评审优化智能体] 发送流式块 | 对话ID: {conversation_id} | 内容长度: {len(item.content)}"
-                        )
-
-                elif isinstance(item, TextMessage):
-                    # 记录智能体的完整输出
-                    final_optimized = item.content
-                    logger.info(
-                        f"📝 [用例评审优化智能体] 收到完整输出 | 对话ID: {conversation_id} | 内容长度: {len(item.content)}"
-                    )
-
-                elif isinstance(item, TaskResult):
-                    # 记录用户输入和最终结果
-                    if item.messages:
-                        user_input = item.messages[0].content  # 用户的输入
-                        final_optimized = item.messages[-1].content  # 智能体的最终输出
-                        logger.info(
-                            f"📊 [用例评审优化智能体] TaskResult | 对话ID: {conversation_id} | 用户输入长度: {len(user_input)} | 最终输出长度: {len(final_optimized)}"
-                        )
-
-            # 使用最终结果，优先使用TaskResult或TextMessage的内容
-            optimized_testcases = final_optimized or "".join(optimized_parts)
+            optimized_testcases = await run_stage_stream(
+                self,
+                stage="testcase_optimization",
+                source="用例评审优化智能体",
+                assistant_pool=assistant_pool,
+                system_prompt=self._prompt,
+                task=optimization_task,
+                conversation_id=conversation_id,
+            )
 
             # 发送完整消息 (text_message 类型)
             await self.publish_message(
@@ -1967,7 +2542,9 @@ class TestCaseOptimizationAgent(RoutedAgent):
                 "last_update": datetime.now().isoformat(),
                 "status": "completed",
             }
-            testcase_runtime.conversation_states[conversation_id] = conversation_state
+            await testcase_runtime.update_conversation_state(
+                conversation_id, conversation_state, replace=True
+            )
             logger.debug(f"   📊 对话状态已更新: {conversation_state}")
 
             # 步骤7: 记录优化结果（仅日志记录，不重复发送）
@@ -2030,6 +2607,10 @@ JSON格式要求：
         """
 
     @message_handler
+    @tracer.traced(
+        "agent.testcase_finalization",
+        conversation_id=lambda self, message, ctx: message.conversation_id,
+    )
     async def handle_testcase_finalization(
         self, message: TestCaseMessage, ctx: MessageContext
     ) -> None:
@@ -2074,19 +2655,16 @@ JSON格式要求：
                 f"📝 [结构化入库智能体] 步骤2: 准备结构化任务内容 | 对话ID: {conversation_id}"
             )
             testcase_content = str(message.content)
-            logger.debug(f"   📄 测试用例内容: {testcase_content}")
+            logger.debug("   📄 测试用例内容: {}", truncate(testcase_content))
 
-            # 步骤3: 创建结构化智能体实例
+            # 步骤3: 准备结构化入库AssistantAgent（从智能体池取用，执行完成后归还）
             logger.info(
-                f"🤖 [结构化入库智能体] 步骤3: 创建AssistantAgent实例 | 对话ID: {conversation_id}"
+                f"🤖 [结构化入库智能体] 步骤3: 准备AssistantAgent实例 | 对话ID: {conversation_id}"
             )
-            finalizer_agent = AssistantAgent(
-                name="testcase_finalizer",
-                model_client=self._model_client,
-                system_message=self._prompt,
-                model_client_stream=True,
+
+            assistant_pool = get_assistant_pool(
+                "testcase_finalizer", self._model_client, self._prompt
             )
-            logger.debug(f"   ✅ AssistantAgent创建成功: {finalizer_agent.name}")
 
             # 步骤4: 执行结构化处理（流式输出）
             logger.info(
@@ -2095,50 +2673,17 @@ JSON格式要求：
             finalization_task = (
                 f"请将以下测试用例转换为JSON格式：\n\n{testcase_content}"
             )
-            logger.debug(f"   📋 结构化任务: {finalization_task}")
-
-            structured_parts = []
-            final_structured = ""
-            user_input = ""
-
-            # 使用AutoGen最佳实践处理流式结果
-            async for item in finalizer_agent.run_stream(task=finalization_task):
-                if isinstance(item, ModelClientStreamingChunkEvent):
-                    # 流式输出到前端
-                    if item.content:
-                        structured_parts.append(item.content)
-                        await self.publish_message(
-                            ResponseMessage(
-                                source="结构化入库智能体",
-                                content=item.content,
-                                message_type="streaming_chunk",  # 标记为流式块
-                            ),
-                            topic_id=TopicId(
-                                type=task_result_topic_type, source=self.id.key
-                            ),
-                        )
-                        logger.debug(
-                            f"📡 [结构化入库智能体] 发送流式块 | 对话ID: {conversation_id} | 内容长度: {len(item.content)}"
-                        )
+            logger.debug("   📋 结构化任务: {}", truncate(finalization_task))
 
-                elif isinstance(item, TextMessage):
-                    # 记录智能体的完整输出
-                    final_structured = item.content
-                    logger.info(
-                        f"📝 [结构化入库智能体] 收到完整输出 | 对话ID: {conversation_id} | 内容长度: {len(item.content)}"
-                    )
-
-                elif isinstance(item, TaskResult):
-                    # 记录用户输入和最终结果
-                    if item.messages:
-                        user_input = item.messages[0].content  # 用户的输入
-                        final_structured = item.messages[-1].content  # 智能体的最终输出
-                        logger.info(
-                            f"📊 [结构化入库智能体] TaskResult | 对话ID: {conversation_id} | 用户输入长度: {len(user_input)} | 最终输出长度: {len(final_structured)}"
-                        )
-
-            # 使用最终结果，优先使用TaskResult或TextMessage的内容
-            structured_testcases = final_structured or "".join(structured_parts)
+            structured_testcases = await run_stage_stream(
+                self,
+                stage="testcase_finalization",
+                source="结构化入库智能体",
+                assistant_pool=assistant_pool,
+                system_prompt=self._prompt,
+                task=finalization_task,
+                conversation_id=conversation_id,
+            )
 
             # 发送完整消息 (text_message 类型)
             await self.publish_message(
@@ -2151,7 +2696,7 @@ JSON格式要求：
                 topic_id=TopicId(type=task_result_topic_type, source=self.id.key),
             )
             logger.success(
-                f"✅ [结构化入库智能体] 结构化处理执行完成 | 对话ID: {conversation_id} | 结构化结果长度: {len(structured_testcases)} 字符 | 完整内容: {structured_testcases}"
+                f"✅ [结构化入库智能体] 结构化处理执行完成 | 对话ID: {conversation_id} | 结构化结果长度: {len(structured_testcases)} 字符"
             )
 
             # 步骤5: JSON格式验证
@@ -2187,7 +2732,7 @@ JSON格式要求：
                     f"⚠️  [结构化入库智能体] JSON格式验证失败 | 对话ID: {conversation_id}"
                 )
                 logger.warning(f"   🐛 JSON错误: {str(e)}")
-                logger.warning(f"   📄 原始结果: {structured_testcases}")
+                logger.warning("   📄 原始结果: {}", truncate(structured_testcases))
                 logger.info(f"   🔄 使用原始内容作为备选方案")
                 structured_testcases = testcase_content
 
@@ -2216,7 +2761,9 @@ JSON格式要求：
                 "last_update": datetime.now().isoformat(),
                 "status": "completed",
             }
-            testcase_runtime.conversation_states[conversation_id] = conversation_state
+            await testcase_runtime.update_conversation_state(
+                conversation_id, conversation_state, replace=True
+            )
             logger.debug(f"   📊 最终对话状态: {conversation_state}")
 
             # 步骤8: 发送最终结果到结果收集器
@@ -0,0 +1,447 @@
+"""
+测试用例智能体工作进程
+默认情况下智能体运行时与 HTTP/SSE 服务共用 API 进程的事件循环，
+智能体编排、提示词构建、JSON 处理和日志等 CPU 工作会拖慢请求处理。
+配置 testcase.runtime_mode: process 后，智能体运行时放到独立的工作进程中，
+API 进程只负责转发请求和流式事件，流水线的 CPU 工作可以分散到多个核心上
+
+- 进程之间通过 multiprocessing 管道通信（未依赖 grpc，不使用 AutoGen 的分布式 worker 运行时）
+- 按对话ID哈希选择工作进程，同一对话的生成、反馈、历史查询和清除落到同一个进程
+- 工作进程异常退出时，正在处理的请求返回错误，并自动重启该进程
+- 链路追踪和指标只记录在各自的工作进程中
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from loguru import logger
+
+
+class WorkerError(RuntimeError):
+    """工作进程处理请求失败或异常退出"""
+
+
+class _WorkerHandle:
+    """API 进程中保存的单个工作进程信息"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.conn = None
+        self.ready: Optional[asyncio.Future] = None
+        self.pending: Dict[int, asyncio.Queue] = {}  # 请求ID -> 响应队列
+        self.requests = 0
+        self.restarts = 0
+
+
+class TestCaseWorkerPool:
+    """测试用例智能体工作进程池"""
+
+    def __init__(
+        self,
+        processes: int = 2,
+        start_timeout: float = 60.0,
+        stop_timeout: float = 10.0,
+        db_config: Optional[Dict[str, Any]] = None,
+        initializer: Optional[Callable[[], None]] = None,
+    ):
+        """
+        初始化工作进程池
+
+        Args:
+            processes: 工作进程数量
+            start_timeout: 等待工作进程完成初始化的最长时间（秒）
+            stop_timeout: 停止时等待工作进程保存进度并退出的最长时间（秒）
+            db_config: 工作进程使用的 Tortoise 配置，为 None 时使用应用数据库
+            initializer: 工作进程初始化时调用的函数（必须可以被 pickle）
+        """
+        self.processes = max(1, processes)
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.db_config = db_config
+        self.initializer = initializer
+        self.started = False
+
+        self._ids = itertools.count(1)
+        self._workers: List[_WorkerHandle] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 使用 spawn 启动，避免 fork 时复制 API 进程的事件循环和线程
+        self._context = multiprocessing.get_context("spawn")
+
+    async def start(self) -> None:
+        """启动所有工作进程并等待初始化完成"""
+        if self.started:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._workers = [_WorkerHandle(index) for index in range(self.processes)]
+        for worker in self._workers:
+            self._spawn(worker)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(worker.ready for worker in self._workers)),
+                self.start_timeout,
+            )
+        except Exception:
+            await self._terminate_all()
+            raise
+        self.started = True
+        logger.success(
+            f"🧵 [工作进程] 测试用例工作进程已启动 | 数量: {self.processes} | "
+            f"PID: {[worker.process.pid for worker in self._workers]}"
+        )
+
+    def _spawn(self, worker: _WorkerHandle) -> None:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=run_worker,
+            args=(worker.index, child_conn, self.db_config, self.initializer),
+            name=f"testcase-worker-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker.process = process
+        worker.conn = parent_conn
+        if worker.ready is None or worker.ready.done():
+            worker.ready = self._loop.create_future()
+        threading.Thread(
+            target=self._read,
+            args=(worker, parent_conn),
+            name=f"testcase-worker-reader-{worker.index}",
+            daemon=True,
+        ).start()
+
+    def _read(self, worker: _WorkerHandle, conn) -> None:
+        """读取线程：把工作进程发来的消息交给事件循环处理"""
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if not self._call_in_loop(self._dispatch, worker, message):
+                return
+        self._call_in_loop(self._on_exit, worker, conn)
+
+    def _call_in_loop(self, callback, *args) -> bool:
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+            return True
+        except RuntimeError:
+            # 事件循环已关闭
+            return False
+
+    def _dispatch(self, worker: _WorkerHandle, message) -> None:
+        request_id, kind, data = message
+        if kind == "ready":
+            if not worker.ready.done():
+                worker.ready.set_result(data)
+            return
+        queue = worker.pending.get(request_id)
+        if queue is not None:
+            queue.put_nowait((kind, data))
+
+    def _on_exit(self, worker: _WorkerHandle, conn) -> None:
+        """工作进程退出：未完成的请求返回错误，运行期间退出时重启该进程"""
+        if worker.conn is not conn:
+            return
+        for queue in worker.pending.values():
+            queue.put_nowait(("error", "测试用例工作进程异常退出"))
+        worker.pending.clear()
+        if not worker.ready.done():
+            worker.ready.set_exception(WorkerError("测试用例工作进程启动失败"))
+        if not self.started:
+            return
+        worker.restarts += 1
+        # 连续崩溃时逐步拉长重启间隔，期间到达的请求等待新进程就绪
+        delay = min(0.5 * (worker.restarts - 1), 5.0)
+        logger.error(
+            f"💥 [工作进程] 工作进程异常退出，{delay}s 后重启 | 序号: {worker.index} | "
+            f"退出码: {worker.process.exitcode} | 重启次数: {worker.restarts}"
+        )
+        worker.ready = self._loop.create_future()
+        self._loop.call_later(delay, self._respawn, worker)
+
+    def _respawn(self, worker: _WorkerHandle) -> None:
+        if self.started:
+            self._spawn(worker)
+
+    def _select(self, conversation_id: str) -> _WorkerHandle:
+        """按对话ID哈希选择工作进程"""
+        digest = zlib.crc32(conversation_id.encode("utf-8"))
+        return self._workers[digest % len(self._workers)]
+
+    async def _send(self, worker: _WorkerHandle, request_id: int, op: str, payload):
+        # 重启中的工作进程初始化完成后才开始读取请求
+        await asyncio.shield(worker.ready)
+        try:
+            worker.conn.send((request_id, op, payload))
+        except (OSError, ValueError) as e:
+            raise WorkerError(f"测试用例工作进程不可用: {e}") from e
+
+    async def stream(
+        self, op: str, conversation_id: str, payload: Dict[str, Any]
+    ) -> AsyncIterator[Dict]:
+        """
+        发送流式请求并逐条返回工作进程的输出
+
+        调用方提前结束迭代（客户端断开、停机中断）时通知工作进程取消该请求
+
+        Raises:
+            WorkerError: 工作进程处理失败或异常退出
+        """
+        worker = self._select(conversation_id)
+        request_id = next(self._ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        worker.pending[request_id] = queue
+        worker.requests += 1
+        finished = False
+        try:
+            await self._send(worker, request_id, op, payload)
+            while True:
+                kind, data = await queue.get()
+                if kind == "event":
+                    yield data
+                    continue
+                finished = True
+                if kind == "error":
+                    raise WorkerError(data)
+                return
+        finally:
+            worker.pending.pop(request_id, None)
+            if not finished:
+                try:
+                    worker.conn.send((request_id, "cancel", None))
+                except (OSError, ValueError):
+                    pass
+
+    async def call(self, op: str, conversation_id: str, payload: Dict[str, Any]) -> Any:
+        """发送请求并等待工作进程返回结果"""
+        return await self._call_worker(self._select(conversation_id), op, payload)
+
+    async def _call_worker(self, worker: _WorkerHandle, op: str, payload) -> Any:
+        request_id = next(self._ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        worker.pending[request_id] = queue
+        worker.requests += 1
+        try:
+            await self._send(worker, request_id, op, payload)
+            kind, data = await queue.get()
+        finally:
+            worker.pending.pop(request_id, None)
+        if kind == "error":
+            raise WorkerError(data)
+        return data
+
+    async def stop(self) -> None:
+        """通知工作进程保存未完成对话的进度并退出，超时后强制结束"""
+        if not self.started:
+            return
+        self.started = False
+        for worker in self._workers:
+            try:
+                worker.conn.send((0, "shutdown", None))
+            except (OSError, ValueError):
+                pass
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(worker.process.join, self.stop_timeout)
+                for worker in self._workers
+            )
+        )
+        await self._terminate_all()
+        logger.info(f"🛑 [工作进程] 测试用例工作进程已停止 | 数量: {self.processes}")
+
+    async def _terminate_all(self) -> None:
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                logger.warning(
+                    f"⚠️ [工作进程] 工作进程未按时退出，强制结束 | PID: {worker.process.pid}"
+                )
+                worker.process.terminate()
+                await asyncio.to_thread(worker.process.join, 5)
+            if worker.conn is not None:
+                worker.conn.close()
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取工作进程统计信息，包括各进程中的运行时统计"""
+        workers = []
+        for worker in self._workers:
+            stats = {
+                "index": worker.index,
+                "pid": worker.process.pid if worker.process else None,
+                "alive": bool(worker.process and worker.process.is_alive()),
+                "requests": worker.requests,
+                "inflight": len(worker.pending),
+                "restarts": worker.restarts,
+            }
+            if self.started and stats["alive"]:
+                try:
+                    stats["runtime"] = await asyncio.wait_for(
+                        self._call_worker(worker, "stats", None), 5
+                    )
+                except Exception as e:
+                    stats["runtime"] = {"error": str(e)}
+            workers.append(stats)
+        return {
+            "mode": "process",
+            "processes": self.processes,
+            "started": self.started,
+            "workers": workers,
+        }
+
+
+def run_worker(
+    index: int,
+    conn,
+    db_config: Optional[Dict[str, Any]] = None,
+    initializer: Optional[Callable[[], None]] = None,
+) -> None:
+    """工作进程入口"""
+    # Ctrl+C 会发送到整个进程组，由 API 进程统一通知工作进程退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer()
+    asyncio.run(_serve(index, conn, db_config))
+
+
+async def _serve(index: int, conn, db_config: Optional[Dict[str, Any]]) -> None:
+    """在工作进程的事件循环中处理 API 进程转发的请求"""
+    from tortoise import Tortoise
+
+    from backend.services.quota_service import quota_manager
+    from backend.services.testcase_service import testcase_runtime
+    from backend.services.usage_service import usage_recorder
+
+    if db_config is None:
+        from backend.core.database import TORTOISE_ORM
+
+        db_config = TORTOISE_ORM
+    await Tortoise.init(config=db_config)
+    await testcase_runtime.runtime_pool.start()
+    usage_recorder.start()
+    quota_manager.start()
+
+    loop = asyncio.get_running_loop()
+    commands: asyncio.Queue = asyncio.Queue()
+
+    def read() -> None:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                # API 进程已退出
+                message = (0, "shutdown", None)
+            loop.call_soon_threadsafe(commands.put_nowait, message)
+            if message[1] == "shutdown":
+                return
+
+    threading.Thread(target=read, name="testcase-worker-commands", daemon=True).start()
+    conn.send((0, "ready", os.getpid()))
+    logger.info(f"🧵 [工作进程] 工作进程 {index} 已就绪 | PID: {os.getpid()}")
+
+    tasks: Dict[int, asyncio.Task] = {}
+    while True:
+        request_id, op, payload = await commands.get()
+        if op == "shutdown":
+            break
+        if op == "cancel":
+            task = tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+            continue
+        task = asyncio.create_task(_handle(conn, request_id, op, payload))
+        tasks[request_id] = task
+        task.add_done_callback(
+            lambda _, request_id=request_id: tasks.pop(request_id, None)
+        )
+
+    pending = list(tasks.values())
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    await testcase_runtime.cleanup_all()
+    await testcase_runtime.runtime_pool.close()
+    await usage_recorder.stop()
+    await quota_manager.stop()
+    await Tortoise.close_connections()
+    logger.info(f"🛑 [工作进程] 工作进程 {index} 已退出 | PID: {os.getpid()}")
+
+
+async def _handle(conn, request_id: int, op: str, payload) -> None:
+    """处理单个请求，流式请求逐条发送输出"""
+    from backend.services.testcase_service import (
+        FeedbackMessage,
+        RequirementMessage,
+        testcase_runtime,
+        testcase_service,
+    )
+
+    try:
+        if op in ("generate", "feedback"):
+            if op == "generate":
+                stream = testcase_service.start_streaming_generation(
+                    RequirementMessage(**payload)
+                )
+            else:
+                stream = testcase_service.process_streaming_feedback(
+                    FeedbackMessage(**payload)
+                )
+            async for stream_data in stream:
+                conn.send((request_id, "event", stream_data))
+            conn.send((request_id, "end", None))
+            return
+
+        if op == "history":
+            result = await testcase_service.get_history(**payload)
+        elif op == "messages":
+            result = await testcase_service.get_messages(**payload)
+        elif op == "clear":
+            result = await testcase_service.clear_conversation(**payload)
+        elif op == "stats":
+            result = {
+                "pid": os.getpid(),
+                "active_runtimes": len(testcase_runtime.runtimes),
+                "warm_pool": testcase_runtime.runtime_pool.get_stats(),
+                "restored": testcase_runtime.restored,
+                "conversation_store": (
+                    testcase_runtime.store.get_stats()
+                    if testcase_runtime.store is not None
+                    else None
+                ),
+            }
+        else:
+            raise ValueError(f"未知的工作进程请求: {op}")
+        conn.send((request_id, "result", result))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(
+            f"❌ [工作进程] 处理请求失败 | 请求: {op} | 错误: {type(e).__name__}: {e}"
+        )
+        conn.send((request_id, "error", f"{type(e).__name__}: {e}"))
+
+
+def create_testcase_worker_pool() -> Optional[TestCaseWorkerPool]:
+    """根据配置创建工作进程池，未开启进程模式时返回 None"""
+    try:
+        from backend.conf.config import settings
+
+        testcase_config = getattr(settings, "testcase", {}) or {}
+        if testcase_config.get("runtime_mode", "inprocess") != "process":
+            return None
+        return TestCaseWorkerPool(
+            processes=testcase_config.get("worker_processes", 2),
+            start_timeout=testcase_config.get("worker_start_timeout", 60.0),
+        )
+    except ImportError:
+        logger.warning("无法导入配置，测试用例智能体在 API 进程中运行")
+        return None
+
+
+testcase_workers = create_testcase_worker_pool()
@@ -0,0 +1,344 @@
+"""
+大模型 token 用量统计
+每次模型调用结束时把用量记到内存中（按日期、对话、阶段和模型合并），
+后台任务定期批量写入 token_usage 表，并把当天的合计累加到 TestCaseStatistics。
+写库失败时用量留在内存中，下次刷新时重试
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from autogen_core.models import RequestUsage
+from loguru import logger
+from tortoise.functions import Count, Sum
+
+from backend.core.batch_flush import PeriodicFlusher, upsert_increments
+from backend.core.llm_ratelimit import estimate_text_tokens
+from backend.models.testcase import TestCaseStatistics, TokenUsage
+from backend.services.quota_service import quota_manager
+
+# (日期, 对话ID, 阶段, 模型)
+UsageKey = Tuple[date, str, str, str]
+
+# 用量查询支持的分组字段
+USAGE_GROUP_FIELDS = ("stage", "user_id", "conversation_id", "model", "date")
+
+
+def resolve_usage(
+    prompt_tokens: Optional[int],
+    completion_tokens: Optional[int],
+    prompt: str,
+    completion: str,
+) -> RequestUsage:
+    """
+    确定一次调用要记录的用量
+
+    服务商返回了用量时直接使用；流在结束前被中断（客户端断开、模型出错）或服务商没有返回用量时，
+    按发送的输入和已经收到的输出估算，已消耗的 token 不会漏记
+
+    Args:
+        prompt_tokens: 服务商返回的输入 token 数
+        completion_tokens: 服务商返回的输出 token 数
+        prompt: 发送给模型的输入
+        completion: 已经收到的输出
+    """
+    if prompt_tokens is None and completion_tokens is None:
+        return RequestUsage(
+            prompt_tokens=estimate_text_tokens(prompt),
+            completion_tokens=estimate_text_tokens(completion),
+        )
+    return RequestUsage(
+        prompt_tokens=prompt_tokens or 0, completion_tokens=completion_tokens or 0
+    )
+
+
+class UsageRecorder:
+    """token 用量记录器"""
+
+    def __init__(
+        self, enabled: bool = True, flush_interval: float = 10.0, max_users: int = 10000
+    ):
+        """
+        初始化用量记录器
+
+        Args:
+            enabled: 是否记录用量
+            flush_interval: 写库间隔（秒）
+            max_users: 最多记住多少个对话所属的用户，超过后淘汰最早绑定的对话
+        """
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_users = max_users
+        self._pending: Dict[UsageKey, Dict[str, Any]] = {}
+        self._users: OrderedDict = OrderedDict()
+        self._flush_lock = asyncio.Lock()
+        self._flusher = PeriodicFlusher("用量统计", self.flush, flush_interval)
+        self.recorded = 0
+        self.flushed = 0
+        self.errors = 0
+        self.last_flush: Optional[float] = None
+        logger.info(f"用量统计初始化 | 启用: {enabled} | 写库间隔: {flush_interval}s")
+
+    def bind_user(self, conversation_id: str, user_id: Optional[int]) -> None:
+        """记录对话所属的用户，之后该对话的用量都计到这个用户名下"""
+        if user_id is None:
+            return
+        self._users[conversation_id] = user_id
+        self._users.move_to_end(conversation_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def user_of(self, conversation_id: str) -> Optional[int]:
+        """获取对话所属的用户"""
+        return self._users.get(conversation_id)
+
+    def record(
+        self,
+        conversation_id: str,
+        stage: str,
+        model: str,
+        usage: Optional[RequestUsage],
+        duration: float = 0.0,
+    ) -> None:
+        """
+        记录一次模型调用的用量（只写内存）
+
+        Args:
+            conversation_id: 对话ID
+            stage: 流水线阶段，聊天为 chat
+            model: 模型名称
+            usage: 模型返回的用量，服务商没有返回时为 None
+            duration: 调用耗时（秒）
+        """
+        if not self.enabled:
+            return
+        key = (date.today(), conversation_id, stage, model)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = {
+                "user_id": None,
+                "calls": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "duration": 0.0,
+            }
+        entry["user_id"] = self.user_of(conversation_id) or entry["user_id"]
+        entry["calls"] += 1
+        if usage is not None:
+            entry["prompt_tokens"] += usage.prompt_tokens
+            entry["completion_tokens"] += usage.completion_tokens
+            quota_manager.consume(
+                entry["user_id"], usage.prompt_tokens + usage.completion_tokens
+            )
+        entry["duration"] += duration
+        self.recorded += 1
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """
+        把内存中的用量写入数据库
+
+        Returns:
+            int: 写入的汇总行数
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            written = 0
+            daily: Dict[date, Dict[str, int]] = {}
+            for key, entry in pending.items():
+                try:
+                    await self._write(key, entry)
+                except Exception as e:
+                    self.errors += 1
+                    self._merge_back(key, entry)
+                    logger.warning(f"⚠️ [用量统计] 写入用量失败，稍后重试: {e}")
+                    continue
+                written += 1
+                totals = daily.setdefault(
+                    key[0], {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+                )
+                for field in totals:
+                    totals[field] += entry[field]
+
+            for day, totals in daily.items():
+                try:
+                    await self._rollup(day, totals)
+                except Exception as e:
+                    # 旧数据库缺少用量字段时只影响日统计，明细已经写入
+                    self.errors += 1
+                    logger.warning(
+                        f"⚠️ [用量统计] 更新日统计失败（需要执行 make migrate）: {e}"
+                    )
+
+            self.flushed += written
+            self.last_flush = time.time()
+            if written:
+                logger.debug(f"💾 [用量统计] 用量已写入 | 行数: {written}")
+            return written
+
+    def _merge_back(self, key: UsageKey, entry: Dict[str, Any]) -> None:
+        current = self._pending.get(key)
+        if current is None:
+            self._pending[key] = entry
+            return
+        for field in ("calls", "prompt_tokens", "completion_tokens", "duration"):
+            current[field] += entry[field]
+        current["user_id"] = current["user_id"] or entry["user_id"]
+
+    @staticmethod
+    async def _write(key: UsageKey, entry: Dict[str, Any]) -> None:
+        day, conversation_id, stage, model = key
+        await upsert_increments(
+            TokenUsage,
+            {
+                "date": day,
+                "conversation_id": conversation_id,
+                "stage": stage,
+                "model": model,
+            },
+            {
+                field: entry[field]
+                for field in ("calls", "prompt_tokens", "completion_tokens", "duration")
+            },
+            {"user_id": entry["user_id"]},
+        )
+
+    @staticmethod
+    async def _rollup(day: date, totals: Dict[str, int]) -> None:
+        await upsert_increments(
+            TestCaseStatistics,
+            {"date": day},
+            {
+                "total_llm_calls": totals["calls"],
+                "total_prompt_tokens": totals["prompt_tokens"],
+                "total_completion_tokens": totals["completion_tokens"],
+            },
+        )
+
+    async def query(
+        self,
+        group_by: str = "stage",
+        conversation_id: Optional[str] = None,
+        user_id: Optional[int] = None,
+        stage: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        按维度汇总用量，按 token 总数从高到低排序
+
+        Args:
+            group_by: 分组字段，见 USAGE_GROUP_FIELDS
+            conversation_id: 只统计该对话
+            user_id: 只统计该用户
+            stage: 只统计该阶段
+            start_date: 开始日期（含）
+            end_date: 结束日期（含）
+
+        Returns:
+            List[Dict[str, Any]]: 每组的调用次数、token 数、耗时和平均耗时
+        """
+        if group_by not in USAGE_GROUP_FIELDS:
+            raise ValueError(f"不支持的分组字段: {group_by}")
+        # 先把本进程尚未写库的用量写入，查询结果包含刚结束的调用
+        await self.flush()
+
+        filters: Dict[str, Any] = {}
+        if conversation_id:
+            filters["conversation_id"] = conversation_id
+        if user_id is not None:
+            filters["user_id"] = user_id
+        if stage:
+            filters["stage"] = stage
+        if start_date:
+            filters["date__gte"] = start_date
+        if end_date:
+            filters["date__lte"] = end_date
+
+        rows = (
+            await TokenUsage.filter(**filters)
+            .annotate(
+                sum_calls=Sum("calls"),
+                sum_prompt_tokens=Sum("prompt_tokens"),
+                sum_completion_tokens=Sum("completion_tokens"),
+                sum_duration=Sum("duration"),
+                conversations=Count("conversation_id", distinct=True),
+            )
+            .group_by(group_by)
+            .values(
+                group_by,
+                "sum_calls",
+                "sum_prompt_tokens",
+                "sum_completion_tokens",
+                "sum_duration",
+                "conversations",
+            )
+        )
+        items = []
+        for row in rows:
+            calls = row["sum_calls"] or 0
+            prompt_tokens = row["sum_prompt_tokens"] or 0
+            completion_tokens = row["sum_completion_tokens"] or 0
+            duration = row["sum_duration"] or 0.0
+            value = row[group_by]
+            items.append(
+                {
+                    group_by: value.isoformat() if isinstance(value, date) else value,
+                    "calls": calls,
+                    "conversations": row["conversations"],
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "duration": round(duration, 3),
+                    "avg_duration": round(duration / calls, 3) if calls else 0.0,
+                }
+            )
+        items.sort(key=lambda item: item["total_tokens"], reverse=True)
+        return items
+
+    def start(self) -> None:
+        """在当前事件循环中启动定期写库任务"""
+        if self.enabled:
+            self._flusher.start()
+
+    async def stop(self) -> None:
+        """停止定期写库并写入剩余用量"""
+        await self._flusher.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取用量记录器统计信息"""
+        return {
+            "enabled": self.enabled,
+            "flush_interval": self.flush_interval,
+            "pending": self.pending,
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "errors": self.errors,
+            "last_flush": self.last_flush,
+        }
+
+
+def create_usage_recorder() -> UsageRecorder:
+    """创建用量记录器实例"""
+    try:
+        from backend.conf.config import settings
+
+        usage_config = getattr(settings, "usage", {}) or {}
+        return UsageRecorder(
+            enabled=usage_config.get("enabled", True),
+            flush_interval=usage_config.get("flush_interval", 10.0),
+        )
+    except ImportError:
+        logger.warning("无法导入配置，用量统计使用默认参数")
+        return UsageRecorder()
+
+
+usage_recorder = create_usage_recorder()
@@ -87,6 +87,9 @@ const ChatPage: React.FC = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...(localStorage.getItem('token') && {
+            Authorization: `Bearer ${localStorage.getItem('token')}`,
+          }),
         },
         body: JSON.stringify({
           message: content,
@@ -624,6 +624,9 @@ const TestCasePage: React.FC = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...(localStorage.getItem('token') && {
+            Authorization: `Bearer ${localStorage.getItem('token')}`,
+          }),
         },
         body: JSON.stringify(requestData),
       });
@@ -694,6 +697,9 @@ const TestCasePage: React.FC = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...(localStorage.getItem('token') && {
+            Authorization: `Bearer ${localStorage.getItem('token')}`,
+          }),
         },
         body: JSON.stringify(feedbackData),
       });
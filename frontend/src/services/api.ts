@@ -45,6 +45,9 @@ export const chatApi = {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        ...(localStorage.getItem('token') && {
+          Authorization: `Bearer ${localStorage.getItem('token')}`,
+        }),
       },
       body: JSON.stringify(request),
     });
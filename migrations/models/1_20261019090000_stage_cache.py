@@ -0,0 +1,20 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "testcase_stage_cache" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "cache_key" VARCHAR(64) NOT NULL UNIQUE /* 缓存键 */,
+    "stage" VARCHAR(50) NOT NULL /* 流水线阶段 */,
+    "model" VARCHAR(100) NOT NULL /* 模型名称 */,
+    "content" TEXT NOT NULL /* 阶段输出内容 */,
+    "hit_count" INT NOT NULL DEFAULT 0 /* 命中次数 */,
+    "created_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP /* 创建时间 */,
+    "last_accessed" TIMESTAMP NOT NULL /* 最后访问时间 */
+) /* 测试用例流水线阶段结果缓存 */;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "testcase_stage_cache";"""
@@ -0,0 +1,18 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "conversation_snapshots" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "kind" VARCHAR(20) NOT NULL /* 对话类型: testcase/chat */,
+    "conversation_id" VARCHAR(255) NOT NULL /* 对话ID */,
+    "data" JSON NOT NULL /* 快照内容 */,
+    "updated_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP /* 更新时间 */,
+    CONSTRAINT "uid_conversatio_kind_cae3e9" UNIQUE ("kind", "conversation_id")
+) /* 对话状态快照，多个 worker 进程之间共享未完成对话的记忆和状态 */;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "conversation_snapshots";"""
@@ -0,0 +1,32 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "token_usage" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "date" DATE NOT NULL /* 统计日期 */,
+    "user_id" INT /* 用户ID */,
+    "conversation_id" VARCHAR(255) NOT NULL /* 对话ID */,
+    "stage" VARCHAR(50) NOT NULL /* 流水线阶段或 chat */,
+    "model" VARCHAR(100) NOT NULL /* 模型名称 */,
+    "calls" INT NOT NULL DEFAULT 0 /* 调用次数 */,
+    "prompt_tokens" BIGINT NOT NULL DEFAULT 0 /* 输入 token 数 */,
+    "completion_tokens" BIGINT NOT NULL DEFAULT 0 /* 输出 token 数 */,
+    "duration" REAL NOT NULL DEFAULT 0 /* 调用总耗时（秒） */,
+    "created_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP /* 创建时间 */,
+    "updated_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP /* 更新时间 */,
+    CONSTRAINT "uid_token_usage_date_dccea8" UNIQUE ("date", "conversation_id", "stage", "model")
+) /* 大模型 token 用量，按日期、对话、阶段和模型汇总 */;
+        CREATE INDEX IF NOT EXISTS "idx_token_usage_user_id_61419a" ON "token_usage" ("user_id", "date");
+        ALTER TABLE "testcase_statistics" ADD "total_llm_calls" INT NOT NULL DEFAULT 0 /* 大模型调用次数 */;
+        ALTER TABLE "testcase_statistics" ADD "total_prompt_tokens" BIGINT NOT NULL DEFAULT 0 /* 输入 token 总数 */;
+        ALTER TABLE "testcase_statistics" ADD "total_completion_tokens" BIGINT NOT NULL DEFAULT 0 /* 输出 token 总数 */;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "testcase_statistics" DROP COLUMN "total_llm_calls";
+        ALTER TABLE "testcase_statistics" DROP COLUMN "total_prompt_tokens";
+        ALTER TABLE "testcase_statistics" DROP COLUMN "total_completion_tokens";
+        DROP TABLE IF EXISTS "token_usage";"""
@@ -0,0 +1,19 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "user_quota_usage" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "user_id" INT NOT NULL /* 用户ID */,
+    "date" DATE NOT NULL /* 统计日期 */,
+    "requests" INT NOT NULL DEFAULT 0 /* 请求数 */,
+    "tokens" BIGINT NOT NULL DEFAULT 0 /* token 数 */,
+    "updated_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP /* 更新时间 */,
+    CONSTRAINT "uid_user_quota__user_id_1c3642" UNIQUE ("user_id", "date")
+) /* 用户每天的请求数和 token 用量，用于配额控制 */;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "user_quota_usage";"""
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+本地模拟的 OpenAI 兼容大模型服务
+用于离线压测和延迟测试：首字延迟、输出速度、分块大小、错误率均可配置，
+根据系统提示词识别测试用例生成的各个阶段，返回对应的固定输出
+
+使用方法:
+    python scripts/fake_llm_server.py --port 8100 --ttft 0.5 --tokens-per-second 50
+
+然后将应用的模型地址指向该服务（settings.local.yaml 或环境变量）:
+    DYNACONF_AIMODEL__BASE_URL=http://127.0.0.1:8100/v1
+    DYNACONF_AIMODEL__API_KEY=fake-key
+
+说明: 这里把一个字符计为一个 token
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from loguru import logger
+
+REQUIREMENT_ANALYSIS_OUTPUT = """## 需求分析
+
+### 功能需求
+1. 用户可以使用用户名和密码登录系统
+2. 登录失败 5 次后账号锁定 30 分钟
+3. 登录成功后跳转到首页并显示用户名
+
+### 业务规则
+- 用户名长度 4-20 个字符，只允许字母、数字和下划线
+- 密码长度 8-32 个字符，必须包含字母和数字
+
+### 测试重点
+- 正常登录流程
+- 用户名、密码的边界值
+- 账号锁定与解锁
+"""
+
+TESTCASE_OUTPUT = """## 测试用例
+
+| 用例ID | 标题 | 优先级 | 前置条件 | 测试步骤 | 预期结果 |
+| --- | --- | --- | --- | --- | --- |
+| TC001 | 正确的用户名和密码登录 | 高 | 用户已注册 | 1. 输入正确的用户名和密码 2. 点击登录 | 登录成功并跳转到首页 |
+| TC002 | 错误的密码登录 | 高 | 用户已注册 | 1. 输入正确的用户名和错误的密码 2. 点击登录 | 提示用户名或密码错误 |
+| TC003 | 连续 5 次密码错误 | 高 | 用户已注册 | 1. 连续 5 次输入错误的密码 | 账号被锁定 30 分钟 |
+| TC004 | 用户名长度为 3 | 中 | 无 | 1. 输入 3 个字符的用户名 2. 点击登录 | 提示用户名长度不合法 |
+| TC005 | 密码不包含数字 | 中 | 无 | 1. 输入只有字母的密码 2. 点击登录 | 提示密码格式不合法 |
+"""
+
+CHAT_OUTPUT = (
+    "你好！我是模拟的大模型服务，这条回复用于压测和延迟测试，不代表真实模型的输出。"
+)
+
+STRUCTURED_CASE = {
+    "case_id": "TC{index:03d}",
+    "title": "正确的用户名和密码登录",
+    "module": "登录",
+    "priority": "高",
+    "test_type": "功能测试",
+    "preconditions": "用户已注册",
+    "test_steps": "1. 输入正确的用户名和密码 2. 点击登录",
+    "expected_result": "登录成功并跳转到首页",
+    "description": "验证正常登录流程",
+}
+
+# 系统提示词关键字 -> 阶段
+STAGE_KEYWORDS = [
+    ("结构化处理专家", "testcase_finalization"),
+    ("评审专家", "testcase_optimization"),
+    ("测试架构师", "testcase_generation"),
+    ("需求分析师", "requirement_analysis"),
+]
+
+
+@dataclass
+class FakeLLMConfig:
+    """模拟服务配置"""
+
+    ttft: float = 0.5  # 首个分块前的等待时间（秒）
+    tokens_per_second: float = 50.0  # 输出速度，0 表示不限速
+    chunk_size: int = 4  # 每个分块的 token 数
+    output_tokens: int = 0  # 输出长度，0 表示使用固定输出的原始长度
+    error_rate: float = 0.0  # 请求直接返回错误的概率
+    error_status: int = 503  # 请求错误时的状态码
+    stream_error_rate: float = 0.0  # 流式输出中途断开的概率
+    seed: Optional[int] = None  # 随机种子，固定后错误注入可复现
+
+
+def detect_stage(messages: List[Dict[str, Any]]) -> str:
+    """根据系统提示词识别测试用例生成阶段"""
+    system_text = "".join(
+        str(message.get("content", ""))
+        for message in messages
+        if message.get("role") == "system"
+    )
+    for keyword, stage in STAGE_KEYWORDS:
+        if keyword in system_text:
+            return stage
+    return "chat"
+
+
+def _fit(text: str, output_tokens: int) -> str:
+    """把文本重复或截断到指定长度"""
+    if output_tokens <= 0:
+        return text
+    repeated = text * (output_tokens // len(text) + 1)
+    return repeated[:output_tokens]
+
+
+def canned_output(stage: str, output_tokens: int = 0) -> str:
+    """获取阶段对应的固定输出"""
+    if stage == "testcase_finalization":
+        # 结构化输出必须是合法的 JSON，按长度决定用例数量
+        case_length = len(json.dumps(STRUCTURED_CASE, ensure_ascii=False))
+        count = max(1, output_tokens // case_length) if output_tokens else 3
+        cases = [
+            {
+                **STRUCTURED_CASE,
+                "case_id": STRUCTURED_CASE["case_id"].format(index=i),
+            }
+            for i in range(1, count + 1)
+        ]
+        return json.dumps(cases, ensure_ascii=False, indent=2)
+    if stage in ("testcase_generation", "testcase_optimization"):
+        return _fit(TESTCASE_OUTPUT, output_tokens)
+    if stage == "requirement_analysis":
+        return _fit(REQUIREMENT_ANALYSIS_OUTPUT, output_tokens)
+    return _fit(CHAT_OUTPUT, output_tokens)
+
+
+def split_chunks(text: str, chunk_size: int) -> Iterator[str]:
+    chunk_size = max(chunk_size, 1)
+    for start in range(0, len(text), chunk_size):
+        yield text[start : start + chunk_size]
+
+
+def _count_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(str(message.get("content", ""))) for message in messages)
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _error_body(message: str, error_type: str) -> Dict[str, Any]:
+    return {"error": {"message": message, "type": error_type, "code": None}}
+
+
+def create_app(config: Optional[FakeLLMConfig] = None) -> FastAPI:
+    """
+    创建模拟服务应用
+
+    Args:
+        config: 服务配置，为空时使用默认配置
+
+    Returns:
+        FastAPI: 模拟服务应用
+    """
+    config = config or FakeLLMConfig()
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "errors": 0, "stream_errors": 0, "completion_tokens": 0}
+    app = FastAPI(title="Fake OpenAI-compatible LLM")
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"config": asdict(config), **stats}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        messages = body.get("messages", [])
+        model = body.get("model", "fake-model")
+
+        if rng.random() < config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                _error_body("模拟的服务错误", "server_error"),
+                status_code=config.error_status,
+            )
+
+        stage = detect_stage(messages)
+        text = canned_output(stage, config.output_tokens)
+        prompt_tokens = _count_prompt_tokens(messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.ttft)
+            if config.tokens_per_second > 0:
+                await asyncio.sleep(len(text) / config.tokens_per_second)
+            stats["completion_tokens"] += len(text)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": _usage(prompt_tokens, len(text)),
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        break_stream = rng.random() < config.stream_error_rate
+
+        def event(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(config.ttft)
+            yield event({"role": "assistant", "content": ""})
+            delay = (
+                config.chunk_size / config.tokens_per_second
+                if config.tokens_per_second > 0
+                else 0
+            )
+            for index, chunk in enumerate(split_chunks(text, config.chunk_size)):
+                if index > 0 and delay:
+                    await asyncio.sleep(delay)
+                yield event({"content": chunk})
+                stats["completion_tokens"] += len(chunk)
+                if break_stream:
+                    # 输出第一个分块后断开，模拟上游中途失败
+                    stats["stream_errors"] += 1
+                    raise RuntimeError("模拟的流式输出中断")
+            yield event({}, "stop")
+            if include_usage:
+                usage_chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": _usage(prompt_tokens, len(text)),
+                }
+                yield f"data: {json.dumps(usage_chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="本地模拟的 OpenAI 兼容大模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft", type=float, default=0.5, help="首字延迟（秒）")
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=50.0, help="输出速度，0 表示不限速"
+    )
+    parser.add_argument("--chunk-size", type=int, default=4, help="每个分块的 token 数")
+    parser.add_argument(
+        "--output-tokens", type=int, default=0, help="输出长度，0 表示使用固定输出"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="请求错误概率")
+    parser.add_argument("--error-status", type=int, default=503, help="错误状态码")
+    parser.add_argument(
+        "--stream-error-rate", type=float, default=0.0, help="流式输出中途断开的概率"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    config = FakeLLMConfig(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        chunk_size=args.chunk_size,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stream_error_rate=args.stream_error_rate,
+        seed=args.seed,
+    )
+    logger.info(f"🤖 启动模拟大模型服务: http://{args.host}:{args.port}/v1")
+    logger.info(f"   ⚙️ 配置: {asdict(config)}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
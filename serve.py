@@ -0,0 +1,132 @@
+"""
+生产环境启动入口
+多进程 worker、可选的 uvloop/httptools、可调的 keep-alive，
+收到 SIGTERM 后停止接受新请求，等待进行中的流式生成完成（超时则中断并保存进度）再退出；
+多个 worker 时对话状态保存在 SQLite 中，后续请求落到任意 worker 都能继续对话
+
+开发环境使用 main.py（单进程 + 自动重载）
+
+使用方法:
+    python serve.py --workers 4 --timeout-keep-alive 75 --drain-timeout 30
+
+uvloop 和 httptools 需要单独安装（pip install uvloop httptools），
+未安装时 --loop/--http 的 auto 会回退到 asyncio 和 h11
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from loguru import logger
+from uvicorn.config import LOGGING_CONFIG
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resolve_loop(loop: str) -> str:
+    if loop == "uvloop" and importlib.util.find_spec("uvloop") is None:
+        logger.warning("⚠️ 未安装 uvloop，使用 asyncio 事件循环")
+        return "asyncio"
+    return loop
+
+
+def resolve_http(http: str) -> str:
+    if http == "httptools" and importlib.util.find_spec("httptools") is None:
+        logger.warning("⚠️ 未安装 httptools，使用 h11 解析 HTTP")
+        return "h11"
+    return http
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="生产环境启动入口")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="worker 进程数"
+    )
+    parser.add_argument(
+        "--loop", choices=["auto", "asyncio", "uvloop"], default="auto", help="事件循环"
+    )
+    parser.add_argument(
+        "--http",
+        choices=["auto", "h11", "httptools"],
+        default="auto",
+        help="HTTP 解析器",
+    )
+    parser.add_argument(
+        "--timeout-keep-alive",
+        type=int,
+        default=75,
+        help="keep-alive 空闲超时（秒），应大于前置负载均衡的空闲超时",
+    )
+    parser.add_argument("--backlog", type=int, default=2048, help="监听队列长度")
+    parser.add_argument(
+        "--limit-concurrency",
+        type=int,
+        default=None,
+        help="单个 worker 的最大并发连接数",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=30.0,
+        help="收到 SIGTERM 后等待进行中的流式响应完成的最长时间（秒）",
+    )
+    parser.add_argument(
+        "--forwarded-allow-ips", default="127.0.0.1", help="信任代理头的来源地址"
+    )
+    parser.add_argument("--no-access-log", action="store_true", help="关闭访问日志")
+    return parser.parse_args(argv)
+
+
+def build_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """把命令行参数转换为 uvicorn.run 的参数"""
+    LOGGING_CONFIG["formatters"]["default"][
+        "fmt"
+    ] = "%(asctime)s - %(levelname)s - %(message)s"
+    LOGGING_CONFIG["formatters"]["default"]["datefmt"] = "%Y-%m-%d %H:%M:%S"
+    LOGGING_CONFIG["formatters"]["access"][
+        "fmt"
+    ] = '%(asctime)s - %(levelname)s - %(client_addr)s - "%(request_line)s" %(status_code)s'
+    LOGGING_CONFIG["formatters"]["access"]["datefmt"] = "%Y-%m-%d %H:%M:%S"
+
+    return {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "loop": resolve_loop(args.loop),
+        "http": resolve_http(args.http),
+        "timeout_keep_alive": args.timeout_keep_alive,
+        "backlog": args.backlog,
+        "limit_concurrency": args.limit_concurrency,
+        # 排空超时后再留出流式响应结束的时间，之后 uvicorn 强制取消剩余连接
+        "timeout_graceful_shutdown": int(args.drain_timeout) + 5,
+        "proxy_headers": True,
+        "forwarded_allow_ips": args.forwarded_allow_ips,
+        "access_log": not args.no_access_log,
+        "log_config": LOGGING_CONFIG,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    # worker 进程通过配置读取排空时间（backend.core.shutdown）
+    os.environ["DYNACONF_SERVER__DRAIN_TIMEOUT"] = str(args.drain_timeout)
+    if args.workers > 1:
+        # 同一对话的后续请求可能落到其他 worker，对话状态需要保存在共享的数据库中
+        # （backend.services.conversation_store），显式配置了环境变量时以环境变量为准
+        os.environ.setdefault("DYNACONF_CONVERSATION_STORE__BACKEND", "sqlite")
+    options = build_options(args)
+    logger.info(
+        f"🚀 启动生产服务: http://{args.host}:{args.port} | worker: {args.workers} | "
+        f"事件循环: {options['loop']} | HTTP: {options['http']} | "
+        f"keep-alive: {args.timeout_keep_alive}s | 排空超时: {args.drain_timeout}s"
+    )
+    uvicorn.run("backend:app", **options)
+
+
+if __name__ == "__main__":
+    main()
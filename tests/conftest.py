@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+测试公共夹具
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from tortoise import Tortoise
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+@pytest.fixture
+async def database():
+    """内存 SQLite 数据库，包含测试用例相关的表"""
+    await Tortoise.init(
+        db_url="sqlite://:memory:",
+        modules={"models": ["backend.models.testcase"]},
+    )
+    await Tortoise.generate_schemas()
+    yield
+    await Tortoise.close_connections()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+AssistantAgent 复用池微基准
+
+对比每条消息新建 AssistantAgent 与从智能体池取用/归还的单次开销，
+模型调用使用 ReplayChatCompletionClient，只衡量智能体本身的构建与运行开销
+
+运行方式:
+    poetry run python tests/performance/bench_agent_pool.py [--iterations 2000]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from autogen_agentchat.agents import AssistantAgent
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+from backend.services.agent_pool import AssistantAgentPool
+
+SYSTEM_PROMPT = "你是一位资深的软件测试工程师。" * 20
+
+
+async def bench_construct(model_client, iterations: int) -> float:
+    """每次新建 AssistantAgent"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        AssistantAgent(
+            name="bench_agent",
+            model_client=model_client,
+            system_message=SYSTEM_PROMPT,
+            model_client_stream=True,
+        )
+    return (time.perf_counter() - start) / iterations
+
+
+async def bench_pool(model_client, iterations: int) -> float:
+    """从智能体池取用并归还（包含上下文重置）"""
+    pool = AssistantAgentPool("bench_agent", model_client, SYSTEM_PROMPT)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        async with pool.lease():
+            pass
+    return (time.perf_counter() - start) / iterations
+
+
+async def bench_run(model_client, iterations: int, pooled: bool) -> float:
+    """完整执行一次 run_stream，对比两种方式的端到端单次耗时"""
+    pool = AssistantAgentPool("bench_agent", model_client, SYSTEM_PROMPT)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if pooled:
+            async with pool.lease() as assistant:
+                async for _ in assistant.run_stream(task="需求"):
+                    pass
+        else:
+            assistant = AssistantAgent(
+                name="bench_agent",
+                model_client=model_client,
+                system_message=SYSTEM_PROMPT,
+                model_client_stream=True,
+            )
+            async for _ in assistant.run_stream(task="需求"):
+                pass
+    return (time.perf_counter() - start) / iterations
+
+
+async def main(iterations: int) -> None:
+    model_client = ReplayChatCompletionClient(["测试 用例 结果"] * (iterations * 2))
+
+    construct = await bench_construct(model_client, iterations)
+    pooled = await bench_pool(model_client, iterations)
+    run_iterations = max(iterations // 10, 1)
+    run_new = await bench_run(model_client, run_iterations, pooled=False)
+    run_pooled = await bench_run(model_client, run_iterations, pooled=True)
+
+    print(f"迭代次数: {iterations}（完整执行 {run_iterations} 次）")
+    print(f"新建 AssistantAgent:      {construct * 1e6:10.1f} µs/次")
+    print(f"智能体池取用+重置+归还:   {pooled * 1e6:10.1f} µs/次")
+    print(f"完整执行（每次新建）:     {run_new * 1e6:10.1f} µs/次")
+    print(f"完整执行（智能体池）:     {run_pooled * 1e6:10.1f} µs/次")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AssistantAgent 复用池微基准")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+端到端负载基准
+
+启动本地模拟大模型服务和应用服务（各自独立进程），用 N 个并发虚拟用户压测
+/api/chat/stream、/api/testcase/generate/streaming、/api/testcase/feedback/streaming，
+输出吞吐量、首字延迟和总耗时分位数、应用进程峰值内存以及事件循环延迟，
+并可保存为基线，在不同提交之间对比是否出现性能回退
+
+运行方式:
+    poetry run python tests/performance/bench_load.py --users 20 --requests 3
+    poetry run python tests/performance/bench_load.py --save-baseline
+    poetry run python tests/performance/bench_load.py --compare
+
+已经启动了应用时可以用 --app-url 直接压测（此时不统计进程内存）
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "load.json"
+SCENARIOS = ("chat", "generate", "feedback")
+
+# 越小越好的指标；吞吐量越大越好
+LOWER_IS_BETTER = (
+    "ttft_p50",
+    "ttft_p95",
+    "total_p50",
+    "total_p95",
+    "total_p99",
+    "error_rate",
+    "loop_lag_p95",
+    "loop_lag_max",
+    "peak_rss_mb",
+)
+HIGHER_IS_BETTER = ("throughput",)
+
+
+@dataclass
+class RequestResult:
+    ttft: Optional[float] = None
+    total: float = 0.0
+    events: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    results: List[RequestResult] = field(default_factory=list)
+    elapsed: float = 0.0
+    peak_rss_mb: Optional[float] = None
+    loop_lag: Dict[str, float] = field(default_factory=dict)
+
+    def summary(self) -> Dict[str, Any]:
+        ok = [result for result in self.results if result.error is None]
+        ttfts = sorted(result.ttft for result in ok if result.ttft is not None)
+        totals = sorted(result.total for result in ok)
+        summary = {
+            "requests": len(self.results),
+            "errors": len(self.results) - len(ok),
+            "error_rate": round(1 - len(ok) / max(len(self.results), 1), 4),
+            "throughput": round(len(ok) / self.elapsed, 3) if self.elapsed else 0.0,
+            "ttft_p50": percentile(ttfts, 0.5),
+            "ttft_p95": percentile(ttfts, 0.95),
+            "total_p50": percentile(totals, 0.5),
+            "total_p95": percentile(totals, 0.95),
+            "total_p99": percentile(totals, 0.99),
+        }
+        if self.peak_rss_mb is not None:
+            summary["peak_rss_mb"] = round(self.peak_rss_mb, 1)
+        summary.update(self.loop_lag)
+        return summary
+
+
+def percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(int(len(sorted_values) * percent), len(sorted_values) - 1)
+    return round(sorted_values[index], 4)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """读取进程当前内存占用（优先使用 psutil，否则读取 /proc）"""
+    try:
+        import psutil
+
+        return psutil.Process(pid).memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def parse_histogram(
+    metrics_text: str, name: str
+) -> Tuple[List[Tuple[float, float]], float]:
+    """从 Prometheus 文本中解析无标签直方图的累计分桶和总数"""
+    buckets = []
+    count = 0.0
+    for line in metrics_text.splitlines():
+        if line.startswith(f"{name}_bucket"):
+            bound = line.split('le="', 1)[1].split('"', 1)[0]
+            value = float(line.rsplit(" ", 1)[1])
+            buckets.append((float("inf") if bound == "+Inf" else float(bound), value))
+        elif line.startswith(f"{name}_count"):
+            count = float(line.rsplit(" ", 1)[1])
+    return buckets, count
+
+
+def histogram_quantile(
+    before: List[Tuple[float, float]], after: List[Tuple[float, float]], q: float
+) -> Optional[float]:
+    """根据两次采集之间的分桶增量估算分位数（取所在分桶的上界）"""
+    previous = dict(before)
+    deltas = [(bound, value - previous.get(bound, 0.0)) for bound, value in after]
+    if not deltas or deltas[-1][1] <= 0:
+        return None
+    target = deltas[-1][1] * q
+    for bound, cumulative in deltas:
+        if cumulative >= target:
+            return bound
+    return None
+
+
+class BenchEnvironment:
+    """启动并管理模拟大模型服务和应用服务进程"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.processes: List[subprocess.Popen] = []
+        self.app_pid: Optional[int] = None
+        self.app_url = args.app_url
+
+    def _spawn(self, command: List[str], env: Dict[str, str]) -> subprocess.Popen:
+        log_file = open(os.devnull, "w") if not self.args.verbose else None
+        process = subprocess.Popen(
+            command, cwd=project_root, env=env, stdout=log_file, stderr=log_file
+        )
+        self.processes.append(process)
+        return process
+
+    @staticmethod
+    def _wait_ready(url: str, timeout: float = 60.0) -> None:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if httpx.get(url, timeout=1).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"服务启动超时: {url}")
+
+    def start(self) -> None:
+        if self.app_url:
+            return
+        env = dict(os.environ)
+        llm_port = free_port()
+        self._spawn(
+            [
+                sys.executable,
+                "scripts/fake_llm_server.py",
+                "--port",
+                str(llm_port),
+                "--ttft",
+                str(self.args.ttft),
+                "--tokens-per-second",
+                str(self.args.tokens_per_second),
+                "--chunk-size",
+                str(self.args.chunk_size),
+                "--output-tokens",
+                str(self.args.output_tokens),
+                "--seed",
+                "0",
+            ],
+            env,
+        )
+        self._wait_ready(f"http://127.0.0.1:{llm_port}/v1/models")
+
+        app_port = free_port()
+        env.update(
+            {
+                "DYNACONF_AIMODEL__BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+                "DYNACONF_AIMODEL__API_KEY": "fake-key",
+                "DYNACONF_AIMODEL__MODEL": "fake-model",
+                "DYNACONF_LOG_LEVEL": self.args.log_level,
+            }
+        )
+        process = self._spawn(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                self.args.app,
+                "--port",
+                str(app_port),
+                "--log-level",
+                "warning",
+            ],
+            env,
+        )
+        self.app_pid = process.pid
+        self.app_url = f"http://127.0.0.1:{app_port}"
+        self._wait_ready(f"{self.app_url}/health")
+
+    def stop(self) -> None:
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> None:
+    """
+    登录压测用户，之后的请求都携带该用户的令牌
+
+    读取 /api/testcase/runtime/stats 需要超级用户，默认使用初始化数据库时创建的默认用户
+    """
+    credentials = {"username": username, "password": password}
+    response = await client.post("/api/auth/login", json=credentials)
+    response.raise_for_status()
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+
+async def read_stream(
+    client: httpx.AsyncClient, path: str, payload: Dict[str, Any], first_event: str
+) -> RequestResult:
+    """
+    发送一个流式请求并读取到结束
+
+    Args:
+        first_event: 判定首字的条件，chat 为首个有内容的数据块，
+            testcase 为首个 streaming_chunk 事件
+    """
+    result = RequestResult()
+    started = time.perf_counter()
+    try:
+        async with client.stream("POST", path, json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                result.error = f"HTTP {response.status_code}"
+                return result
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                result.events += 1
+                data = json.loads(line[5:].strip())
+                if data.get("type") == "error":
+                    result.error = data.get("content", "error")
+                if result.ttft is None:
+                    if first_event == "chat" and data.get("content"):
+                        result.ttft = time.perf_counter() - started
+                    elif data.get("type") == "streaming_chunk":
+                        result.ttft = time.perf_counter() - started
+    except httpx.HTTPError as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.total = time.perf_counter() - started
+    return result
+
+
+async def virtual_user(
+    client: httpx.AsyncClient, scenario: str, user: int, requests: int
+) -> List[RequestResult]:
+    results = []
+    for index in range(requests):
+        # 每个请求使用不同的内容，避免命中缓存和请求去重
+        text = f"用户登录功能需求 #{user}-{index}-{uuid.uuid4().hex[:8]}"
+        conversation_id = str(uuid.uuid4())
+        if scenario == "chat":
+            results.append(
+                await read_stream(
+                    client,
+                    "/api/chat/stream",
+                    {
+                        "message": text,
+                        "conversation_id": conversation_id,
+                        "use_cache": False,
+                    },
+                    "chat",
+                )
+            )
+            continue
+
+        generate = {
+            "conversation_id": conversation_id,
+            "text_content": text,
+            "bypass_cache": True,
+        }
+        if scenario == "generate":
+            results.append(
+                await read_stream(
+                    client, "/api/testcase/generate/streaming", generate, "testcase"
+                )
+            )
+            continue
+
+        # feedback 场景：先生成（不计入结果），再提交反馈
+        warmup = await read_stream(
+            client, "/api/testcase/generate/streaming", generate, "testcase"
+        )
+        if warmup.error:
+            results.append(warmup)
+            continue
+        results.append(
+            await read_stream(
+                client,
+                "/api/testcase/feedback/streaming",
+                {
+                    "conversation_id": conversation_id,
+                    "feedback": "请补充边界值相关的测试用例",
+                    "round_number": 1,
+                },
+                "testcase",
+            )
+        )
+    return results
+
+
+async def run_scenario(
+    env: BenchEnvironment, scenario: str, users: int, requests: int
+) -> ScenarioResult:
+    result = ScenarioResult(scenario)
+    timeout = httpx.Timeout(300.0, connect=10.0)
+    limits = httpx.Limits(max_connections=users + 4)
+    async with httpx.AsyncClient(
+        base_url=env.app_url, timeout=timeout, limits=limits
+    ) as client:
+        await login(client, env.args.username, env.args.password)
+        metrics_before = (await client.get("/metrics")).text
+
+        peak_rss = [0.0]
+
+        async def sample_rss():
+            while True:
+                rss = read_rss_mb(env.app_pid) if env.app_pid else None
+                if rss:
+                    peak_rss[0] = max(peak_rss[0], rss)
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.create_task(sample_rss())
+        started = time.perf_counter()
+        per_user = await asyncio.gather(
+            *(virtual_user(client, scenario, user, requests) for user in range(users))
+        )
+        result.elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+        metrics_after = (await client.get("/metrics")).text
+        runtime_stats = (await client.get("/api/testcase/runtime/stats")).json()
+
+    result.results = [item for user_results in per_user for item in user_results]
+    if env.app_pid:
+        result.peak_rss_mb = peak_rss[0]
+
+    before, _ = parse_histogram(metrics_before, "event_loop_lag_seconds")
+    after, _ = parse_histogram(metrics_after, "event_loop_lag_seconds")
+    event_loop = runtime_stats.get("event_loop", {})
+    result.loop_lag = {
+        "loop_lag_p95": histogram_quantile(before, after, 0.95),
+        "loop_lag_max": event_loop.get("max_lag"),
+        "loop_stalls": event_loop.get("stalls"),
+    }
+    return result
+
+
+def compare_with_baseline(
+    current: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float,
+) -> List[str]:
+    """
+    与基线对比
+
+    Returns:
+        List[str]: 超出容差的回退项说明
+    """
+    regressions = []
+    for scenario, metrics in current.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        for name in LOWER_IS_BETTER:
+            now, before = metrics.get(name), base.get(name)
+            if now is None or not before:
+                continue
+            if now > before * (1 + tolerance):
+                regressions.append(f"{scenario}.{name}: {before} -> {now}")
+        for name in HIGHER_IS_BETTER:
+            now, before = metrics.get(name), base.get(name)
+            if now is None or not before:
+                continue
+            if now < before * (1 - tolerance):
+                regressions.append(f"{scenario}.{name}: {before} -> {now}")
+    return regressions
+
+
+def print_summary(summaries: Dict[str, Dict[str, Any]]) -> None:
+    columns = [
+        "requests",
+        "errors",
+        "throughput",
+        "ttft_p50",
+        "ttft_p95",
+        "total_p50",
+        "total_p95",
+        "total_p99",
+        "peak_rss_mb",
+        "loop_lag_p95",
+        "loop_lag_max",
+    ]
+    print("场景".ljust(10) + "".join(name.rjust(13) for name in columns))
+    for scenario, summary in summaries.items():
+        values = [summary.get(name) for name in columns]
+        print(
+            scenario.ljust(10)
+            + "".join(("-" if v is None else str(v)).rjust(13) for v in values)
+        )
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args: argparse.Namespace) -> int:
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    env = BenchEnvironment(args)
+    summaries: Dict[str, Dict[str, Any]] = {}
+    try:
+        env.start()
+        for scenario in scenarios:
+            print(f"▶ {scenario}: {args.users} 个并发用户 × {args.requests} 个请求")
+            result = await run_scenario(env, scenario, args.users, args.requests)
+            summaries[scenario] = result.summary()
+    finally:
+        env.stop()
+
+    print()
+    print_summary(summaries)
+
+    config = {
+        key: getattr(args, key)
+        for key in ("users", "requests", "ttft", "tokens_per_second", "chunk_size")
+    }
+    config["output_tokens"] = args.output_tokens
+    baseline_path = Path(args.baseline)
+
+    if args.compare:
+        if not baseline_path.exists():
+            print(f"\n⚠️ 基线文件不存在: {baseline_path}")
+            return 1
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        if baseline.get("config") != config:
+            print(f"\n⚠️ 压测参数与基线不同，对比结果仅供参考: {baseline.get('config')}")
+        regressions = compare_with_baseline(
+            summaries, baseline.get("scenarios", {}), args.tolerance
+        )
+        print(f"\n基线提交: {baseline.get('commit')} | 容差: {args.tolerance:.0%}")
+        if regressions:
+            print("❌ 发现性能回退:")
+            for item in regressions:
+                print(f"   {item}")
+            return 1
+        print("✅ 未发现超出容差的性能回退")
+
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(
+            json.dumps(
+                {
+                    "commit": git_commit(),
+                    "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "config": config,
+                    "scenarios": summaries,
+                },
+                ensure_ascii=False,
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        print(f"\n💾 基线已保存: {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="端到端负载基准")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--users", type=int, default=10, help="并发虚拟用户数")
+    parser.add_argument("--requests", type=int, default=3, help="每个用户的请求数")
+    parser.add_argument("--ttft", type=float, default=0.3, help="模拟首字延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--chunk-size", type=int, default=4)
+    parser.add_argument("--output-tokens", type=int, default=0)
+    parser.add_argument("--app", default="backend:app", help="uvicorn 应用路径")
+    parser.add_argument("--app-url", default=None, help="压测已启动的应用")
+    parser.add_argument("--log-level", default="WARNING", help="应用日志级别")
+    parser.add_argument("--username", default="test", help="压测用户（需为超级用户）")
+    parser.add_argument("--password", default="test", help="压测用户密码")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="与基线对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="回退容差")
+    parser.add_argument("--verbose", action="store_true", help="显示子进程输出")
+    sys.exit(asyncio.run(main(parser.parse_args())))
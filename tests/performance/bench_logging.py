@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+热路径日志基准
+
+模拟测试用例流式输出中每个流式块的日志，对比以下几种情况下的吞吐：
+- 原始写法：INFO 级别 f-string 记录完整内容
+- hot_log：级别启用，采样 + 延迟截断
+- hot_log：级别被过滤
+- 不记录日志
+
+日志写入临时目录中的文件，运行方式:
+    poetry run python tests/performance/bench_logging.py [--chunks 50000]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from loguru import logger
+
+from backend.core.log_sinks import QueuedFileSink
+from backend.core.logger import hot_log, log_config, truncate
+
+CHUNK = "测试步骤：打开登录页面，输入正确的用户名和密码，点击登录按钮。" * 2
+
+
+def configure(log_dir: Path, log_level: str) -> None:
+    """只保留文件输出（与应用相同的队列化文件输出），避免控制台输出影响结果"""
+    log_config.log_dir = log_dir
+    log_config.setup_logger(log_level=log_level)
+    logger.remove()
+    logger.add(
+        QueuedFileSink(str(log_dir / "bench.log"), overflow="block"),
+        level=log_level,
+        colorize=False,
+    )
+
+
+def run_fstring(chunks: int) -> None:
+    for i in range(chunks):
+        logger.info(
+            f"📡 [流式输出] 发送流式块 | 智能体: 测试用例生成智能体 | 内容: {CHUNK}"
+        )
+
+
+def run_hot_log(chunks: int) -> None:
+    for i in range(chunks):
+        hot_log(
+            "INFO",
+            "bench.chunk",
+            "📡 [流式输出] 发送流式块 | 智能体: {} | 内容: {}",
+            "测试用例生成智能体",
+            truncate(CHUNK, 100),
+        )
+
+
+def run_off(chunks: int) -> None:
+    for i in range(chunks):
+        pass
+
+
+def measure(label: str, func, chunks: int) -> None:
+    start = time.perf_counter()
+    func(chunks)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {chunks / elapsed:12.0f} 块/秒")
+
+
+def main(chunks: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = Path(tmp)
+        print(f"流式块数量: {chunks}")
+
+        configure(log_dir, "INFO")
+        measure("INFO f-string 完整内容", run_fstring, chunks)
+        measure("INFO hot_log 采样+截断", run_hot_log, chunks)
+
+        configure(log_dir, "WARNING")
+        measure("WARNING f-string（被过滤）", run_fstring, chunks)
+        measure("WARNING hot_log（被过滤）", run_hot_log, chunks)
+
+        measure("不记录日志", run_off, chunks)
+        logger.remove()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="热路径日志基准")
+    parser.add_argument("--chunks", type=int, default=50000)
+    args = parser.parse_args()
+    main(args.chunks)
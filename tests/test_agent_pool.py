@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+AssistantAgent 复用池测试
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+from backend.services.agent_pool import AssistantAgentPool, get_assistant_pool
+
+
+async def test_agent_is_reused_with_clean_context():
+    """归还后的智能体被复用，且上一次任务的上下文已清空"""
+    pool = AssistantAgentPool(
+        "tester", ReplayChatCompletionClient(["一", "二"]), "提示词"
+    )
+
+    async with pool.lease() as first:
+        await first.run(task="任务一")
+        assert len(await first.model_context.get_messages()) == 2
+
+    async with pool.lease() as second:
+        assert second is first
+        assert await second.model_context.get_messages() == []
+
+    stats = pool.get_stats()
+    assert stats["created"] == 1 and stats["reused"] == 1 and stats["in_use"] == 0
+
+
+async def test_concurrent_leases_get_distinct_agents():
+    """同时租用得到不同的智能体实例"""
+    pool = AssistantAgentPool("tester", ReplayChatCompletionClient([]), "提示词")
+    async with pool.lease() as a, pool.lease() as b:
+        assert a is not b
+    assert pool.get_stats()["idle"] == 2
+
+
+def test_pools_are_shared_per_role():
+    """相同角色配置共享同一个池"""
+    client = ReplayChatCompletionClient([])
+    assert get_assistant_pool("r", client, "p") is get_assistant_pool("r", client, "p")
+    assert get_assistant_pool("r", client, "p") is not get_assistant_pool(
+        "r", client, "q"
+    )
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+进程内 LRU + TTL 缓存测试
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.cache import LRUTTLCache
+
+
+def test_lru_eviction_by_entries():
+    """超过条目上限时淘汰最久未使用的条目"""
+    cache = LRUTTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_eviction_by_bytes():
+    """超过总大小上限时淘汰，过大的条目不缓存"""
+    cache = LRUTTLCache(max_entries=10, max_bytes=10)
+    cache.set("a", "x", size=6)
+    cache.set("b", "y", size=6)
+    assert len(cache) == 1
+    assert cache.get("b") == "y"
+    assert cache.set("c", "z", size=11) is False
+
+
+def test_ttl_expiration():
+    """过期条目视为未命中"""
+    cache = LRUTTLCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.get_stats()["expirations"] == 1
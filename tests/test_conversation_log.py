@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+对话事件日志测试
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.services.conversation_log import COMPACT_THRESHOLD, ConversationEventLog
+
+
+def test_events_round_trip_across_compaction():
+    """合并分段前后都能还原出原始内容"""
+    event_log = ConversationEventLog("c1")
+    chunks = [f"块{i}" for i in range(COMPACT_THRESHOLD * 2 + 3)]
+    for chunk in chunks:
+        event_log.append("测试用例生成智能体", chunk, "streaming_chunk")
+    event_log.append("测试用例生成智能体", "完整输出", "测试用例生成", is_final=True)
+
+    assert len(event_log) == len(chunks) + 1
+    assert [event_log.content(i) for i in range(len(chunks))] == chunks
+    assert event_log.get_stats()["segments"] == 2
+
+    last = event_log.get(len(chunks))
+    assert last["content"] == "完整输出"
+    assert last["agent_name"] == "测试用例生成智能体"
+    assert last["message_type"] == "测试用例生成"
+    assert last["is_complete"] is True
+    assert last["conversation_id"] == "c1"
+    assert last["round_number"] == 1
+
+
+def test_last_compacted_event_content():
+    """恰好合并后最后一条事件的内容完整"""
+    event_log = ConversationEventLog("c1")
+    for i in range(COMPACT_THRESHOLD):
+        event_log.append("a", str(i), "streaming_chunk")
+    assert event_log.content(COMPACT_THRESHOLD - 1) == str(COMPACT_THRESHOLD - 1)
+
+
+def test_has_final():
+    """从指定位置开始查找最终消息"""
+    event_log = ConversationEventLog("c1")
+    event_log.append("a", "x", "需求分析", is_final=True)
+    event_log.append("a", "y", "streaming_chunk")
+    assert event_log.has_final(-3)
+    assert not event_log.has_final(1)
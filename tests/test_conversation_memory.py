@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+对话记忆存储测试
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.services.conversation_memory import ConversationMemory
+
+
+def _build_memory() -> ConversationMemory:
+    memory = ConversationMemory("c1")
+    memory.add({"type": "user_input", "round_number": 1, "content": "需求"})
+    memory.add({"type": "testcase_generation", "round_number": 1, "content": "用例1"})
+    memory.add({"type": "user_feedback", "round_number": 2, "feedback": "补充"})
+    memory.add({"type": "testcase_optimization", "round_number": 2, "content": "用例2"})
+    return memory
+
+
+def test_query_filters_by_type_and_round():
+    """按类型、轮次以及组合条件查询"""
+    memory = _build_memory()
+
+    assert len(memory.query()) == 4
+    assert [r["content"] for r in memory.query(entry_type="testcase_generation")] == [
+        "用例1"
+    ]
+    assert [r["type"] for r in memory.query(round_number=2)] == [
+        "user_feedback",
+        "testcase_optimization",
+    ]
+    assert memory.query(entry_type="user_input", round_number=2) == []
+    assert memory.query(limit=1)[0]["type"] == "testcase_optimization"
+    assert memory.latest("user_feedback")["feedback"] == "补充"
+
+
+def test_records_are_copied_on_add():
+    """修改原始字典不影响已保存的记录"""
+    memory = ConversationMemory("c1")
+    data = {"type": "user_input", "round_number": 1, "content": "需求"}
+    memory.add(data)
+    data["content"] = "已修改"
+    assert memory.query()[0]["content"] == "需求"
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+对话状态存储测试
+"""
+
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+from autogen_ext.models.replay import ReplayChatCompletionClient
+from tortoise import timezone
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.models.testcase import ConversationSnapshot
+from backend.services.conversation_store import (
+    MemoryConversationStore,
+    SQLiteConversationStore,
+)
+
+
+async def test_memory_store_evicts_oldest():
+    """超过容量时淘汰最久未写入的快照"""
+    store = MemoryConversationStore(max_entries=2)
+    await store.save("chat", "c1", {"n": 1})
+    await store.save("chat", "c2", {"n": 2})
+    await store.save("chat", "c1", {"n": 3})
+    await store.save("chat", "c3", {"n": 4})
+
+    assert await store.load("chat", "c2") is None
+    assert await store.load("chat", "c1") == {"n": 3}
+    assert await store.load("testcase", "c1") is None
+    stats = store.get_stats()
+    assert stats["entries"] == 2
+    assert stats["hits"] == 1
+
+
+async def test_sqlite_store_round_trip_and_expiry(database):
+    """快照写入数据库后可以读取、覆盖和删除，过期快照按不存在处理"""
+    store = SQLiteConversationStore(ttl=60)
+    await store.save("testcase", "c1", {"records": [{"type": "user_input"}]})
+    await store.save("testcase", "c1", {"records": [], "state": {"stage": "x"}})
+    assert await store.load("testcase", "c1") == {
+        "records": [],
+        "state": {"stage": "x"},
+    }
+    assert await ConversationSnapshot.all().count() == 1
+
+    await store.save("chat", "old", {"n": 1})
+    await ConversationSnapshot.filter(kind="chat").update(
+        updated_at=timezone.now() - timedelta(seconds=120)
+    )
+    assert await store.load("chat", "old") is None
+    assert await ConversationSnapshot.filter(kind="chat").count() == 0
+
+    await store.delete("testcase", "c1")
+    assert await store.load("testcase", "c1") is None
+    assert store.get_stats()["errors"] == 0
+
+
+async def test_sqlite_store_expiry_ignores_local_timezone(monkeypatch, database):
+    """本地时区不是 UTC 时，未过期的快照仍可读取，清理只删除过期快照"""
+    monkeypatch.setenv("TZ", "Asia/Shanghai")
+    time.tzset()
+    try:
+        store = SQLiteConversationStore(ttl=3600)
+        await store.save("testcase", "fresh", {"n": 1})
+        await store.save("testcase", "stale", {"n": 2})
+        await ConversationSnapshot.filter(conversation_id="stale").update(
+            updated_at=timezone.now() - timedelta(seconds=3601)
+        )
+
+        assert await store.purge_expired() == 1
+        assert await store.load("testcase", "fresh") == {"n": 1}
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+async def test_testcase_conversation_restored_on_other_worker(monkeypatch, database):
+    """另一个进程的运行时管理器按快照恢复对话记忆、状态和别名"""
+    import backend.services.testcase_service as testcase_module
+
+    model_client = ReplayChatCompletionClient(["结果"])
+    monkeypatch.setattr(
+        testcase_module, "get_openai_model_client", lambda: model_client
+    )
+    monkeypatch.setattr(testcase_module, "validate_model_client", lambda: True)
+
+    store = SQLiteConversationStore()
+    first = testcase_module.TestCaseGenerationRuntime(store=store)
+    second = testcase_module.TestCaseGenerationRuntime(store=store)
+    try:
+        first.memories["c1"] = testcase_module.ConversationMemory("c1")
+        await first._save_to_memory(
+            "c1", {"type": "user_input", "content": "登录功能", "round_number": 1}
+        )
+        await first.update_conversation_state(
+            "c1",
+            {"stage": "testcase_generated", "last_testcases": "用例1"},
+            replace=True,
+        )
+        await first.add_conversation_alias("c2", "c1")
+
+        assert await second.ensure_conversation("c2") == "c1"
+        assert "c1" in second.runtimes
+        assert second.conversation_states["c1"]["last_testcases"] == "用例1"
+        history = await second.get_conversation_history("c1", entry_type="user_input")
+        assert history[0]["content"] == "登录功能"
+        assert second.restored == 1
+
+        with pytest.raises(ValueError):
+            await second.ensure_conversation("missing")
+    finally:
+        await second.cleanup_runtime("c1")
+        await second.runtime_pool.close()
+        await first.runtime_pool.close()
+
+
+async def test_chat_context_restored_on_other_worker(monkeypatch):
+    """聊天的下一轮落到另一个进程时恢复 Agent 上下文"""
+    import backend.services.autogen_service as autogen_module
+
+    model_client = ReplayChatCompletionClient(["第一轮回答", "第二轮回答"])
+    monkeypatch.setattr(autogen_module, "get_openai_model_client", lambda: model_client)
+    store = MemoryConversationStore()
+    first = autogen_module.AutoGenService(store=store)
+    second = autogen_module.AutoGenService(store=store)
+
+    response, _ = await first.chat("你好", conversation_id="c1", use_cache=False)
+    assert response
+    await second.chat("继续", conversation_id="c1", use_cache=False)
+
+    messages = await second.agents["c1"]["agent"].model_context.get_messages()
+    assert [message.content for message in messages] == [
+        "你好",
+        "第一轮回答",
+        "继续",
+        "第二轮回答",
+    ]
+    assert second.restored == 1
+
+    await second.clear_conversation("c1")
+    assert await store.load("chat", "c1") is None
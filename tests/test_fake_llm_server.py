@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+模拟大模型服务测试
+"""
+
+import json
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import uvicorn
+from autogen_core.models import ModelFamily, SystemMessage, UserMessage
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from scripts.fake_llm_server import FakeLLMConfig, canned_output, create_app
+
+
+@pytest.fixture
+def fake_llm_url():
+    """在后台线程中启动模拟服务"""
+
+    def start(config):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = uvicorn.Server(
+            uvicorn.Config(create_app(config), port=port, log_level="warning")
+        )
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        servers.append((server, thread))
+        return f"http://127.0.0.1:{port}/v1"
+
+    servers = []
+    yield start
+    for server, thread in servers:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def _client(base_url):
+    return OpenAIChatCompletionClient(
+        model="fake-model",
+        base_url=base_url,
+        api_key="fake-key",
+        max_retries=0,
+        model_info={
+            "vision": False,
+            "function_calling": True,
+            "json_output": True,
+            "family": ModelFamily.UNKNOWN,
+            "structured_output": True,
+            "multiple_system_messages": True,
+        },
+    )
+
+
+def test_finalization_output_is_valid_json():
+    """结构化阶段的固定输出是合法的 JSON，长度随 output_tokens 增长"""
+    assert len(json.loads(canned_output("testcase_finalization"))) == 3
+    assert len(json.loads(canned_output("testcase_finalization", 2000))) > 3
+    assert len(canned_output("chat", 500)) == 500
+
+
+async def test_streams_stage_output_with_configured_pacing(fake_llm_url):
+    """按系统提示词返回阶段输出，首字延迟和分块大小符合配置"""
+    config = FakeLLMConfig(ttft=0.2, tokens_per_second=0, chunk_size=8)
+    client = _client(fake_llm_url(config))
+    messages = [
+        SystemMessage(content="你是一位资深的软件需求分析师"),
+        UserMessage(content="登录功能", source="user"),
+    ]
+
+    started = time.perf_counter()
+    first_chunk_at = None
+    chunks = []
+    async for item in client.create_stream(messages):
+        if isinstance(item, str):
+            first_chunk_at = first_chunk_at or time.perf_counter() - started
+            chunks.append(item)
+        else:
+            result = item
+
+    assert first_chunk_at >= 0.2
+    assert "".join(chunks) == canned_output("requirement_analysis")
+    assert max(len(chunk) for chunk in chunks) == 8
+    assert result.content == canned_output("requirement_analysis")
+
+
+async def test_error_rate_returns_configured_status(fake_llm_url):
+    """错误率为 1 时每个请求都返回错误状态码"""
+    config = FakeLLMConfig(ttft=0, error_rate=1.0, error_status=429)
+    client = _client(fake_llm_url(config))
+
+    with pytest.raises(Exception) as exc_info:
+        await client.create([UserMessage(content="你好", source="user")])
+    assert getattr(exc_info.value, "status_code", None) == 429
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+模型调用录制回放测试
+"""
+
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from autogen_core.models import CreateResult, UserMessage
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.llm_cassette import CassetteChatCompletionClient, CassetteMissError
+
+MESSAGES = [UserMessage(content="登录功能需求", source="user")]
+
+
+async def _collect(client, messages=MESSAGES):
+    chunks, result = [], None
+    async for item in client.create_stream(messages):
+        if isinstance(item, CreateResult):
+            result = item
+        else:
+            chunks.append(item)
+    return chunks, result
+
+
+async def test_record_then_replay_stream(tmp_path):
+    """录制的流式输出可以在不调用真实模型的情况下回放"""
+    recorder = CassetteChatCompletionClient(
+        ReplayChatCompletionClient(["需求 分析 结果"]), str(tmp_path), mode="record"
+    )
+    recorded_chunks, recorded_result = await _collect(recorder)
+    assert recorder.recorded == 1
+
+    # 内部客户端没有剩余响应，回放必须来自 cassette
+    player = CassetteChatCompletionClient(
+        ReplayChatCompletionClient([]), str(tmp_path), mode="replay", speed=0
+    )
+    chunks, result = await _collect(player)
+
+    assert chunks == recorded_chunks
+    assert result.content == recorded_result.content == "需求 分析 结果"
+    assert player.get_stats()["hits"] == 1
+    assert player.total_usage().completion_tokens == result.usage.completion_tokens
+
+
+async def test_replay_respects_recorded_timing(tmp_path):
+    """speed 为 1 时按录制时的节奏回放，倍数越大越快"""
+    recorder = CassetteChatCompletionClient(
+        ReplayChatCompletionClient(["a b"]), str(tmp_path), mode="record"
+    )
+    await _collect(recorder)
+    # 把录制的总耗时改为 0.2 秒
+    cassette_file = next(tmp_path.glob("*.json"))
+    cassette = json.loads(cassette_file.read_text(encoding="utf-8"))
+    cassette["recordings"][0]["elapsed"] = 0.2
+    cassette_file.write_text(json.dumps(cassette), encoding="utf-8")
+
+    player = CassetteChatCompletionClient(
+        ReplayChatCompletionClient([]), str(tmp_path), mode="replay", speed=1
+    )
+    started = time.perf_counter()
+    await _collect(player)
+    assert time.perf_counter() - started >= 0.2
+
+    fast = CassetteChatCompletionClient(
+        ReplayChatCompletionClient([]), str(tmp_path), mode="replay", speed=10
+    )
+    started = time.perf_counter()
+    await _collect(fast)
+    assert time.perf_counter() - started < 0.1
+
+
+async def test_replay_miss_and_auto_mode(tmp_path):
+    """replay 模式未命中时报错，auto 模式未命中时调用真实模型并录制"""
+    player = CassetteChatCompletionClient(
+        ReplayChatCompletionClient([]), str(tmp_path), mode="replay"
+    )
+    with pytest.raises(CassetteMissError):
+        await player.create(MESSAGES)
+
+    auto = CassetteChatCompletionClient(
+        ReplayChatCompletionClient(["结果"]), str(tmp_path), mode="auto", speed=0
+    )
+    first = await auto.create(MESSAGES)
+    second = await auto.create(MESSAGES)
+    assert first.content == second.content == "结果"
+    assert auto.get_stats()["misses"] == 1 and auto.get_stats()["hits"] == 1
+
+
+async def test_concurrent_identical_requests_all_recorded(tmp_path):
+    """并发的相同请求录制时互不覆盖，也不会残留临时文件"""
+    recorder = CassetteChatCompletionClient(
+        ReplayChatCompletionClient([f"结果 {i}" for i in range(5)]),
+        str(tmp_path),
+        mode="record",
+    )
+    results = await asyncio.gather(*(_collect(recorder) for _ in range(5)))
+
+    assert all(result is not None for _, result in results)
+    assert recorder.recorded == 5
+    (file,) = tmp_path.iterdir()
+    recordings = json.loads(file.read_text(encoding="utf-8"))["recordings"]
+    assert len(recordings) == 5
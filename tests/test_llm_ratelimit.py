@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+模型调用出站限流测试
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from autogen_core.models import CreateResult, UserMessage
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.llm_cassette import CassetteChatCompletionClient
+from backend.core.llm_ratelimit import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    RateLimitedChatCompletionClient,
+    RateLimitScheduler,
+    parse_reset,
+    retry_after_from_headers,
+    with_priority,
+)
+
+MESSAGES = [UserMessage(content="登录功能需求", source="user")]
+
+
+class RateLimitError(Exception):
+    """模拟 openai.RateLimitError：带 status_code 和响应头"""
+
+    def __init__(self, headers):
+        super().__init__("Too Many Requests")
+        self.status_code = 429
+        self.response = type("Response", (), {"headers": headers})()
+
+
+class FlakyReplayClient(ReplayChatCompletionClient):
+    """前几次流式调用在输出前返回 429"""
+
+    def __init__(self, responses, failures, headers):
+        super().__init__(responses)
+        self.failures = failures
+        self.headers = headers
+
+    async def create_stream(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RateLimitError(self.headers)
+        async for item in super().create_stream(*args, **kwargs):
+            yield item
+
+
+def test_parse_rate_limit_headers():
+    """解析 retry-after 和 x-ratelimit-reset-* 的各种时长格式"""
+    assert parse_reset("6m0s") == 360
+    assert parse_reset("1.5s") == 1.5
+    assert parse_reset("20ms") == 0.02
+    assert parse_reset("bad") is None
+    assert retry_after_from_headers({"retry-after-ms": "250"}) == 0.25
+    assert retry_after_from_headers({"retry-after": "3"}) == 3
+    assert (
+        retry_after_from_headers(
+            {"x-ratelimit-reset-requests": "1s", "x-ratelimit-reset-tokens": "2m"}
+        )
+        == 120
+    )
+    assert retry_after_from_headers({}) is None
+
+
+async def test_interactive_calls_jump_ahead_of_batch():
+    """额度用完后排队的调用按优先级放行"""
+    scheduler = RateLimitScheduler("test", rpm=600)
+    scheduler.requests.tokens = 0
+    order = []
+
+    async def call(name, priority):
+        await scheduler.acquire(10, priority)
+        order.append(name)
+
+    batch = [asyncio.create_task(call(f"batch-{i}", PRIORITY_BATCH)) for i in range(3)]
+    await asyncio.sleep(0)
+    chat = asyncio.create_task(call("chat", PRIORITY_INTERACTIVE))
+    await asyncio.gather(chat, *batch)
+
+    assert order[0] == "chat"
+    assert order[1:] == ["batch-0", "batch-1", "batch-2"]
+    stats = scheduler.get_stats()
+    assert stats["granted"] == 4
+    assert stats["queued"] == 4
+    assert stats["waiting"] == 0
+
+
+async def test_token_bucket_settles_with_actual_usage():
+    """按预估扣减 token，调用结束后按实际用量退回"""
+    scheduler = RateLimitScheduler("test", tpm=10000)
+    client = RateLimitedChatCompletionClient(
+        ReplayChatCompletionClient(["结果"]), scheduler, max_tokens=500
+    )
+    result = await client.create(MESSAGES)
+
+    used = result.usage.prompt_tokens + result.usage.completion_tokens
+    assert 10000 - scheduler.tokens.tokens < 500
+    assert abs(10000 - scheduler.tokens.tokens - used) < 1
+
+
+async def test_stream_requeues_after_429():
+    """输出前收到 429 时暂停端点并重新排队，调用方只看到一次完整输出"""
+    scheduler = RateLimitScheduler("test", rpm=6000)
+    inner = FlakyReplayClient(["a b"], failures=1, headers={"retry-after-ms": "100"})
+    client = RateLimitedChatCompletionClient(inner, scheduler)
+
+    started = time.perf_counter()
+    items = [item async for item in client.create_stream(MESSAGES)]
+
+    assert time.perf_counter() - started >= 0.1
+    assert isinstance(items[-1], CreateResult)
+    assert "".join(items[:-1]) == items[-1].content
+    assert scheduler.get_stats()["rate_limited"] == 1
+
+
+async def test_with_priority_reaches_through_outer_wrappers(tmp_path):
+    """外层还有录制回放包装时也能拿到指定优先级的客户端，且同一优先级复用同一实例"""
+    scheduler = RateLimitScheduler("test")
+    limited = RateLimitedChatCompletionClient(
+        ReplayChatCompletionClient(["x"]), scheduler
+    )
+    client = CassetteChatCompletionClient(limited, str(tmp_path), mode="auto")
+
+    view = with_priority(client, PRIORITY_INTERACTIVE)
+    assert view is with_priority(client, PRIORITY_INTERACTIVE)
+    assert view.inner.priority == PRIORITY_INTERACTIVE
+    assert view.inner.scheduler is scheduler
+    assert client.inner is limited
+
+    plain = ReplayChatCompletionClient(["x"])
+    assert with_priority(plain, PRIORITY_BATCH) is plain
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+模型调用容错测试
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from autogen_core.models import CreateResult, UserMessage
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.llm_ratelimit import (
+    PRIORITY_BATCH,
+    RateLimitedChatCompletionClient,
+    RateLimitScheduler,
+    with_priority,
+)
+from backend.core.llm_resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResiliencePolicy,
+    ResilientChatCompletionClient,
+    for_stage,
+    is_retryable,
+)
+
+MESSAGES = [UserMessage(content="登录功能需求", source="user")]
+FAST = ResiliencePolicy(max_retries=2, backoff=0.01)
+
+
+class StatusError(Exception):
+    """模拟 openai.APIStatusError"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class ScriptedClient(ReplayChatCompletionClient):
+    """按脚本依次失败、延迟或正常输出的流式客户端"""
+
+    def __init__(self, script):
+        super().__init__(["a b c"] * len(script))
+        self.script = list(script)
+        self.calls = 0
+
+    async def create_stream(self, *args, **kwargs):
+        self.calls += 1
+        step = self.script.pop(0)
+        if isinstance(step, BaseException):
+            raise step
+        await asyncio.sleep(step)
+        async for item in super().create_stream(*args, **kwargs):
+            yield item
+
+
+async def _collect(client):
+    return [item async for item in client.create_stream(MESSAGES)]
+
+
+def test_retryable_errors():
+    """连接错误、429 和 5xx 重试，其它 4xx 不重试"""
+    assert is_retryable(ConnectionResetError())
+    assert is_retryable(StatusError(503))
+    assert is_retryable(StatusError(429))
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError("bad"))
+    assert not is_retryable(asyncio.CancelledError())
+
+
+async def test_retries_transient_errors_before_first_token():
+    """首个流式块之前的 5xx 和连接错误重试后成功，调用方只看到一次输出"""
+    inner = ScriptedClient([StatusError(502), ConnectionResetError(), 0])
+    client = ResilientChatCompletionClient(
+        inner, CircuitBreaker("retry"), {"default": FAST}
+    )
+
+    items = await _collect(client)
+
+    assert inner.calls == 3
+    assert isinstance(items[-1], CreateResult)
+    assert "".join(items[:-1]) == items[-1].content
+    assert client.get_stats()["stages"]["default"]["retries"] == 2
+    assert client.breaker.state == "closed"
+
+    with pytest.raises(StatusError):
+        await _collect(
+            ResilientChatCompletionClient(
+                ScriptedClient([StatusError(400)]),
+                CircuitBreaker("client-error"),
+                {"default": FAST},
+            )
+        )
+
+
+async def test_circuit_opens_and_recovers():
+    """连续失败后熔断直接拒绝，冷却后试探调用成功则关闭"""
+    breaker = CircuitBreaker("circuit", failure_threshold=2, reset_timeout=0.1)
+    inner = ScriptedClient([StatusError(500), StatusError(500), 0])
+    client = ResilientChatCompletionClient(
+        inner, breaker, {"default": ResiliencePolicy(max_retries=5, backoff=0)}
+    )
+
+    with pytest.raises(StatusError):
+        await _collect(client)
+    assert breaker.state == "open"
+    assert inner.calls == 2
+
+    with pytest.raises(CircuitOpenError):
+        await _collect(client)
+    assert inner.calls == 2
+
+    await asyncio.sleep(0.15)
+    await _collect(client)
+    assert breaker.state == "closed"
+    assert breaker.get_stats()["rejected"] == 1
+
+
+async def test_rate_limit_does_not_open_circuit():
+    """429 不计入熔断；内部有出站限流时 429 交给限流层处理，这里不再重试"""
+    breaker = CircuitBreaker("rate-limit", failure_threshold=2, reset_timeout=30)
+    inner = ScriptedClient([StatusError(429), StatusError(429), StatusError(429), 0])
+    client = ResilientChatCompletionClient(
+        inner, breaker, {"default": ResiliencePolicy(max_retries=3, backoff=0)}
+    )
+
+    items = await _collect(client)
+    assert isinstance(items[-1], CreateResult)
+    assert inner.calls == 4
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+
+    inner = ScriptedClient([StatusError(429), 0])
+    limited = ResilientChatCompletionClient(
+        inner,
+        breaker,
+        {"default": ResiliencePolicy(max_retries=3, backoff=0)},
+        retry_rate_limited=False,
+    )
+    with pytest.raises(StatusError):
+        await _collect(for_stage(limited, "chat"))
+    assert inner.calls == 1
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+
+
+async def test_hedges_slow_first_token():
+    """首 token 超过阈值时发出对冲请求，先输出的请求胜出"""
+    policy = ResiliencePolicy(
+        hedge_percentile=95, hedge_min_samples=1, hedge_min_delay=0.05
+    )
+    inner = ScriptedClient([0, 1.0, 0])
+    client = ResilientChatCompletionClient(
+        inner, CircuitBreaker("hedge"), {"testcase_generation": policy}
+    ).with_stage("testcase_generation")
+
+    # 第一次调用积累首 token 样本
+    await _collect(client)
+    started = asyncio.get_running_loop().time()
+    items = await _collect(client)
+
+    assert asyncio.get_running_loop().time() - started < 0.5
+    assert inner.calls == 3
+    assert isinstance(items[-1], CreateResult)
+    stats = client.get_stats()["stages"]["testcase_generation"]
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+async def test_stage_and_priority_views_compose():
+    """阶段视图和优先级视图可以叠加，同样的组合总是同一个实例"""
+    limited = RateLimitedChatCompletionClient(
+        ReplayChatCompletionClient(["x"]), RateLimitScheduler("compose")
+    )
+    policies = {"chat": ResiliencePolicy(max_retries=5)}
+    client = ResilientChatCompletionClient(limited, CircuitBreaker("compose"), policies)
+
+    view = with_priority(for_stage(client, "chat"), PRIORITY_BATCH)
+    assert view is with_priority(for_stage(client, "chat"), PRIORITY_BATCH)
+    assert view.stage == "chat"
+    assert view.policy.max_retries == 5
+    assert view.inner.priority == PRIORITY_BATCH
+    assert for_stage(client, "chat").inner is limited
+    assert for_stage(client, "other").policy == ResiliencePolicy()
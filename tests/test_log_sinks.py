@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+队列化日志文件输出测试
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.exceptions import ConfigurationError
+from backend.core.log_sinks import QueuedFileSink, parse_duration, parse_size
+
+
+def test_parse_rotation_and_retention():
+    """解析轮转大小和保留时间配置"""
+    assert parse_size("10 MB") == 10 * 1024 * 1024
+    assert parse_size("512 KB") == 512 * 1024
+    assert parse_duration("7 days") == 7 * 86400
+    assert parse_duration("1 week") == 7 * 86400
+    with pytest.raises(ConfigurationError):
+        parse_size("很多")
+
+
+def test_write_rotate_and_compress(tmp_path):
+    """写线程写入文件，超过大小后轮转并压缩"""
+    sink = QueuedFileSink(str(tmp_path / "app.log"), rotation=200, compression="zip")
+    for i in range(50):
+        sink.write(f"第{i}条日志记录\n")
+    sink.stop()
+
+    stats = sink.get_stats()
+    assert stats["written"] == 50
+    assert stats["dropped"] == 0
+    assert stats["rotations"] >= 1
+    assert stats["compressed"] == stats["rotations"]
+    assert list(tmp_path.glob("app.*.log.zip"))
+    assert not list(tmp_path.glob("app.*.log"))
+
+
+def test_drop_policy_counts_overflow(tmp_path):
+    """写线程阻塞、队列满时按 drop 策略丢弃并计数"""
+    sink = QueuedFileSink(str(tmp_path / "app.log"), max_queue=1, overflow="drop")
+    gate = threading.Event()
+    write_batch = sink._write_batch
+    sink._write_batch = lambda batch: (gate.wait(), write_batch(batch))
+
+    for i in range(10):
+        sink.write(f"{i}\n")
+    gate.set()
+    sink.stop()
+
+    stats = sink.get_stats()
+    assert stats["written"] + stats["dropped"] == 10
+    assert stats["dropped"] >= 8
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+热路径日志工具测试
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.logger import LoggerConfig, truncate
+
+
+def test_truncate_is_applied_when_formatted():
+    """超过长度限制的内容在格式化时被截断"""
+    assert str(truncate("短内容", 10)) == "短内容"
+    assert f"{truncate('a' * 20, 5)}" == "aaaaa...(共20字符)"
+    assert str(truncate("abc", 0)) == "abc"
+    assert str(truncate(None, 5)) == ""
+
+
+def test_sampling_per_site():
+    """每个日志点独立计数，按间隔采样"""
+    config = LoggerConfig()
+    config.sample_every = 3
+
+    sampled = [config.should_sample("a") for _ in range(7)]
+    assert sampled == [True, False, False, True, False, False, True]
+    assert config.should_sample("b") is True
+    assert config.should_sample("a", every=1) is True
+    assert config.get_sample_counts() == {"a": 7, "b": 1}
+
+
+def test_level_filter():
+    """低于配置级别的日志不输出"""
+    config = LoggerConfig()
+    config.min_level_no = 20
+    assert not config.is_enabled("DEBUG")
+    assert config.is_enabled("INFO")
+    assert config.is_enabled("ERROR")
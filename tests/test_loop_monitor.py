@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+事件循环延迟监控测试
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.loop_monitor import LoopLagMonitor
+
+
+def _blocking_work(seconds):
+    time.sleep(seconds)
+
+
+async def test_stall_captures_loop_stack():
+    """事件循环被阻塞时记录延迟并抓取阻塞位置的调用栈"""
+    monitor = LoopLagMonitor(interval=0.01, stall_threshold=0.05)
+    monitor.start()
+    await asyncio.sleep(0.05)
+
+    _blocking_work(0.2)
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    stats = monitor.get_stats()
+    assert stats["samples"] > 0
+    assert stats["max_lag"] >= 0.15
+    assert stats["stalls"] == 1
+    assert "_blocking_work" in stats["last_stall"]["stack"]
+
+
+def test_shed_only_when_lag_stays_above_slo():
+    """最近的心跳延迟都超过 SLO 时才拒绝请求"""
+    monitor = LoopLagMonitor(slo=0.1, window=3, shed=True)
+    monitor.record(0.5)
+    monitor.record(0.5)
+    monitor.check("/api/chat/stream")
+
+    monitor.record(0.5)
+    with pytest.raises(HTTPException) as exc_info:
+        monitor.check("/api/chat/stream")
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "5"
+
+    monitor.record(0.01)
+    monitor.check("/api/chat/stream")
+    assert monitor.shed_count == 1
+
+
+def test_no_shedding_when_disabled():
+    """未开启过载拒绝时只记录不拒绝"""
+    monitor = LoopLagMonitor(slo=0.1, window=1, shed=False)
+    monitor.record(1.0)
+    assert monitor.overloaded
+    monitor.check("/api/chat/stream")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+进程内指标测试
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.metrics import (
+    LLMStreamObserver,
+    MetricsRegistry,
+    llm_stream_chunks_total,
+    llm_time_to_first_token_seconds,
+)
+
+
+def test_render_prometheus_text():
+    """计数器、直方图和采集函数按 Prometheus 文本格式输出"""
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "请求数", ("route",))
+    latency = registry.histogram("latency_seconds", "耗时", buckets=(0.1, 1))
+    registry.register_collector("queue_depth", "队列长度", lambda: [({"q": "a"}, 3)])
+
+    requests.inc(route="/a")
+    requests.inc(2, route="/a")
+    latency.observe(0.1)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+    assert 'queue_depth{q="a"} 3' in text
+
+
+def test_label_values_are_escaped():
+    """标签值中的引号和换行被转义"""
+    registry = MetricsRegistry()
+    registry.counter("c_total", "计数", ("v",)).inc(v='a"b\nc')
+    assert 'c_total{v="a\\"b\\nc"} 1' in registry.render()
+
+
+def test_llm_stream_observer():
+    """首个流式块记录首 token 耗时，结束时累计流式块数"""
+    before_ttft = llm_time_to_first_token_seconds.get_count(source="test_stage")
+    before_chunks = llm_stream_chunks_total.get(source="test_stage")
+
+    observer = LLMStreamObserver("test_stage")
+    for _ in range(3):
+        observer.on_chunk()
+    observer.finish()
+
+    assert (
+        llm_time_to_first_token_seconds.get_count(source="test_stage")
+        == before_ttft + 1
+    )
+    assert llm_stream_chunks_total.get(source="test_stage") == before_chunks + 3
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+运行时性能剖析测试
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.profiler import SamplingProfiler, approx_size, render_folded
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def test_cpu_profile_samples_event_loop_thread():
+    """CPU 采样能抓到事件循环线程中执行的函数，并输出折叠栈"""
+    profiler = SamplingProfiler()
+
+    async def spin():
+        await asyncio.sleep(0.01)
+        _busy(0.2)
+
+    result, _ = await asyncio.gather(profiler.profile(0.3, 0.005), spin())
+    folded = render_folded(result["stacks"])
+
+    assert result["samples"] > 0
+    assert "_busy (tests/test_profiler.py:" in folded
+    line = folded.splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+
+async def test_memory_snapshot_reports_allocations():
+    """内存快照统计追踪期间的分配"""
+    profiler = SamplingProfiler()
+    holder = []
+
+    async def allocate():
+        await asyncio.sleep(0.01)
+        holder.append([str(i) * 10 for i in range(20000)])
+
+    result, _ = await asyncio.gather(
+        profiler.memory_snapshot(duration=0.05, top=5), allocate()
+    )
+
+    assert result["traced_bytes"] > 0
+    assert len(result["top"]) <= 5
+    assert any("test_profiler.py" in stack for stack in result["stacks"])
+
+
+def test_approx_size_counts_shared_objects_once():
+    """共享对象在同一次统计中只计算一次"""
+    shared = "x" * 10000
+    seen = set()
+    first = approx_size({"a": shared}, seen)
+    second = approx_size({"b": shared}, seen)
+
+    assert first > 10000
+    assert second < 1000
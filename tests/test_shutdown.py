@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+优雅停机测试
+"""
+
+import asyncio
+import signal
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.shutdown import StreamDrainer
+
+
+async def _ticker(state, count=None, interval=0.01):
+    """按固定间隔输出的流，记录是否被关闭"""
+    index = 0
+    try:
+        while count is None or index < count:
+            await asyncio.sleep(interval)
+            yield index
+            index += 1
+    finally:
+        state["closed"] = True
+
+
+async def _consume(stream):
+    return [item async for item in stream]
+
+
+async def test_guard_passes_items_through():
+    """未停机时包装不改变输出"""
+    drainer = StreamDrainer()
+    state = {}
+    items = await _consume(drainer.guard("chat", "c1", _ticker(state, count=3)))
+
+    assert items == [0, 1, 2]
+    assert drainer.active_count == 0
+    assert drainer.get_stats()["interrupted"] == 0
+
+
+async def test_drain_waits_for_active_stream():
+    """排空期间进行中的流继续输出直到正常完成"""
+    drainer = StreamDrainer(drain_timeout=5, poll_interval=0.01)
+    consumer = asyncio.create_task(
+        _consume(drainer.guard("chat", "c1", _ticker({}, count=20)))
+    )
+    await asyncio.sleep(0.03)
+    assert drainer.active_count == 1
+
+    drainer.begin_drain()
+    with pytest.raises(HTTPException) as exc_info:
+        drainer.check("/api/chat/stream")
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "5"
+
+    await drainer.shutdown()
+    assert await consumer == list(range(20))
+    stats = drainer.get_stats()
+    assert stats["finished_while_draining"] == 1
+    assert stats["expired"] is False
+    assert stats["rejected"] == 1
+
+
+async def test_drain_timeout_interrupts_stream():
+    """排空超时后流在下一次输出后结束，原始生成器被关闭"""
+    drainer = StreamDrainer(drain_timeout=0.1, poll_interval=0.01)
+    state = {}
+    consumer = asyncio.create_task(
+        _consume(drainer.guard("testcase_generate", "c1", _ticker(state)))
+    )
+    await asyncio.sleep(0.03)
+
+    drainer.begin_drain()
+    await drainer.shutdown()
+    items = await asyncio.wait_for(consumer, 1)
+
+    assert items
+    assert state["closed"] is True
+    stats = drainer.get_stats()
+    assert stats["expired"] is True
+    assert stats["interrupted"] == 1
+    assert stats["active"] == []
+
+
+async def test_signal_starts_drain_and_keeps_server_handler():
+    """退出信号先触发排空，再交给服务器原有的处理函数"""
+    received = []
+    original_term = signal.signal(signal.SIGTERM, lambda *args: received.append(1))
+    original_int = signal.getsignal(signal.SIGINT)
+    try:
+        drainer = StreamDrainer(poll_interval=0.01)
+        drainer.start()
+        signal.raise_signal(signal.SIGTERM)
+        await asyncio.sleep(0.05)
+
+        assert received == [1]
+        assert drainer.draining is True
+        await drainer.shutdown()
+    finally:
+        signal.signal(signal.SIGTERM, original_term)
+        signal.signal(signal.SIGINT, original_int)
+
+
+async def test_cleanup_all_checkpoints_unfinished_conversations():
+    """停机清理时保存未完成对话的进度，已最终化的对话不保存"""
+    from tortoise import Tortoise
+
+    from backend.models.testcase import TestCaseConversation
+    from backend.services.conversation_memory import ConversationMemory
+    from backend.services.testcase_service import TestCaseGenerationRuntime
+
+    await Tortoise.init(
+        db_url="sqlite://:memory:",
+        modules={"models": ["backend.models.testcase"]},
+    )
+    await Tortoise.generate_schemas()
+    try:
+        runtime = TestCaseGenerationRuntime()
+        for conversation_id, stage in (
+            ("unfinished", "testcase_generated"),
+            ("finished", "completed"),
+        ):
+            memory = ConversationMemory(conversation_id)
+            memory.add({"type": "user_input", "content": "登录功能", "round_number": 1})
+            memory.add(
+                {
+                    "type": "requirement_analysis",
+                    "content": "分析结果",
+                    "round_number": 1,
+                }
+            )
+            memory.add(
+                {"type": "testcase_generation", "content": ["用例1"], "round_number": 1}
+            )
+            runtime.memories[conversation_id] = memory
+            runtime.conversation_states[conversation_id] = {
+                "stage": stage,
+                "round_number": 1,
+            }
+            runtime.collected_messages[conversation_id] = object()
+
+        await runtime.cleanup_all()
+
+        assert not runtime.memories
+        assert not runtime.collected_messages
+        records = await TestCaseConversation.all()
+        assert len(records) == 1
+        record = records[0]
+        assert record.conversation_id == "unfinished"
+        assert record.status == "interrupted"
+        assert record.text_content == "登录功能"
+        assert record.requirement_analysis == "分析结果"
+        assert record.generated_testcases == '["用例1"]'
+        assert record.final_testcases is None
+    finally:
+        await Tortoise.close_connections()
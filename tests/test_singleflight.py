@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+流式请求去重测试
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.singleflight import StreamSingleFlight, build_dedup_key
+
+
+def test_build_dedup_key():
+    """相同输入得到相同键，不同输入得到不同键"""
+    assert build_dedup_key("需求", "", 1) == build_dedup_key("需求", "", 1)
+    assert build_dedup_key("需求", "", 1) != build_dedup_key("需求", "", 2)
+    assert build_dedup_key("a", "bc") != build_dedup_key("ab", "c")
+
+
+async def test_concurrent_streams_share_one_run():
+    """并发的相同请求只执行一次底层流"""
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        for i in range(5):
+            await asyncio.sleep(0.01)
+            yield {"index": i}
+
+    flight = StreamSingleFlight("test")
+
+    async def consume():
+        return [event["index"] async for event in flight.stream("k", "c", factory)]
+
+    results = await asyncio.gather(consume(), consume(), consume())
+
+    assert calls == 1
+    assert results == [[0, 1, 2, 3, 4]] * 3
+    assert flight.get_stats() == {"inflight": 0, "leaders": 1, "followers": 2}
+
+
+async def test_finished_stream_is_not_reused():
+    """任务结束后相同请求会重新执行"""
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        yield {"index": 0}
+
+    flight = StreamSingleFlight("test")
+    for _ in range(2):
+        assert [e async for e in flight.stream("k", "c", factory)] == [{"index": 0}]
+
+    assert calls == 2
+
+
+async def test_follower_events_use_own_conversation_id():
+    """挂载的请求收到的事件带自己的对话ID，首个请求保持原样"""
+
+    async def factory():
+        await asyncio.sleep(0.01)
+        yield {"index": 0, "conversation_id": "owner"}
+        raise RuntimeError("模型错误")
+
+    flight = StreamSingleFlight("test")
+
+    async def consume(conversation_id):
+        return [e async for e in flight.stream("k", conversation_id, factory)]
+
+    owner, follower = await asyncio.gather(consume("owner"), consume("follower"))
+
+    assert [e["conversation_id"] for e in owner] == ["owner", "owner"]
+    assert [e["conversation_id"] for e in follower] == ["follower", "follower"]
+    assert follower[-1]["type"] == "error"
+
+
+async def test_follower_gets_own_conversation(monkeypatch):
+    """挂载的请求在共享输出结束后拥有独立对话，清除它不影响原始对话；不同用户的请求不合并"""
+    import backend.services.testcase_service as testcase_module
+    from backend.services.conversation_memory import ConversationMemory
+    from backend.services.conversation_store import MemoryConversationStore
+
+    runtime = testcase_module.TestCaseGenerationRuntime(store=MemoryConversationStore())
+    calls = []
+
+    async def fake_generation(requirement):
+        conversation_id = requirement.conversation_id
+        calls.append(conversation_id)
+        runtime.memories[conversation_id] = ConversationMemory(conversation_id)
+        await runtime._save_to_memory(
+            conversation_id,
+            {"type": "user_input", "content": "登录功能", "round_number": 1},
+        )
+        await runtime.update_conversation_state(
+            conversation_id, {"stage": "testcase_generated"}, replace=True
+        )
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield {"index": i}
+
+    monkeypatch.setattr(runtime, "start_streaming_generation", fake_generation)
+    monkeypatch.setattr(testcase_module, "testcase_runtime", runtime)
+    service = testcase_module.TestCaseService()
+    monkeypatch.setattr(service, "workers", None)
+
+    async def consume(conversation_id, user_id=1):
+        requirement = testcase_module.RequirementMessage(
+            text_content="登录功能", conversation_id=conversation_id, user_id=user_id
+        )
+        return [e async for e in service.start_streaming_generation(requirement)]
+
+    owner = asyncio.create_task(consume("owner"))
+    await asyncio.sleep(0)
+    follower, other_user = await asyncio.gather(
+        consume("follower"), consume("other", user_id=2)
+    )
+    assert await owner == follower == other_user
+    assert calls == ["owner", "other"]
+
+    # 别名已删除，挂载方的对话是原始对话的副本
+    assert runtime.conversation_aliases == {}
+    assert await runtime.ensure_conversation("follower") == "follower"
+    assert runtime.conversation_states["follower"]["stage"] == "testcase_generated"
+    assert len(runtime.memories["follower"]) == 1
+
+    await service.clear_conversation("follower")
+    assert "follower" not in runtime.memories
+    assert await runtime.store.load("testcase", "follower") is None
+    assert runtime.conversation_states["owner"]["stage"] == "testcase_generated"
+    assert len(runtime.memories["owner"]) == 1
+    assert await runtime.store.load("testcase", "owner") is not None
+
+    # 共享输出期间清除挂载方只删除别名
+    await runtime.add_conversation_alias("late", "owner")
+    await service.clear_conversation("late")
+    assert runtime.resolve_conversation_id("late") == "late"
+    assert "owner" in runtime.memories
+
+    await runtime.cleanup_all()
+    await runtime.runtime_pool.close()
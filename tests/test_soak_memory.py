@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+长时间运行的内存泄漏回归测试
+
+用模拟模型连续跑大量对话，定期采样进程内存（RSS）和存活对象数量，
+在淘汰/清理本应回收内存之后，如果每个对话带来的增长超过阈值则失败。
+
+默认跳过，运行方式:
+    SOAK_TEST=1 poetry run pytest tests/test_soak_memory.py -m slow
+
+可调参数（环境变量）:
+    SOAK_CHAT_CONVERSATIONS      聊天对话数量，默认 3000
+    SOAK_TESTCASE_CONVERSATIONS  测试用例生成对话数量，默认 300
+    SOAK_MAX_RSS_KB              每个对话允许的 RSS 增长（KB），默认 2
+    SOAK_MAX_OBJECTS             每个对话允许的存活对象增长，默认 0.5
+"""
+
+import gc
+import os
+import sys
+from collections import deque
+from pathlib import Path
+
+import pytest
+from autogen_ext.models.replay import ReplayChatCompletionClient
+from loguru import logger
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.log_sinks import QueuedFileSink
+from backend.core.logger import log_config, setup_logging
+
+pytestmark = [
+    pytest.mark.slow,
+    pytest.mark.skipif(
+        not os.getenv("SOAK_TEST"), reason="设置 SOAK_TEST=1 运行内存泄漏回归测试"
+    ),
+]
+
+CHAT_CONVERSATIONS = int(os.getenv("SOAK_CHAT_CONVERSATIONS", "3000"))
+TESTCASE_CONVERSATIONS = int(os.getenv("SOAK_TESTCASE_CONVERSATIONS", "300"))
+MAX_RSS_KB = float(os.getenv("SOAK_MAX_RSS_KB", "2"))
+MAX_OBJECTS = float(os.getenv("SOAK_MAX_OBJECTS", "0.5"))
+
+# 预热阶段的对话数量占比，预热结束后才开始计算增长
+WARMUP_RATIO = 0.2
+
+
+def read_rss_kb() -> float:
+    """读取当前进程的常驻内存（KB）"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return float(line.split()[1])
+    return 0.0
+
+
+def count_instances(type_name: str) -> int:
+    return sum(1 for obj in gc.get_objects() if type(obj).__name__ == type_name)
+
+
+class GrowthSampler:
+    """定期采样 RSS 和存活对象数量"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples = []
+
+    def sample(self, conversations: int) -> None:
+        gc.collect()
+        self.samples.append((conversations, read_rss_kb(), len(gc.get_objects())))
+
+    def growth_per_conversation(self):
+        # 只用后一半采样计算增长：分配器和数据库页缓存的预热会趋于平稳，泄漏则持续线性增长
+        start, rss_start, objects_start = self.samples[len(self.samples) // 2]
+        end, rss_end, objects_end = self.samples[-1]
+        conversations = max(end - start, 1)
+        return (
+            (rss_end - rss_start) / conversations,
+            (objects_end - objects_start) / conversations,
+        )
+
+    def check(self) -> None:
+        rss_growth, object_growth = self.growth_per_conversation()
+        report = " | ".join(
+            f"{n}: {rss / 1024:.1f}MB/{objects}" for n, rss, objects in self.samples
+        )
+        print(
+            f"\n[{self.name}] 每个对话 RSS 增长 {rss_growth:.2f}KB，"
+            f"对象增长 {object_growth:.3f} 个\n  采样: {report}"
+        )
+        assert rss_growth <= MAX_RSS_KB, f"{self.name} RSS 增长超过阈值"
+        assert object_growth <= MAX_OBJECTS, f"{self.name} 存活对象增长超过阈值"
+
+
+@pytest.fixture
+def file_only_logging(tmp_path):
+    """日志只写入临时目录的队列化文件输出，避免被 pytest 捕获的控制台输出占用内存"""
+    logger.remove()
+    sinks = [
+        QueuedFileSink(str(tmp_path / "app.log"), rotation="1 MB", retention="1 hour"),
+        QueuedFileSink(
+            str(tmp_path / "error.log"), rotation="1 MB", retention="1 hour"
+        ),
+    ]
+    logger.add(sinks[0], level="INFO")
+    logger.add(sinks[1], level="ERROR")
+    log_config.file_sinks = sinks
+    yield sinks
+    setup_logging()
+
+
+@pytest.fixture
+def bounded_tracer(monkeypatch):
+    """追踪 span 的内存缓冲区使用较小的上限，预热阶段即可填满"""
+    from backend.core.tracing import tracer
+
+    monkeypatch.setattr(tracer.memory, "spans", deque(maxlen=200))
+
+
+async def test_chat_agents_stay_bounded(monkeypatch, file_only_logging):
+    """聊天对话的 Agent 超过上限后被淘汰，内存不随对话数量增长"""
+    import backend.services.autogen_service as autogen_module
+
+    model_client = ReplayChatCompletionClient(["好的 收到"] * (CHAT_CONVERSATIONS + 10))
+    monkeypatch.setattr(autogen_module, "get_openai_model_client", lambda: model_client)
+    service = autogen_module.AutoGenService(
+        max_agents=50, cleanup_interval=0, agent_ttl=3600
+    )
+
+    sampler = GrowthSampler("chat")
+    warmup = int(CHAT_CONVERSATIONS * WARMUP_RATIO)
+    for index in range(CHAT_CONVERSATIONS):
+        async for _ in service.chat_stream(
+            f"问题 {index}", conversation_id=f"soak-chat-{index}", use_cache=False
+        ):
+            pass
+        if index + 1 >= warmup and (index + 1 - warmup) % 500 == 0:
+            sampler.sample(index + 1)
+    sampler.sample(CHAT_CONVERSATIONS)
+
+    assert len(service.agents) <= service.max_agents
+    assert count_instances("AssistantAgent") <= service.max_agents + 1
+    sampler.check()
+
+    for stats in log_config.get_sink_stats():
+        assert stats["queued"] < 1000
+        assert stats["errors"] == 0
+
+
+async def test_testcase_runtimes_reclaimed(
+    monkeypatch, file_only_logging, bounded_tracer
+):
+    """测试用例生成对话清理后运行时、消息和记忆都被回收"""
+    from tortoise import Tortoise
+
+    import backend.services.testcase_service as testcase_module
+    from backend.services.stage_cache import stage_cache
+
+    await Tortoise.init(
+        db_url="sqlite://:memory:",
+        modules={"models": ["backend.models.testcase", "backend.models.user"]},
+    )
+    await Tortoise.generate_schemas()
+    # 与生产环境一致，所有对话共用同一个模型客户端（智能体池按客户端区分）
+    model_client = ReplayChatCompletionClient(
+        ["分析 用例 结果"] * (TESTCASE_CONVERSATIONS * 10)
+    )
+    monkeypatch.setattr(
+        testcase_module, "get_openai_model_client", lambda: model_client
+    )
+    monkeypatch.setattr(testcase_module, "validate_model_client", lambda: True)
+    monkeypatch.setattr(stage_cache, "enabled", False)
+    service = testcase_module.testcase_service
+    runtime = testcase_module.testcase_runtime
+
+    sampler = GrowthSampler("testcase")
+    warmup = int(TESTCASE_CONVERSATIONS * WARMUP_RATIO)
+    try:
+        for index in range(TESTCASE_CONVERSATIONS):
+            conversation_id = f"soak-testcase-{index}"
+            requirement = testcase_module.RequirementMessage(
+                text_content=f"登录功能需求 {index}", conversation_id=conversation_id
+            )
+            async for _ in service.start_streaming_generation(requirement):
+                pass
+            await service.clear_conversation(conversation_id)
+            if index + 1 >= warmup and (index + 1 - warmup) % 50 == 0:
+                sampler.sample(index + 1)
+        sampler.sample(TESTCASE_CONVERSATIONS)
+
+        for store in (
+            runtime.runtimes,
+            runtime.memories,
+            runtime.collected_messages,
+            runtime.conversation_states,
+            runtime.streaming_messages,
+            runtime.agent_streams,
+            runtime.conversation_aliases,
+        ):
+            assert not store
+        # 只允许预热池中的运行时存活
+        live_runtimes = count_instances("SingleThreadedAgentRuntime")
+        assert live_runtimes <= runtime.runtime_pool.size + 1
+        assert count_instances("ConversationEventLog") == 0
+        sampler.check()
+    finally:
+        await runtime.runtime_pool.close()
+        await Tortoise.close_connections()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+阶段结果缓存测试
+"""
+
+import asyncio
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from autogen_ext.models.replay import ReplayChatCompletionClient
+from tortoise import timezone
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.models.testcase import TestCaseStageCache
+from backend.services.agent_pool import AssistantAgentPool
+from backend.services.stage_cache import StageResultCache
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """把进程时区设为 UTC+8，暴露本地时间与 UTC 混用的问题"""
+    monkeypatch.setenv("TZ", "Asia/Shanghai")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+async def test_hit_and_miss(database):
+    """相同阶段、模型、提示词和输入命中缓存，任一部分不同则未命中"""
+    cache = StageResultCache(enabled=True)
+    key = cache.make_key("testcase_generation", "m", "提示词", "需求")
+    assert key == cache.make_key("testcase_generation", "m", " 提示词\n", "需求")
+    assert key != cache.make_key("testcase_generation", "other", "提示词", "需求")
+
+    assert await cache.get(key) is None
+    await cache.set(key, "testcase_generation", "m", "用例")
+    assert await cache.get(key) == "用例"
+    assert await cache.get(key) == "用例"
+
+    entry = await TestCaseStageCache.get(cache_key=key)
+    assert entry.hit_count == 2
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["writes"]) == (2, 1, 1)
+
+
+async def test_evicts_least_recently_used(database):
+    """超过最大条数时淘汰最久未访问的缓存"""
+    cache = StageResultCache(enabled=True, max_entries=2)
+    for key in ("a", "b"):
+        await cache.set(key, "stage", "m", key)
+        await asyncio.sleep(0.01)
+    assert await cache.get("a") == "a"
+    await asyncio.sleep(0.01)
+    await cache.set("c", "stage", "m", "c")
+
+    keys = await TestCaseStageCache.all().values_list("cache_key", flat=True)
+    assert sorted(keys) == ["a", "c"]
+    assert cache.get_stats()["evictions"] == 1
+
+
+async def test_ttl_expiry(database, local_timezone):
+    """超过有效期的缓存按未命中处理并删除，本地时区不影响有效期判断"""
+    cache = StageResultCache(enabled=True, ttl=3600)
+    await cache.set("fresh", "stage", "m", "新")
+    await cache.set("stale", "stage", "m", "旧")
+    await TestCaseStageCache.filter(cache_key="stale").update(
+        created_at=timezone.now() - timedelta(seconds=3601)
+    )
+
+    assert await cache.get("fresh") == "新"
+    assert await cache.get("stale") is None
+    assert await TestCaseStageCache.filter(cache_key="stale").count() == 0
+
+    # 写入时也会清理过期缓存
+    await TestCaseStageCache.filter(cache_key="fresh").update(
+        created_at=timezone.now() - timedelta(seconds=3601)
+    )
+    await cache.set("other", "stage", "m", "其他")
+    assert await TestCaseStageCache.all().values_list("cache_key", flat=True) == [
+        "other"
+    ]
+
+
+async def test_stage_stream_uses_and_bypasses_cache(monkeypatch, database):
+    """命中缓存时不调用模型；跳过缓存时既不查询也不写入"""
+    import backend.services.testcase_service as testcase_module
+
+    cache = StageResultCache(enabled=True)
+    monkeypatch.setattr(testcase_module, "stage_cache", cache)
+    published = []
+
+    async def publish_message(message, topic_id):
+        published.append(message.content)
+
+    agent = SimpleNamespace(
+        id=SimpleNamespace(key="default"), publish_message=publish_message
+    )
+    model_client = ReplayChatCompletionClient(["第一次", "第二次"])
+    pool = AssistantAgentPool("tester", model_client, "提示词")
+
+    async def run(use_cache):
+        return await testcase_module.run_stage_stream(
+            agent,
+            "testcase_generation",
+            "测试",
+            pool,
+            "提示词",
+            "需求",
+            "c1",
+            use_cache,
+        )
+
+    assert await run(True) == "第一次"
+    assert await run(True) == "第一次"
+    assert published[-1] == "第一次"
+    assert cache.get_stats()["hits"] == 1
+
+    assert await run(False) == "第二次"
+    assert cache.get_stats()["hits"] == 1
+    assert await TestCaseStageCache.all().count() == 1
+
+
+def test_clear_and_runtime_stats_require_superuser():
+    """清空缓存和运行时统计接口只允许超级用户访问"""
+    from fastapi.testclient import TestClient
+
+    from backend import app
+    from backend.core.deps import get_current_user
+
+    client = TestClient(app)
+    assert client.delete("/api/testcase/cache").status_code == 401
+    assert client.get("/api/testcase/runtime/stats").status_code == 401
+
+    user = SimpleNamespace(id=1, is_active=True, is_superuser=False)
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        assert client.delete("/api/testcase/cache").status_code == 403
+        assert client.get("/api/testcase/runtime/stats").status_code == 403
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+流水线分阶段模型配置测试
+"""
+
+import sys
+from pathlib import Path
+
+from autogen_core import AgentId
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import backend.core.llm as llm_module
+from backend.conf.config import settings
+from backend.core.metrics import llm_stage_duration_seconds, llm_stage_tokens_total
+
+
+def _raw_client(client):
+    while hasattr(client, "inner"):
+        client = client.inner
+    return client
+
+
+def test_stage_model_client_from_config(monkeypatch):
+    """aimodel.stages 中配置的阶段使用单独的模型和调用参数，同样的配置复用同一个客户端"""
+    monkeypatch.setattr(llm_module, "_stage_clients", {})
+    monkeypatch.setattr(
+        settings.aimodel,
+        "stages",
+        {
+            "testcase_finalization": {
+                "model": "fast-model",
+                "max_tokens": 2048,
+                "temperature": 0,
+            }
+        },
+        raising=False,
+    )
+
+    assert llm_module.get_stage_model_client("testcase_generation") is None
+    assert (
+        llm_module.get_stage_model_name("testcase_generation") == settings.aimodel.model
+    )
+
+    client = llm_module.get_stage_model_client("testcase_finalization")
+    assert client is llm_module.get_stage_model_client("testcase_finalization")
+    assert llm_module.get_stage_model_name("testcase_finalization") == "fast-model"
+    create_args = _raw_client(client)._create_args
+    assert create_args["model"] == "fast-model"
+    assert create_args["max_tokens"] == 2048
+    assert create_args["temperature"] == 0
+
+
+async def test_agents_registered_with_stage_clients(monkeypatch):
+    """注册智能体时单独配置了模型的阶段使用自己的客户端，其余阶段使用全局客户端"""
+    import backend.services.testcase_service as testcase_module
+
+    default_client = ReplayChatCompletionClient(["默认"])
+    fast_client = ReplayChatCompletionClient(["快速"])
+    monkeypatch.setattr(
+        testcase_module, "get_openai_model_client", lambda: default_client
+    )
+    monkeypatch.setattr(testcase_module, "validate_model_client", lambda: True)
+    monkeypatch.setattr(
+        testcase_module,
+        "get_stage_model_client",
+        lambda stage: (
+            fast_client
+            if stage == testcase_module.testcase_finalization_topic_type
+            else None
+        ),
+    )
+
+    manager = testcase_module.TestCaseGenerationRuntime()
+    slot = await manager._build_runtime()
+    try:
+        finalizer = await slot.runtime.try_get_underlying_agent_instance(
+            AgentId(testcase_module.testcase_finalization_topic_type, "default")
+        )
+        generator = await slot.runtime.try_get_underlying_agent_instance(
+            AgentId(testcase_module.testcase_generation_topic_type, "default")
+        )
+        assert finalizer._model_client is fast_client
+        assert generator._model_client is default_client
+    finally:
+        await manager._dispose_runtime_slot(slot)
+        await manager.runtime_pool.close()
+
+
+def test_observer_records_stage_model_metrics():
+    """指定模型的观察器按阶段和模型记录总耗时和 token 数"""
+    from backend.core.metrics import LLMStreamObserver
+
+    labels = {"source": "stage_x", "model": "fast-model"}
+    before = llm_stage_duration_seconds.get_count(**labels)
+    observer = LLMStreamObserver("stage_x", "fast-model")
+    observer.on_chunk()
+    observer.finish(completion_tokens=7, prompt_tokens=30)
+
+    assert llm_stage_duration_seconds.get_count(**labels) == before + 1
+    assert llm_stage_tokens_total.get(kind="prompt", **labels) >= 30
+    assert llm_stage_tokens_total.get(kind="completion", **labels) >= 7
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+测试用例智能体工作进程测试
+"""
+
+import asyncio
+import os
+import signal
+import sys
+from pathlib import Path
+
+import pytest
+from tortoise import Tortoise
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.services.testcase_workers import TestCaseWorkerPool
+
+# 每次启动工作进程都要重新导入应用模块，耗时较长
+pytestmark = pytest.mark.slow
+
+
+def _use_replay_client():
+    """工作进程初始化：使用回放模型客户端代替真实模型"""
+    from autogen_ext.models.replay import ReplayChatCompletionClient
+
+    import backend.services.testcase_service as testcase_module
+
+    model_client = ReplayChatCompletionClient(["分析 用例 结果"] * 100)
+    testcase_module.get_openai_model_client = lambda: model_client
+    testcase_module.validate_model_client = lambda: True
+
+
+async def test_worker_pool_relays_generation_and_restarts(tmp_path):
+    """生成请求在工作进程中执行并转发流式输出，进程崩溃后自动重启"""
+    db_config = {
+        "connections": {"default": f"sqlite://{tmp_path / 'workers.db'}"},
+        "apps": {
+            "models": {
+                "models": ["backend.models.testcase", "backend.models.user"],
+                "default_connection": "default",
+            }
+        },
+    }
+    await Tortoise.init(config=db_config)
+    await Tortoise.generate_schemas()
+    await Tortoise.close_connections()
+
+    pool = TestCaseWorkerPool(
+        processes=2, db_config=db_config, initializer=_use_replay_client
+    )
+    await pool.start()
+    try:
+        events = [
+            event
+            async for event in pool.stream(
+                "generate",
+                "worker-1",
+                {"conversation_id": "worker-1", "text_content": "登录功能需求"},
+            )
+        ]
+        assert events[-1]["type"] == "task_result"
+        assert all(event["conversation_id"] == "worker-1" for event in events)
+
+        history = await pool.call(
+            "history",
+            "worker-1",
+            {"conversation_id": "worker-1", "entry_type": "user_input"},
+        )
+        assert history[0]["content"] == "登录功能需求"
+
+        # 同一对话固定落到同一个工作进程
+        worker = pool._select("worker-1")
+        stats = await pool.get_stats()
+        assert stats["workers"][worker.index]["runtime"]["active_runtimes"] == 1
+        assert len({item["pid"] for item in stats["workers"]}) == 2
+
+        os.kill(worker.process.pid, signal.SIGKILL)
+        for _ in range(100):
+            if worker.restarts:
+                break
+            await asyncio.sleep(0.05)
+        assert worker.restarts == 1
+        assert (
+            await pool.call("messages", "worker-1", {"conversation_id": "worker-1"})
+            == []
+        )
+    finally:
+        await pool.stop()
+
+    assert not any(item.process.is_alive() for item in pool._workers)
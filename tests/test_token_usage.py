@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+token 用量统计测试
+"""
+
+import sys
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from autogen_core.models import RequestUsage
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.models.testcase import TestCaseStatistics, TokenUsage
+from backend.services.agent_pool import AssistantAgentPool
+from backend.services.usage_service import UsageRecorder
+
+
+async def test_flush_aggregates_and_rolls_up(database):
+    """同一对话、阶段和模型的调用合并为一行，多次写库累加，并计入当天的统计"""
+    recorder = UsageRecorder()
+    recorder.bind_user("c1", 7)
+    recorder.record("c1", "testcase_generation", "m", RequestUsage(100, 20), 1.5)
+    recorder.record("c1", "testcase_generation", "m", RequestUsage(50, 10), 0.5)
+    recorder.record("c2", "chat", "m", None, 0.2)
+
+    assert await recorder.flush() == 2
+    recorder.record("c1", "testcase_generation", "m", RequestUsage(10, 5), 1.0)
+    assert await recorder.flush() == 1
+    assert recorder.pending == 0
+
+    row = await TokenUsage.get(conversation_id="c1", stage="testcase_generation")
+    assert (row.user_id, row.calls, row.prompt_tokens, row.completion_tokens) == (
+        7,
+        3,
+        160,
+        35,
+    )
+    assert row.duration == pytest.approx(3.0)
+    assert (await TokenUsage.get(conversation_id="c2")).user_id is None
+
+    stats = await TestCaseStatistics.get(date=date.today())
+    assert stats.total_llm_calls == 4
+    assert stats.total_prompt_tokens == 160
+    assert stats.total_completion_tokens == 35
+
+
+async def test_query_groups_by_dimension(database):
+    """按阶段、用户分组汇总，按 token 总数排序，并包含尚未写库的用量"""
+    recorder = UsageRecorder()
+    recorder.bind_user("c1", 1)
+    recorder.bind_user("c2", 2)
+    recorder.record("c1", "requirement_analysis", "m", RequestUsage(10, 10), 1)
+    recorder.record("c1", "testcase_generation", "m", RequestUsage(100, 50), 2)
+    recorder.record("c2", "testcase_generation", "m", RequestUsage(40, 10), 2)
+
+    by_stage = await recorder.query(group_by="stage")
+    assert [item["stage"] for item in by_stage] == [
+        "testcase_generation",
+        "requirement_analysis",
+    ]
+    assert by_stage[0]["total_tokens"] == 200
+    assert by_stage[0]["conversations"] == 2
+    assert by_stage[0]["avg_duration"] == 2
+
+    by_user = await recorder.query(group_by="user_id", stage="testcase_generation")
+    assert {item["user_id"]: item["total_tokens"] for item in by_user} == {
+        1: 150,
+        2: 50,
+    }
+    assert await recorder.query(group_by="date", end_date=date(2000, 1, 1)) == []
+
+    with pytest.raises(ValueError):
+        await recorder.query(group_by="prompt")
+
+
+async def test_stage_stream_and_chat_record_usage(monkeypatch):
+    """流水线阶段和聊天结束时按阶段记录用量，命中阶段缓存时不记录"""
+    import backend.services.autogen_service as autogen_module
+    import backend.services.testcase_service as testcase_module
+
+    recorder = UsageRecorder()
+    monkeypatch.setattr(testcase_module, "usage_recorder", recorder)
+    monkeypatch.setattr(autogen_module, "usage_recorder", recorder)
+
+    async def publish_message(message, topic_id):
+        pass
+
+    agent = SimpleNamespace(
+        id=SimpleNamespace(key="default"), publish_message=publish_message
+    )
+    pool = AssistantAgentPool(
+        "tester", ReplayChatCompletionClient(["用例 一 二"]), "提示词"
+    )
+    await testcase_module.run_stage_stream(
+        agent, "testcase_generation", "测试", pool, "提示词", "需求", "c1"
+    )
+
+    model_client = ReplayChatCompletionClient(["回答"])
+    monkeypatch.setattr(autogen_module, "get_openai_model_client", lambda: model_client)
+    service = autogen_module.AutoGenService(store=None)
+    await service.chat("你好", conversation_id="c2", use_cache=False, user_id=3)
+
+    pending = {key[1:3]: entry for key, entry in recorder._pending.items()}
+    generation = pending[("c1", "testcase_generation")]
+    assert generation["calls"] == 1
+    assert generation["completion_tokens"] > 0
+    chat = pending[("c2", "chat")]
+    assert chat["user_id"] == 3
+    assert chat["prompt_tokens"] > 0
+
+
+async def test_usage_query_limited_to_current_user(monkeypatch, database):
+    """普通用户只能查到自己的用量，超级用户可以查询所有用户"""
+    import backend.api.testcase as api_module
+
+    recorder = UsageRecorder()
+    monkeypatch.setattr(api_module, "usage_recorder", recorder)
+    recorder.bind_user("c1", 1)
+    recorder.bind_user("c2", 2)
+    recorder.record("c1", "chat", "m", RequestUsage(10, 10))
+    recorder.record("c2", "chat", "m", RequestUsage(20, 20))
+
+    async def query(current_user, user_id=None):
+        result = await api_module.get_token_usage(
+            group_by="user_id",
+            conversation_id=None,
+            user_id=user_id,
+            stage=None,
+            start_date=None,
+            end_date=None,
+            current_user=current_user,
+        )
+        return {item["user_id"]: item["total_tokens"] for item in result["items"]}
+
+    user = SimpleNamespace(id=1, is_superuser=False)
+    assert await query(user) == {1: 20}
+    assert await query(user, user_id=2) == {1: 20}
+    admin = SimpleNamespace(id=3, is_superuser=True)
+    assert await query(admin) == {1: 20, 2: 40}
+    assert await query(admin, user_id=2) == {2: 40}
+
+
+async def test_interrupted_streams_record_estimated_usage(monkeypatch):
+    """客户端中途断开或阶段中途出错时，按已收到的输出估算并记录用量"""
+    import backend.services.autogen_service as autogen_module
+    import backend.services.testcase_service as testcase_module
+
+    recorder = UsageRecorder()
+    monkeypatch.setattr(testcase_module, "usage_recorder", recorder)
+    monkeypatch.setattr(autogen_module, "usage_recorder", recorder)
+
+    model_client = ReplayChatCompletionClient(["一 二 三 四 五"])
+    monkeypatch.setattr(autogen_module, "get_openai_model_client", lambda: model_client)
+    service = autogen_module.AutoGenService(store=None)
+    stream = service.chat_stream("你好", conversation_id="c1", use_cache=False)
+    assert await stream.__anext__()
+    await stream.aclose()
+
+    async def publish_message(message, topic_id):
+        raise ConnectionResetError("客户端断开")
+
+    agent = SimpleNamespace(
+        id=SimpleNamespace(key="default"), publish_message=publish_message
+    )
+    pool = AssistantAgentPool(
+        "tester", ReplayChatCompletionClient(["用例 一 二"]), "提示词"
+    )
+    with pytest.raises(ConnectionResetError):
+        await testcase_module.run_stage_stream(
+            agent, "testcase_generation", "测试", pool, "提示词", "需求", "c2"
+        )
+
+    pending = {key[1:3]: entry for key, entry in recorder._pending.items()}
+    for key in (("c1", "chat"), ("c2", "testcase_generation")):
+        assert pending[key]["calls"] == 1
+        assert pending[key]["prompt_tokens"] > 0
+        assert pending[key]["completion_tokens"] > 0
+
+
+async def test_include_usage_only_on_streaming_calls():
+    """只在流式调用时要求返回用量，非流式调用不带 stream_options"""
+    from backend.core.llm_wrappers import StreamUsageChatCompletionClient
+
+    class RecordingClient(ReplayChatCompletionClient):
+        def __init__(self):
+            super().__init__(["a", "b", "c"])
+            self.calls = []
+
+        async def create(self, *args, **kwargs):
+            self.calls.append(("create", kwargs))
+            return await super().create(*args)
+
+        async def create_stream(self, *args, **kwargs):
+            self.calls.append(("create_stream", kwargs))
+            async for item in super().create_stream(*args):
+                yield item
+
+    inner = RecordingClient()
+    client = StreamUsageChatCompletionClient(inner)
+    await client.create([])
+    [item async for item in client.create_stream([])]
+    options = {"stream_options": {"include_usage": False}}
+    [item async for item in client.create_stream([], extra_create_args=options)]
+
+    (_, create_kwargs), (_, stream_kwargs), (_, custom_kwargs) = inner.calls
+    assert "include_usage" not in create_kwargs
+    assert "stream_options" not in create_kwargs["extra_create_args"]
+    assert stream_kwargs["include_usage"] is True
+    assert "include_usage" not in custom_kwargs
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+链路追踪测试
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.tracing import Tracer, record_db_time
+
+
+async def test_nested_spans_inherit_conversation_id():
+    """子 span 继承父 span 的对话ID和 trace_id"""
+    tracer = Tracer()
+
+    @tracer.traced("agent.stage", conversation_id=lambda cid: cid)
+    async def handler(cid):
+        with tracer.span("llm.stage") as span:
+            span.set("chunks", 3)
+            record_db_time(0.5)
+            await asyncio.sleep(0)
+
+    await handler("c1")
+    spans = tracer.get_spans("c1")
+
+    assert [span["name"] for span in spans] == ["agent.stage", "llm.stage"]
+    parent, child = spans
+    assert child["parent_id"] == parent["span_id"]
+    assert child["trace_id"] == parent["trace_id"]
+    assert child["attributes"] == {"chunks": 3, "db_seconds": 0.5, "db_queries": 1}
+
+
+async def test_errors_are_recorded():
+    """异常时 span 状态为 error"""
+    tracer = Tracer()
+    with pytest.raises(ValueError):
+        with tracer.span("stage", "c1"):
+            raise ValueError("失败")
+    assert tracer.get_spans("c1")[0]["status"] == "error"
+
+
+async def test_trace_stream_and_summary():
+    """流式输出记录事件数，汇总按名称统计"""
+    tracer = Tracer()
+
+    async def stream():
+        for i in range(3):
+            yield i
+
+    assert [i async for i in tracer.trace_stream("sse", "c1", stream())] == [0, 1, 2]
+    with tracer.span("other", "c2"):
+        pass
+
+    summary = tracer.get_summary("c1")
+    assert summary["span_count"] == 1
+    assert summary["stages"]["sse"]["count"] == 1
+    assert tracer.get_spans("c1")[0]["attributes"]["events"] == 3
+
+
+async def test_disabled_tracer_records_nothing():
+    """关闭追踪时不记录 span"""
+    tracer = Tracer(enabled=False)
+    with tracer.span("stage", "c1") as span:
+        span.set("a", 1)
+    assert tracer.get_spans() == []
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+用户配额测试
+"""
+
+import asyncio
+import sys
+from datetime import date, datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from autogen_core.models import RequestUsage
+from fastapi import HTTPException
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.models.testcase import UserQuotaUsage
+from backend.services.quota_service import (
+    QuotaLimits,
+    QuotaManager,
+    format_duration,
+    next_reset,
+)
+
+
+def test_limits_and_reset_times():
+    """按用户覆盖的配额沿用默认值，重置时间为次日零点和下月一日零点"""
+    limits = QuotaLimits.from_config({"DAILY_TOKENS": 1000, "daily_requests": 10})
+    override = QuotaLimits.from_config({"daily_tokens": 0}, base=limits)
+    assert (override.daily_tokens, override.daily_requests) == (0, 10)
+    assert QuotaLimits().unlimited
+    assert QuotaManager(overrides={1: override}).enabled
+    assert not QuotaManager().enabled
+
+    now = datetime(2026, 12, 31, 23, 30)
+    assert next_reset("daily", now) == datetime(2027, 1, 1)
+    assert next_reset("monthly", now) == datetime(2027, 1, 1)
+    assert next_reset("monthly", datetime(2026, 10, 19, 8)) == datetime(2026, 11, 1)
+    assert format_duration(1800) == "30分钟"
+    assert format_duration(3 * 3600 + 60) == "3小时1分钟"
+
+
+async def test_rejects_with_time_until_reset(database):
+    """超出每日请求数或 token 数后返回 429，并给出距离重置的时间"""
+    manager = QuotaManager(QuotaLimits(daily_requests=2, daily_tokens=500))
+
+    await manager.admit(1, "/test")
+    await manager.admit(1, "/test")
+    with pytest.raises(HTTPException) as exc_info:
+        await manager.admit(1, "/test")
+    exc = exc_info.value
+    assert exc.status_code == 429
+    assert exc.detail["limit"] == "daily_requests"
+    assert exc.detail["used"] == 2
+    retry_after = (next_reset("daily") - datetime.now()).total_seconds()
+    assert abs(int(exc.headers["Retry-After"]) - retry_after) < 5
+    assert "后重置" in exc.detail["message"]
+
+    # 其他用户不受影响，匿名请求直接拒绝
+    await manager.admit(2, "/test")
+    with pytest.raises(HTTPException) as exc_info:
+        await manager.admit(None, "/test")
+    assert exc_info.value.status_code == 401
+    with pytest.raises(HTTPException):
+        await QuotaManager().admit(None, "/test")
+
+    manager.consume(2, 600)
+    with pytest.raises(HTTPException) as exc_info:
+        await manager.admit(2, "/test")
+    assert exc_info.value.detail["limit"] == "daily_tokens"
+    assert manager.get_stats()["rejected"] == 2
+
+
+async def test_quota_query_limited_to_current_user(monkeypatch, database):
+    """普通用户只能查询自己的配额，超级用户可以查询所有用户"""
+    import backend.api.testcase as api_module
+
+    monkeypatch.setattr(
+        api_module, "quota_manager", QuotaManager(QuotaLimits(daily_requests=5))
+    )
+    user = SimpleNamespace(id=1, is_superuser=False)
+    quota = await api_module.get_user_quota(1, current_user=user)
+    assert quota["quotas"]["daily_requests"]["remaining"] == 5
+    with pytest.raises(HTTPException) as exc_info:
+        await api_module.get_user_quota(2, current_user=user)
+    assert exc_info.value.status_code == 403
+
+    admin = SimpleNamespace(id=3, is_superuser=True)
+    assert (await api_module.get_user_quota(2, current_user=admin))["user_id"] == 2
+
+
+async def test_concurrent_requests_cannot_exceed_quota(database):
+    """同一用户的并发请求逐个计数，放行的请求数不超过配额"""
+    manager = QuotaManager(QuotaLimits(daily_requests=3))
+
+    results = await asyncio.gather(
+        *(manager.admit(1, "/test") for _ in range(10)), return_exceptions=True
+    )
+
+    assert sum(result is None for result in results) == 3
+    assert all(result.status_code == 429 for result in results if result is not None)
+    assert (await manager.get_usage(1))["daily"]["requests"] == 3
+
+
+async def test_periodic_flush_writes_usage(database):
+    """定期写库任务把计数写入数据库，停止时写入剩余计数"""
+    manager = QuotaManager(QuotaLimits(daily_requests=5), flush_interval=0.01)
+    manager.start()
+    await manager.admit(1)
+    await asyncio.sleep(0.05)
+    assert (await UserQuotaUsage.get(user_id=1)).requests == 1
+
+    manager.consume(1, 30)
+    await manager.stop()
+    row = await UserQuotaUsage.get(user_id=1)
+    assert (row.requests, row.tokens) == (1, 30)
+
+
+async def test_usage_shared_through_database(database):
+    """写库后其他进程按数据库中的用量计数，本月之前的用量不计入"""
+    limits = QuotaLimits(monthly_requests=3)
+    first = QuotaManager(limits)
+    await first.admit(1)
+    first.consume(1, 40)
+    assert await first.flush() == 1
+    await UserQuotaUsage.create(user_id=1, date=date(2000, 1, 1), requests=100)
+
+    second = QuotaManager(limits)
+    assert (await second.get_usage(1))["monthly"] == {"requests": 1, "tokens": 40}
+    await second.admit(1)
+    await second.admit(1)
+    with pytest.raises(HTTPException) as exc_info:
+        await second.admit(1)
+    assert exc_info.value.detail["limit"] == "monthly_requests"
+    assert exc_info.value.detail["reset_at"] == next_reset("monthly").isoformat()
+
+    await second.flush()
+    row = await UserQuotaUsage.get(user_id=1, date=date.today())
+    assert (row.requests, row.tokens) == (3, 40)
+    quota = await second.get_quota(1)
+    assert quota["quotas"]["monthly_requests"]["remaining"] == 0
+    assert quota["quotas"]["daily_tokens"]["remaining"] is None
+
+
+async def test_recorded_usage_counts_against_quota(monkeypatch):
+    """用量统计记录的 token 计入对话所属用户的配额"""
+    import backend.services.usage_service as usage_module
+    from backend.services.usage_service import UsageRecorder
+
+    manager = QuotaManager(QuotaLimits(daily_tokens=100))
+    monkeypatch.setattr(usage_module, "quota_manager", manager)
+    recorder = UsageRecorder()
+    recorder.bind_user("c1", 5)
+    recorder.record("c1", "chat", "m", RequestUsage(30, 20))
+    recorder.record("c2", "chat", "m", RequestUsage(30, 20))
+
+    assert manager._pending == {(5, date.today()): {"requests": 0, "tokens": 50}}
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+预热对象池测试
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.core.warm_pool import WarmPool
+
+
+async def test_acquire_hits_prewarmed_items():
+    """预热后取用命中，取走后自动补充"""
+    created = []
+
+    async def factory():
+        created.append(len(created))
+        return len(created)
+
+    pool = WarmPool(factory, size=2, name="test")
+    await pool.start()
+    await asyncio.sleep(0.01)
+    assert pool.ready_count == 2
+
+    await pool.acquire()
+    await asyncio.sleep(0.01)
+    stats = pool.get_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 0
+    assert pool.ready_count == 2
+    assert len(created) == 3
+
+
+async def test_close_disposes_unused_items():
+    """关闭时释放未使用的对象，之后取用不再补充"""
+    disposed = []
+
+    async def factory():
+        return object()
+
+    async def dispose(item):
+        disposed.append(item)
+
+    pool = WarmPool(factory, size=2, dispose=dispose, name="test")
+    await pool.start()
+    await asyncio.sleep(0.01)
+    await pool.close()
+
+    assert len(disposed) == 2
+    assert pool.ready_count == 0
+    await pool.acquire()
+    assert pool.get_stats()["misses"] == 1
+    assert pool.ready_count == 0